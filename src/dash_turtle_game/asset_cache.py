@@ -0,0 +1,136 @@
+"""
+Preprocessed GUI images, cached on disk between runs.
+
+The first run after an asset or a size changes decodes, slices, scales and
+recolors the images as before, then writes them to one raw RGBA atlas file.
+Later runs map the file and wrap each image with `pygame.image.frombuffer`,
+skipping the decoding and transforms.
+
+An atlas file is named after a hash of `CACHE_VERSION`, the source images'
+bytes and the sizes the images were made for, so a changed asset or setting
+bakes a new one. Bump `CACHE_VERSION` when the code making the images changes.
+
+Run with:
+    python -m dash_turtle_game.asset_cache
+"""
+import hashlib
+import json
+import mmap
+import os
+from pathlib import Path
+import struct
+import tempfile
+from typing import Callable, Hashable, Sequence
+
+import pygame
+
+CACHE_VERSION = 1
+MAGIC = b'DTGA'
+# Magic and index length, then the JSON index, then the pixels.
+HEADER = struct.Struct('<4sI')
+
+
+class AssetCache:
+    """Atlases of surfaces by name. Caching is off while `directory` is None."""
+
+    def __init__(self, directory: Path | None = None) -> None:
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, name: str, sources: Sequence[Path], params: Hashable) -> str:
+        digest = hashlib.blake2b(repr((CACHE_VERSION, name, params)).encode(), digest_size=16)
+        for source in sources:
+            digest.update(source.read_bytes())
+        return digest.hexdigest()
+
+    def load(self, name: str, sources: Sequence[Path], params: Hashable,
+             build: Callable[[], dict[str, pygame.Surface]]) -> dict[str, pygame.Surface]:
+        """
+        The surfaces `build` makes from `sources` for `params`, from the atlas
+        if there is one. Needs a display mode set, for `convert_alpha`.
+        """
+        if self.directory is None:
+            return build()
+        path = self.directory / f"{name}-{self.key(name, sources, params)}.rgba"
+        try:
+            surfaces = self._read(path)
+            self.hits += 1
+            return surfaces
+        except (OSError, ValueError, struct.error):
+            pass
+        self.misses += 1
+        surfaces = build()
+        try:
+            self._write(path, surfaces)
+        except OSError as err:
+            print(f"Can't cache {name} images: {err}")
+        return surfaces
+
+    def _read(self, path: Path) -> dict[str, pygame.Surface]:
+        # The surfaces get their own copy of the pixels, so the file is unmapped once they're read.
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, index_len = HEADER.unpack_from(data)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not an atlas")
+            index = json.loads(data[HEADER.size:HEADER.size + index_len])
+            start = HEADER.size + index_len
+            surfaces = {}
+            for name, (width, height, offset) in index.items():
+                image = data[start + offset:start + offset + width * height * 4]
+                surfaces[name] = pygame.image.frombuffer(image, (width, height), 'RGBA').convert_alpha()
+        return surfaces
+
+    def _write(self, path: Path, surfaces: dict[str, pygame.Surface]):
+        index = {}
+        blobs = []
+        offset = 0
+        for name, surface in surfaces.items():
+            blob = pygame.image.tobytes(surface, 'RGBA')
+            index[name] = (surface.get_width(), surface.get_height(), offset)
+            blobs.append(blob)
+            offset += len(blob)
+        index_json = json.dumps(index).encode()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Written to the side and moved into place, so a reader never sees half a file.
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(HEADER.pack(MAGIC, len(index_json)))
+                file.write(index_json)
+                for blob in blobs:
+                    file.write(blob)
+            os.replace(tmp_path, path)
+        except OSError:
+            os.unlink(tmp_path)
+            raise
+
+
+ASSET_CACHE = AssetCache()
+
+
+if __name__ == "__main__":
+    import time
+
+    # The cache the loaders use, not this module's copy run as __main__.
+    from .asset_cache import ASSET_CACHE
+    from .card_gui import load_card_images
+    from .main import SETTINGS
+    from .map import load_map_images
+
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.display.init()
+    pygame.display.set_mode((1, 1))
+    with tempfile.TemporaryDirectory() as directory:
+        # Best of several loads, except the cold one that bakes the atlases.
+        for label, cache_dir, loads in (("No cache", None, 5), ("Cold", Path(directory), 1),
+                                        ("Warm", Path(directory), 5)):
+            ASSET_CACHE.directory = cache_dir
+            times = []
+            for _ in range(loads):
+                start = time.perf_counter()
+                load_map_images(SETTINGS.TILE_SIZE_PIXELS)
+                load_card_images(106, 116)
+                times.append(time.perf_counter() - start)
+            print(f"{label:8}: {min(times) * 1e3:.2f}ms to load the GUI images")
@@ -0,0 +1,147 @@
+"""
+Headless batch runner for card programs.
+
+Runs every program against every map with the simulated bot, spread over a
+process pool, and streams one result per pair to a JSONL or CSV file.
+
+Program files list cards by name, separated by whitespace or commas, with `#`
+starting a comment:
+    RIGHT UP UP  # to the corner
+    RIGHT UP UP UP UP UP
+
+Map files are JSON objects overriding the map settings:
+    {"MAP_SIZE_TILES": [6, 6], "START_TILE": [3, 5], "START_THETA": 90,
+     "GOAL_TILE": [5, 0], "SIM_OBSTACLE_TILES": [[5, 3]]}
+
+Run with:
+    dash-turtle-batch --programs programs/*.txt --maps maps/*.json -o results.jsonl
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import contextlib
+import csv
+from dataclasses import replace
+import io
+import json
+import os
+from pathlib import Path
+import time
+
+from .card_gui import CardType
+from .constants import Settings
+from .sim_game import SIM_SETTINGS, run_game
+
+# Map file keys and how to convert their JSON values.
+MAP_KEYS = {
+    'MAP_SIZE_TILES': tuple,
+    'START_TILE': tuple,
+    'START_THETA': float,
+    'GOAL_TILE': tuple,
+    'SIM_OBSTACLE_TILES': lambda tiles: tuple(tuple(tile) for tile in tiles),
+}
+
+RESULT_FIELDS = [
+    'program', 'map', 'reached_goal', 'steps', 'failure', 'sim_time_sec', 'wall_time_sec',
+]
+
+
+def load_program(path: Path) -> list[CardType]:
+    cards = []
+    for line in path.read_text().splitlines():
+        for name in line.split('#')[0].replace(',', ' ').split():
+            cards.append(CardType[name.upper()])
+    return cards
+
+
+def load_map(path: Path, base: Settings = SIM_SETTINGS) -> Settings:
+    values = json.loads(path.read_text())
+    unknown = set(values) - set(MAP_KEYS)
+    if unknown:
+        raise ValueError(f"{path}: unknown map settings {sorted(unknown)}")
+    return replace(base, **{key: MAP_KEYS[key](value) for key, value in values.items()})
+
+
+def run_pair(program_path: Path, map_path: Path) -> dict:
+    """Run one program on one map, returning a result row."""
+    row = {'program': program_path.name, 'map': map_path.name}
+    try:
+        cards = load_program(program_path)
+        conf = load_map(map_path)
+        # The controller narrates every move, keep that out of the batch output.
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run_game(cards, conf)
+    except Exception as e:
+        row.update(reached_goal=False, steps=0, failure=f"error: {e}", sim_time_sec=0.0, wall_time_sec=0.0)
+        return row
+
+    if result.queue_result is None:
+        failure = 'timeout'
+    elif result.reached_goal:
+        failure = None
+    else:
+        # Completing the queue anywhere but the goal is also a failure.
+        failure = result.queue_result.name.lower()
+    row.update(
+        reached_goal=result.reached_goal,
+        steps=result.steps,
+        failure=failure,
+        sim_time_sec=round(result.sim_time_sec, 3),
+        wall_time_sec=round(result.wall_time_sec, 3),
+    )
+    return row
+
+
+class ResultWriter:
+    """Append result rows to a JSONL or CSV file, picked by its extension."""
+
+    def __init__(self, path: Path) -> None:
+        self._file = open(path, 'w', newline='')
+        self._csv = None
+        if path.suffix.lower() == '.csv':
+            self._csv = csv.DictWriter(self._file, RESULT_FIELDS)
+            self._csv.writeheader()
+
+    def write(self, row: dict):
+        if self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps(row) + '\n')
+        # Results are streamed, so partial runs are still useful.
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def run_batch(programs: list[Path], maps: list[Path], output: Path, workers: int | None = None) -> int:
+    """Run every program on every map. Returns the number of results written."""
+    writer = ResultWriter(output)
+    count = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_pair, program, game_map) for program in programs for game_map in maps]
+            for future in as_completed(futures):
+                writer.write(future.result())
+                count += 1
+    finally:
+        writer.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run card programs against maps with the simulated bot")
+    parser.add_argument('--programs', type=Path, nargs='+', required=True, help='card program files')
+    parser.add_argument('--maps', type=Path, nargs='+', required=True, help='JSON map files')
+    parser.add_argument('-o', '--output', type=Path, default=Path('results.jsonl'),
+                        help='results file, .jsonl or .csv')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = run_batch(args.programs, args.maps, args.output, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"{count} games in {elapsed:.1f}s ({count / elapsed:.1f} games/s) with {args.workers} workers")
+
+
+if __name__ == "__main__":
+    main()
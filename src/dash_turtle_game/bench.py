@@ -0,0 +1,512 @@
+"""
+Headless frame-time benchmark for the map renderer.
+
+Run with:
+    dash-turtle-bench [--sizes 6 16 64 256] [--frames 300]
+"""
+import argparse
+from dataclasses import replace
+import os
+import random
+import threading
+import time
+import tracemalloc
+from typing import Callable
+
+import pygame
+
+from .card_gui import CardQueueWidget, CardType
+from .channels import ChannelSelector
+from .constants import CmdEvent, Settings, TileType, TurtlePose
+from .map import ConnectionState, GameMap
+from .mqtt_client import CARD_TOPIC, CONTROLLER_TOPIC, MQTTCommandClient
+from .map_state import MapStateStore
+from .planner import HEADING_STEPS, CardPlanner, heading_index
+from .render_cache import RENDER_CACHE
+from .stats import format_summary, percentile
+
+BENCH_SETTINGS = Settings(
+    START_TILE=(0, 0),
+    START_THETA=0,
+    GOAL_TILE=(5, 5),
+    MAP_SIZE_TILES=(6, 6),
+    TILE_SIZE_CM=30.48,
+    TILE_SIZE_PIXELS=128,
+    FRONT_DETECTION_THRESHOLD=12,
+    CRASH_DETECTION_THRESHOLD=64,
+    TURN_TIME=4.0,
+    FORWARD_TIME=4.0,
+    TIME_BETWEEN_PRINT_SEC=2.0,
+    MQTT_BROKER_ADDR=None,
+    BOT_CONNECT_TIMEOUT_SEC=10.0,
+    USE_SIM_BOT=True,
+    HEADLESS=True,
+    ASSET_CACHE_DIR=None,
+    ROBOT_NAME_PATH=None,
+)
+
+DEFAULT_SIZES = [6, 16, 64, 256]
+
+
+def map_settings(size: int) -> Settings:
+    """Settings for a synthetic `size` x `size` map, shown through the camera viewport."""
+    return replace(
+        BENCH_SETTINGS,
+        MAP_SIZE_TILES=(size, size),
+        GOAL_TILE=(size - 1, size - 1),
+    )
+
+
+def _simulate_packet(state: MapStateStore, frame: int, conf: Settings):
+    """Apply the same map updates robot_ctrl makes for one sensor packet."""
+    width, height = conf.MAP_SIZE_TILES
+    # Drive along the rows a little bit each frame.
+    dist = frame * 0.02
+    x = dist % width
+    y = (dist // width) % height
+    with state.edit() as map_edit:
+        map_edit.set_all_tiles_unobserved()
+        map_edit.turtle_pose = replace(map_edit.turtle_pose, x=x, y=y + 0.5)
+        map_edit.set_observed_tile(int(x), int(y), TileType.EMPTY)
+
+
+def _post_input_events(frame: int):
+    """Queue the kind of input a player generates while driving."""
+    pygame.event.post(pygame.event.Event(pygame.MOUSEMOTION, pos=(frame % 50, 10), rel=(1, 0), buttons=(0, 0, 0)))
+    if frame % 10 == 0:
+        pygame.event.post(pygame.event.Event(pygame.KEYUP, key=pygame.K_UP, mod=0, unicode='', scancode=0))
+
+
+def _time_frames(frames: int, step: Callable[[int], None]) -> tuple[list[float], list[int]]:
+    """
+    Time `step` for each frame, then run it again under tracemalloc.
+
+    Returns per frame durations and per frame peak bytes allocated.
+    """
+    samples = []
+    for frame in range(frames):
+        start = time.perf_counter()
+        step(frame)
+        samples.append(time.perf_counter() - start)
+
+    allocations = []
+    tracemalloc.start()
+    try:
+        for frame in range(frames, frames * 2):
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            step(frame)
+            allocations.append(tracemalloc.get_traced_memory()[1] - base)
+    finally:
+        tracemalloc.stop()
+    return samples, allocations
+
+
+def _report(name: str, samples: list[float], allocations: list[int]):
+    print(
+        f"  {name:<14}"
+        f" p50={percentile(samples, 50) * 1e3:8.3f}ms"
+        f" p95={percentile(samples, 95) * 1e3:8.3f}ms"
+        f" p99={percentile(samples, 99) * 1e3:8.3f}ms"
+        f" alloc p50={percentile(allocations, 50) / 1024:8.1f}KiB"
+        f" p99={percentile(allocations, 99) / 1024:8.1f}KiB"
+    )
+
+
+def bench_map_size(size: int, frames: int):
+    """Report Draw, CardQueueWidget.draw, and event handling for one map size."""
+    conf = map_settings(size)
+    state = MapStateStore(conf)
+    game_map = GameMap(conf, state)
+    try:
+        # First frame renders every tile.
+        start = time.perf_counter()
+        game_map.Draw()
+        print(f"{size}x{size} map, {game_map.camera.tile_px}px tiles,"
+              f" first frame {(time.perf_counter() - start) * 1e3:.1f}ms")
+
+        def draw_step(frame):
+            _simulate_packet(state, frame, conf)
+            game_map.Draw()
+
+        _report("Draw", *_time_frames(frames, draw_step))
+
+        def event_step(frame):
+            _post_input_events(frame)
+            game_map.Draw()
+            while not game_map.event_queue.empty():
+                game_map.event_queue.get_nowait()
+
+        _report("Draw+events", *_time_frames(frames, event_step))
+
+        widget = CardQueueWidget(0, 0, game_map.map_width, 128)
+        for i in range(20):
+            widget.add_card(list(CardType)[i % len(CardType)])
+        canvas = pygame.Surface(widget.rect.size).convert()
+
+        def widget_step(frame):
+            widget.set_active(frame % len(widget.cards))
+            widget.draw(canvas)
+
+        _report("Card widget", *_time_frames(frames, widget_step))
+    finally:
+        game_map.Stop()
+
+
+def bench_draw(conf: Settings, frames: int, full_redraw: bool) -> list[float]:
+    state = MapStateStore(conf)
+    game_map = GameMap(conf, state)
+    samples = []
+    try:
+        for frame in range(frames):
+            _simulate_packet(state, frame, conf)
+            if full_redraw:
+                game_map.invalidate()
+            start = time.perf_counter()
+            game_map.Draw()
+            samples.append(time.perf_counter() - start)
+    finally:
+        game_map.Stop()
+    return samples
+
+
+def bench_control_wait(conf: Settings, packets: int, lock_during_draw: bool) -> list[float]:
+    """
+    Measure how late the control thread's map updates complete relative to
+    when their sensor packet arrived, while the render thread draws full frames.
+
+    With `lock_during_draw` set, the renderer and the writer share a lock that
+    is held for the whole `Draw`, the way the map used to be guarded.
+    """
+    state = MapStateStore(conf)
+    game_map = GameMap(conf, state)
+    legacy_lock = threading.Lock()
+    latencies = []
+    running = True
+
+    def render():
+        while running:
+            game_map.invalidate()
+            if lock_during_draw:
+                with legacy_lock:
+                    game_map.Draw()
+            else:
+                game_map.Draw()
+            time.sleep(0.001)
+
+    render_thread = threading.Thread(target=render)
+    render_thread.start()
+    try:
+        # Sensor packets arrive every 10ms.
+        arrival = time.perf_counter()
+        for packet in range(packets):
+            arrival += 0.01
+            time.sleep(max(0.0, arrival - time.perf_counter()))
+            if lock_during_draw:
+                with legacy_lock:
+                    _simulate_packet(state, packet, conf)
+            else:
+                _simulate_packet(state, packet, conf)
+            latencies.append(time.perf_counter() - arrival)
+    finally:
+        running = False
+        render_thread.join()
+        game_map.Stop()
+    return latencies
+
+
+def _wait_for(condition: Callable[[], bool], timeout: float = 5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError()
+        time.sleep(0.0002)
+
+
+def bench_input_latency(samples: int, trace_path: str | None = None) -> tuple[list[float], list[float]]:
+    """
+    Run the whole game with the simulated bot and a render thread on the
+    dummy video driver, and time key presses until they take effect.
+
+    Returns the latencies of an arrow key adding a card while idle, and of an
+    arrow key reaching `stage_pose` while connected. The per stage command
+    traces are written to `trace_path` if given.
+    """
+    # Imported here so the renderer benchmarks don't need the controller.
+    from .main import SystemControl
+
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    conf = replace(BENCH_SETTINGS, HEADLESS=False, START_TILE=(2, 2), TURN_TIME=0.2, FORWARD_TIME=0.2,
+                   LATENCY_TRACE_PATH=trace_path)
+    sys_ctrl = SystemControl(conf)
+    main_thread = threading.Thread(target=sys_ctrl.main)
+    main_thread.start()
+
+    def press(key: int):
+        # Land at a random point in the frame and sensor packet cycles.
+        time.sleep(random.uniform(0.0, 0.1))
+        pygame.event.post(pygame.event.Event(pygame.KEYUP, key=key, mod=0, unicode='', scancode=0))
+        return time.perf_counter()
+
+    idle_latency = []
+    try:
+        for _ in range(samples):
+            num_cards = len(sys_ctrl.game_gui.get_snapshot().cards)
+            start = press(pygame.K_LEFT)
+            _wait_for(lambda: len(sys_ctrl.game_gui.get_snapshot().cards) > num_cards)
+            idle_latency.append(time.perf_counter() - start)
+        # Clear the queue so connecting doesn't run it.
+        for _ in range(samples):
+            sys_ctrl.game_gui.window_channel.put_nowait(CmdEvent.DELETE_LAST_QUEUED)
+
+        sys_ctrl.game_gui.window_channel.put_nowait(CmdEvent.TOGGLE_CONNECT)
+        _wait_for(lambda: sys_ctrl.game_gui.get_snapshot().connected_state == ConnectionState.CONNECTED)
+        connected_latency = []
+        for _ in range(samples):
+            bot = sys_ctrl.bot_intr.robot_ctrl
+            _wait_for(bot.is_idle)
+            start = press(pygame.K_LEFT)
+            _wait_for(lambda: bot.last_command_time is not None and bot.last_command_time > start)
+            connected_latency.append(bot.last_command_time - start)
+    finally:
+        sys_ctrl.game_gui.window_channel.put_nowait(CmdEvent.QUIT)
+        main_thread.join()
+    return idle_latency, connected_latency
+
+
+def bench_fleet(num_bots: int, seconds: float, render_process: bool = False) -> tuple[list[float], list[float]]:
+    """
+    Run a fleet of simulated bots with a render thread, or render process, on
+    the dummy video driver, sending each bot a random command whenever it is
+    idle.
+
+    Returns the render thread's frame draw times, and the times from a command
+    being put on a bot's channel to its `stage_pose`.
+    """
+    from .fleet import FleetControl, make_fleet
+
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    size = 16
+    conf = replace(map_settings(size), HEADLESS=False, GOAL_TILE=(size - 1, 0), TURN_TIME=0.5, FORWARD_TIME=0.5,
+                   FLEET=make_fleet([((2 * i, size - 1), 270) for i in range(num_bots)]),
+                   RENDER_PROCESS=render_process)
+    fleet = FleetControl(conf)
+    for bot, bot_conf in zip(fleet.bots, conf.FLEET):
+        # Never connected, commands are put straight on its channel.
+        bot.mqtt_client = MQTTCommandClient("localhost", topic_prefix=f"{bot_conf.name}/")
+    main_thread = threading.Thread(target=fleet.main)
+    main_thread.start()
+
+    rng = random.Random(0)
+    command_latency = []
+    try:
+        fleet.game_gui.window_channel.put_nowait(CmdEvent.TOGGLE_CONNECT)
+        _wait_for(lambda: all(bot.bot_intr is not None and bot.bot_intr.robot_ctrl.sensors is not None
+                              for bot in fleet.bots))
+        fleet.game_gui.frame_times.clear()
+        # Command sent to each bot and when, until it is staged or refused.
+        pending: list[tuple[float, float] | None] = [None] * num_bots
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            for i, bot in enumerate(fleet.bots):
+                sim_bot = bot.bot_intr.robot_ctrl
+                now = time.perf_counter()
+                if pending[i] is not None:
+                    start, deadline = pending[i]
+                    if sim_bot.last_command_time is not None and sim_bot.last_command_time > start:
+                        command_latency.append(sim_bot.last_command_time - start)
+                        pending[i] = None
+                    elif now > deadline:
+                        # Refused, e.g. off the map or into another bot.
+                        pending[i] = None
+                elif sim_bot.is_idle():
+                    cmd = rng.choice([CmdEvent.UP, CmdEvent.UP, CmdEvent.LEFT, CmdEvent.RIGHT])
+                    bot.mqtt_client.channel.put_nowait(cmd, now)
+                    pending[i] = (now, now + 0.5)
+            time.sleep(0.002)
+        frame_times = fleet.game_gui.frame_times.samples()
+    finally:
+        fleet.game_gui.window_channel.put_nowait(CmdEvent.QUIT)
+        main_thread.join()
+    return frame_times, command_latency
+
+
+def _mqtt_messages(count: int) -> list:
+    """A classroom's mix of controller button updates and card taps."""
+    import paho.mqtt.client as mqtt
+
+    button_states = [b'[]', b'["A"]', b'["A", "B"]', b'["B"]', b'["C"]', b'[]', b'["A", "B", "C"]']
+    cards = [b'{"txt": "UP"}', b'{"txt": "LEFT"}', b'{"txt": "RIGHT"}', b'{"txt": "UNKNOWN"}']
+    messages = []
+    for i in range(count):
+        if i % 4 == 3:
+            message = mqtt.MQTTMessage(topic=CARD_TOPIC.encode())
+            message.payload = cards[i % len(cards)]
+        else:
+            message = mqtt.MQTTMessage(topic=CONTROLLER_TOPIC.encode())
+            message.payload = button_states[i % len(button_states)]
+        messages.append(message)
+    return messages
+
+
+def bench_mqtt_ingest(count: int, rate: float | None):
+    """
+    Replay `count` messages through `MQTTCommandClient._on_message` from a
+    stand-in network thread while a controller thread drains the commands.
+
+    With `rate` the messages are paced at that many per second, otherwise
+    they are sent as fast as the callback takes them. Reports callback
+    throughput and the delay from arrival to the controller dequeuing.
+    """
+    client = MQTTCommandClient('localhost')
+    messages = _mqtt_messages(count)
+    delays = []
+    done = threading.Event()
+
+    def consume():
+        selector = ChannelSelector([client.channel])
+        while not done.is_set() or not client.channel.empty():
+            selector.wait(timeout=0.01)
+            now = time.perf_counter()
+            delays.extend(now - stamp for stamp, _ in client.channel.drain_stamped())
+        selector.close()
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    start = time.perf_counter()
+    for i, message in enumerate(messages):
+        if rate is not None:
+            time.sleep(max(0.0, start + i / rate - time.perf_counter()))
+        client._on_message(client._client, None, message)
+    elapsed = time.perf_counter() - start
+    done.set()
+    consumer.join()
+
+    pacing = f"{rate:.0f}/s offered" if rate is not None else "unpaced"
+    print(f"MQTT ingest ({pacing}): {count / elapsed:.0f} messages/s,"
+          f" {len(delays)} commands, dropped {client.metrics().dropped}")
+    print(format_summary("  Arrival to dequeue", delays))
+
+
+def bench_planner(size: int, max_replans: int, seed: int = 0):
+    """
+    Drive a planned route across a `size` x `size` map where 20% of the tiles
+    are known to be blocked and another 5% are only found on the way.
+
+    Each tile found blocked is replanned around incrementally, and timed
+    against planning from scratch with the same tiles known.
+    """
+    rng = random.Random(seed)
+    start, goal = (0, 0), (size - 1, size - 1)
+    tiles = [(x, y) for x in range(size) for y in range(size) if (x, y) not in (start, goal)]
+    rng.shuffle(tiles)
+    known = set(tiles[:len(tiles) // 5])
+    hidden = set(tiles[len(tiles) // 5:len(tiles) // 4])
+    conf = BENCH_SETTINGS
+
+    planner = CardPlanner((size, size), goal, conf.TURN_TIME, conf.FORWARD_TIME, known)
+    pose = TurtlePose(start[0] + 0.5, start[1] + 0.5, 0)
+    begin = time.perf_counter()
+    cards = planner.plan(pose)
+    initial = time.perf_counter() - begin
+    initial_expanded = planner.expanded
+
+    incremental, scratch, incremental_expanded, scratch_expanded = [], [], [], []
+    while cards and len(incremental) < max_replans:
+        card = cards.pop(0)
+        x, y = int(pose.x), int(pose.y)
+        if card == CardType.LEFT:
+            pose = TurtlePose(pose.x, pose.y, (pose.theta + 90) % 360)
+            continue
+        if card == CardType.RIGHT:
+            pose = TurtlePose(pose.x, pose.y, (pose.theta - 90) % 360)
+            continue
+        dx, dy = HEADING_STEPS[heading_index(pose.theta)]
+        if (x + dx, y + dy) not in hidden:
+            pose = TurtlePose(pose.x + dx, pose.y + dy, pose.theta)
+            continue
+
+        known.add((x + dx, y + dy))
+        begin = time.perf_counter()
+        planner.set_tile(x + dx, y + dy, True)
+        cards = planner.plan(pose)
+        incremental.append(time.perf_counter() - begin)
+        incremental_expanded.append(planner.expanded)
+
+        begin = time.perf_counter()
+        fresh = CardPlanner((size, size), goal, conf.TURN_TIME, conf.FORWARD_TIME, known)
+        fresh_cards = fresh.plan(pose)
+        scratch.append(time.perf_counter() - begin)
+        scratch_expanded.append(fresh.expanded)
+        assert (cards is None) == (fresh_cards is None)
+
+    print(f"{size}x{size} planner: initial plan {initial * 1000:.1f}ms, {initial_expanded} states expanded,"
+          f" {len(incremental)} replans")
+    if incremental:
+        print(format_summary("  Incremental replan", incremental))
+        print(format_summary("  Replan from scratch", scratch))
+        print(f"  States expanded per replan: incremental {sum(incremental_expanded) / len(incremental):.0f},"
+              f" from scratch {sum(scratch_expanded) / len(scratch):.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless renderer benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='map sizes in tiles per side')
+    parser.add_argument('--frames', type=int, default=300, help='frames per measurement')
+    parser.add_argument('--skip-compare', action='store_true',
+                        help='skip the full redraw and map lock comparisons')
+    parser.add_argument('--latency-samples', type=int, default=30,
+                        help='key presses timed through the whole game, 0 to skip')
+    parser.add_argument('--latency-trace', help='write the per stage command latency histograms to this JSON file')
+    parser.add_argument('--mqtt-messages', type=int, default=20000,
+                        help='MQTT messages replayed through the ingest callback, 0 to skip')
+    parser.add_argument('--fleet-bots', type=int, default=8, help='simulated bots in the fleet benchmark')
+    parser.add_argument('--fleet-seconds', type=float, default=10.0,
+                        help='seconds to drive the fleet for, 0 to skip')
+    parser.add_argument('--planner-sizes', type=int, nargs='*', default=[64, 256],
+                        help='map sizes for the route planner benchmark')
+    parser.add_argument('--planner-replans', type=int, default=10, help='obstacles found per planner run')
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        bench_map_size(size, args.frames)
+    print(f"Render cache: {RENDER_CACHE.stats()}")
+
+    for size in args.planner_sizes:
+        bench_planner(size, args.planner_replans)
+
+    if args.mqtt_messages > 0:
+        bench_mqtt_ingest(args.mqtt_messages, None)
+        bench_mqtt_ingest(args.mqtt_messages, 5000.0)
+
+    if args.latency_samples > 0:
+        idle_latency, connected_latency = bench_input_latency(args.latency_samples, args.latency_trace)
+        print(format_summary("Key press to card queued (idle)", idle_latency))
+        print(format_summary("Key press to stage_pose (connected)", connected_latency))
+
+    if args.fleet_seconds > 0:
+        for num_bots in (1, args.fleet_bots):
+            for render_process in (False, True):
+                renderer = "process" if render_process else "thread"
+                frame_times, command_latency = bench_fleet(num_bots, args.fleet_seconds, render_process)
+                print(format_summary(f"Fleet of {num_bots}, render {renderer}, frame draw", frame_times))
+                print(format_summary(f"Fleet of {num_bots}, render {renderer}, command to stage_pose",
+                                     command_latency))
+
+    if args.skip_compare:
+        return
+
+    print(format_summary("Draw (full redraw)", bench_draw(BENCH_SETTINGS, args.frames, True)))
+    print(format_summary("Draw (dirty rects)", bench_draw(BENCH_SETTINGS, args.frames, False)))
+
+    # Larger tiles make each full frame slow, standing in for slower hardware.
+    slow_frames = replace(BENCH_SETTINGS, TILE_SIZE_PIXELS=384, VIEWPORT_MAX_PIXELS=(2304, 2304))
+    print(format_summary("Map update latency (lock held during Draw)",
+                         bench_control_wait(slow_frames, args.frames, True)))
+    print(format_summary("Map update latency (snapshot)",
+                         bench_control_wait(slow_frames, args.frames, False)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,6 @@
 from enum import StrEnum
-import random
 import time
 import math
-from queue import Queue
 from dataclasses import replace
 
 import WonderPy.core.wwMain
@@ -10,7 +8,14 @@ from WonderPy.core.wwConstants import WWRobotConstants
 from WonderPy.components.wwMedia import WWMedia
 from WonderPy.core.wwRobot import WWRobot
 
-from .constants import TurtlePose, Settings, SensorData, normalize_ang360, BotSounds
+from .channels import LatestValueChannel
+from .connection import ConnectionManager
+from .outbound import Actuator, CommandScheduler
+from .constants import Settings, SensorData, normalize_ang360, BotSounds, forward_time
+from .recorder import RECORDER, StageKind
+from .robot_frame import RobotFrame
+from .timeline import EffectTrack
+from .tracing import TRACER, CommandTrace
 
 # Coordinates notes:
 # Pygame draws things in pixels with:
@@ -23,26 +28,12 @@ from .constants import TurtlePose, Settings, SensorData, normalize_ang360, BotSo
 # The control uses unitless distance where each tile is 1x1
 #
 
-def rotate_point(x, y, sigma_degrees):
-    """
-    Rotate a point (x, y) around the origin by sigma degrees counterclockwise.
-
-    Args:
-        x: x-coordinate of the point
-        y: y-coordinate of the point
-        sigma_degrees: rotation angle in degrees (positive = counterclockwise)
-
-    Returns:
-        tuple: (x', y') - the rotated point coordinates
-    """
-    # Convert degrees to radians
-    sigma_radians = math.radians(sigma_degrees)
-
-    # Apply rotation formulas
-    x_prime = x * math.cos(sigma_radians) - y * math.sin(sigma_radians)
-    y_prime = x * math.sin(sigma_radians) + y * math.cos(sigma_radians)
-
-    return x_prime, y_prime
+SOUNDS = {
+    BotSounds.SIGH: WWMedia.WWSound.WWSoundDash.SIGH_DASH,
+    BotSounds.NO_WAY: WWMedia.WWSound.WWSoundDash.NO_WAY,
+    BotSounds.TRUMPET: WWMedia.WWSound.WWSoundDash.TRUMPET_01,
+    BotSounds.YIPPEE: WWMedia.WWSound.WWSoundDash.YIPPEE_02,
+}
 
 
 class RobotControl:
@@ -53,89 +44,81 @@ class RobotControl:
     This is needed for `get_pose`, and also for the `turn` and `forward` since they rely on the current position.
     This isn't required, but simplifies the internal logic.
 
+    Commands are queued on `outbound`, and staged on the robot when it's flushed.
+    `robot` is replaced when the bot is reconnected to, and queued commands go
+    to the new one.
+
     """
-    def __init__(self, robot: WWRobot, sensors: SensorData, conf: Settings) -> None:
+    def __init__(self, robot: WWRobot, sensors: SensorData, conf: Settings, outbound: CommandScheduler) -> None:
         self.robot = robot
+        self.outbound = outbound
         self.conf = conf
         self.sensors = sensors
-        self.start_pose_robot = TurtlePose(sensors.x, sensors.y, sensors.degrees)
-        self.start_pose_virtual = TurtlePose(
-            conf.START_TILE[0] + 0.5,
-            conf.START_TILE[1] + 0.5,
-            conf.START_THETA,
-        )
-        self.theta_offset = self.start_pose_virtual.theta - self.start_pose_robot.theta
-        self.pos_scale = 1.0 / conf.TILE_SIZE_CM
-        self.virtual_pos = self.start_pose_virtual
+        self.frame = RobotFrame(sensors, conf)
+        self.virtual_pos = self.frame.start_pose_virtual
+        # Index of the bot in a fleet, for the session log.
+        self.bot = 0
 
     def update_sensors(self, sensors: SensorData):
         self.sensors = sensors
 
-    def turn(self, turn_clockwise: bool):
+    def turn(self, turn_clockwise: bool, trace: CommandTrace | None = None):
         new_theta = normalize_ang360(self.virtual_pos.theta + (-90.0 if turn_clockwise else 90.0))
         self.virtual_pos = replace(self.virtual_pos, theta = new_theta)
-        desired_degrees = self.virtual_pos.theta - self.theta_offset
-        self.robot.commands.body.stage_pose(
-            self.sensors.x,
-            self.sensors.y,
-            desired_degrees,
-            self.conf.TURN_TIME,
-            mode=WWRobotConstants.WWPoseMode.WW_POSE_MODE_GLOBAL,
-        )
+        self.face_heading(trace)
 
-    def forward(self, reverse=False):
-        virtual_dist = -1.0 if reverse else 1.0
+    def face_heading(self, trace: CommandTrace | None = None):
+        """Turn in place to the heading of `virtual_pos`."""
+        desired_degrees = self.virtual_pos.theta - self.frame.theta_offset
+        self._stage_pose(self.sensors.x, self.sensors.y, desired_degrees, self.conf.TURN_TIME, trace)
+        RECORDER.stage(StageKind.POSE, self.sensors.x, self.sensors.y, desired_degrees, self.conf.TURN_TIME, bot=self.bot)
+
+    def forward(self, reverse=False, tiles=1, move_time: float | None = None, trace: CommandTrace | None = None):
+        virtual_dist = -tiles if reverse else tiles
         rad = math.radians(self.virtual_pos.theta)
         new_x = self.virtual_pos.x + math.cos(rad) * virtual_dist
         new_y = self.virtual_pos.y + math.sin(rad) * virtual_dist
         self.virtual_pos = replace(self.virtual_pos, x=new_x, y=new_y)
 
-        # Transform from virtual coordinates to robot coordinates
-        # 1. Remove virtual start offset and convert to cm
-        # 2. Rotate to the robots sensor orientation
-        # 3. Add back the robots start position offset
-        desired_x = (new_x - self.start_pose_virtual.x) / self.pos_scale
-        desired_y = (new_y - self.start_pose_virtual.y) / self.pos_scale
-        desired_x, desired_y = rotate_point(
-            desired_x, desired_y, 90 - self.theta_offset
-        )
-        desired_x += self.start_pose_robot.x
-        desired_y += self.start_pose_robot.y
-        self.robot.commands.body.stage_pose(
-            desired_x,
-            desired_y,
-            self.sensors.degrees,
-            self.conf.FORWARD_TIME,
-            mode=WWRobotConstants.WWPoseMode.WW_POSE_MODE_GLOBAL,
-        )
+        desired_x, desired_y = self.frame.to_robot(new_x, new_y)
+        if move_time is None:
+            move_time = forward_time(self.conf, tiles)
+        self._stage_pose(desired_x, desired_y, self.sensors.degrees, move_time, trace)
+        RECORDER.stage(StageKind.POSE, desired_x, desired_y, self.sensors.degrees, move_time, bot=self.bot)
+
+    def _stage_pose(self, x: float, y: float, degrees: float, move_time: float, trace: CommandTrace | None):
+        def send():
+            self.robot.commands.body.stage_pose(
+                x,
+                y,
+                degrees,
+                move_time,
+                mode=WWRobotConstants.WWPoseMode.WW_POSE_MODE_GLOBAL,
+            )
+            if trace is not None:
+                TRACER.staged(trace, key=self.bot)
+        self.outbound.submit(Actuator.BODY, (x, y, degrees, move_time), send)
+
+    def _set_leds(self, left, front, right):
+        self.outbound.submit(Actuator.EAR_LEFT, tuple(left), lambda: self.robot.commands.RGB.stage_ear_left(*left))
+        self.outbound.submit(Actuator.FRONT, tuple(front), lambda: self.robot.commands.RGB.stage_front(*front))
+        self.outbound.submit(Actuator.EAR_RIGHT, tuple(right), lambda: self.robot.commands.RGB.stage_ear_right(*right))
 
     def get_pose(self):
-        # Remove start offset so robot starts at 0,0
-        bot_x = self.sensors.x - self.start_pose_robot.x
-        bot_y = self.sensors.y - self.start_pose_robot.y
-        # Apply rotation so robot starts at correct angle
-        # -90 to handle turtle bot coordinates face in +y direction
-        bot_x, bot_y = rotate_point(bot_x, bot_y, self.theta_offset - 90)
-        return TurtlePose(
-            bot_x * self.pos_scale + self.start_pose_virtual.x,
-            bot_y * self.pos_scale + self.start_pose_virtual.y,
-            normalize_ang360(self.sensors.degrees + self.theta_offset),
-        )
+        return self.frame.to_virtual(self.sensors)
 
     def set_bot_rgb(self):
-        self.robot.commands.RGB.stage_ear_left(0, 1, 0)
-        self.robot.commands.RGB.stage_front(0, 0, 1)
-        self.robot.commands.RGB.stage_ear_right(1, 0, 0)
+        RECORDER.stage(StageKind.RGB, *(self.conf.LED_COLOR or (0, 0, 0)), bot=self.bot)
+        if self.conf.LED_COLOR is not None:
+            # Fleet bots show their own color so they can be told apart.
+            self._set_leds(self.conf.LED_COLOR, self.conf.LED_COLOR, self.conf.LED_COLOR)
+            return
+        self._set_leds((0, 1, 0), (0, 0, 1), (1, 0, 0))
 
     def do_celebrate(self):
-        def random_color():
-            return random.random(), random.random(), random.random()
-
-        self.robot.commands.media.stage_audio(
-            WWMedia.WWSound.WWSoundDash.TRUMPET_01, 1.0
-        )
-
-        self.robot.commands.body.stage_pose(
+        """Start the celebration spin. The LEDs and sounds are played by `timeline.celebration`."""
+        RECORDER.stage(StageKind.CELEBRATE, bot=self.bot)
+        send = lambda: self.robot.commands.body.stage_pose(
             0,
             0,
             degrees=360,
@@ -143,44 +126,58 @@ class RobotControl:
             wrap_theta=False,
             mode=WWRobotConstants.WWPoseMode.WW_POSE_MODE_RELATIVE_MEASURED,
         )
+        self.outbound.submit(Actuator.BODY, 'celebrate', send)
+
+    def clock(self) -> float:
+        """Seconds to time effects with."""
+        return time.monotonic()
 
-        start = time.time()
-        did_yipee = False
-        while time.time() - start < 6:
-            self.robot.commands.RGB.stage_ear_left(*random_color())
-            self.robot.commands.RGB.stage_ear_right(*random_color())
-            self.robot.commands.RGB.stage_front(*random_color())
-            time.sleep(0.2)
-            if time.time() - start > 3 and not did_yipee:
-                self.robot.commands.media.stage_audio(
-                    WWMedia.WWSound.WWSoundDash.YIPPEE_02, 1.0
-                )
-                did_yipee = True
-
-        self.set_bot_rgb()
+    def apply_effect(self, track: EffectTrack, value):
+        """Show a keyframe of a `timeline.Animation`. Only what started the effect is logged."""
+        if track == EffectTrack.SOUND:
+            self.outbound.submit(Actuator.AUDIO, value, lambda: self.robot.commands.media.stage_audio(SOUNDS[value], 1.0))
+        elif value is None:
+            self.set_bot_rgb()
+        else:
+            self._set_leds(*value)
 
     def set_main_button_led(self, is_on: bool):
-        self.robot.commands.monoLED.stage_button_main(1 if is_on else 0)
+        self.outbound.submit(Actuator.BUTTON_LED, is_on, lambda: self.robot.commands.monoLED.stage_button_main(1 if is_on else 0))
+        RECORDER.stage(StageKind.BUTTON_LED, int(is_on), bot=self.bot)
 
     def stop(self):
-        self.robot.commands.body.stage_stop()
+        self.outbound.submit(Actuator.STOP, None, lambda: self.robot.commands.body.stage_stop())
+        RECORDER.stage(StageKind.STOP, bot=self.bot)
 
     def play_sound(self, sound: BotSounds):
-        sound_str = {
-            BotSounds.SIGH: WWMedia.WWSound.WWSoundDash.SIGH_DASH,
-            BotSounds.NO_WAY: WWMedia.WWSound.WWSoundDash.NO_WAY,
-        }[sound]
-        self.robot.commands.media.stage_audio(sound_str)
+        self.outbound.submit(Actuator.AUDIO, sound, lambda: self.robot.commands.media.stage_audio(SOUNDS[sound]))
+        RECORDER.stage(StageKind.AUDIO, sound.value, bot=self.bot)
 
 
 class RobotInterface:
+    """
+    The real bot, connected to through `transport`, `WonderPy.core.wwMain`
+    unless it's faked. See `connection.py` for reconnecting.
+    """
 
-    def __init__(self, conf: Settings) -> None:
+    def __init__(self, conf: Settings, transport=WonderPy.core.wwMain) -> None:
         self.conf = conf
-        self.sensor_queue: Queue[SensorData | None] = Queue()
+        # Only the newest packet matters, stale ones are dropped.
+        self.sensor_queue: LatestValueChannel[SensorData | None] = LatestValueChannel()
         self.robot_ctrl: RobotControl | None = None
+        # Commands for the bot, sent with each sensor packet.
+        self.outbound = CommandScheduler()
+        self.connection = ConnectionManager(transport, self, conf)
+
+    def on_connect(self, robot: WWRobot):
+        if self.robot_ctrl is not None:
+            # Reconnected. The session goes on with the start pose it had.
+            self.robot_ctrl.robot = robot
+            self.outbound.forget_shown()
+        self.connection.on_connect(robot.name)
 
     def on_sensors(self, robot: WWRobot):
+        self.outbound.flush()
         left_reflect = (
             robot.sensors.distance_front_left_facing.reflectance
             if robot.sensors.distance_front_left_facing.reflectance is not None
@@ -202,13 +199,19 @@ class RobotInterface:
         )
 
         if self.robot_ctrl is None:
-            self.robot_ctrl = RobotControl(robot, sensors, self.conf)
+            self.robot_ctrl = RobotControl(robot, sensors, self.conf, self.outbound)
 
         self.sensor_queue.put_nowait(sensors)
 
     def run(self):
-        WonderPy.core.wwMain.start(self)
+        """Block while connected to the bot, or reconnecting to it."""
+        self.connection.run()
+        self.sensor_queue.put_nowait(None)
+
+    def reconnect(self):
+        """Connect to the bot again, for a link that stopped sending packets."""
+        self.connection.drop()
 
     def stop(self):
-        WonderPy.core.wwMain.stop()
+        self.connection.stop()
         self.sensor_queue.put_nowait(None)
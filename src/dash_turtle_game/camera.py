@@ -0,0 +1,106 @@
+from .constants import DimType
+
+# Smallest tile size the camera will zoom out to.
+MIN_TILE_PIXELS = 8
+
+
+class Camera:
+    """
+    Maps between virtual game coordinates and pixels in the map viewport.
+
+    The viewport shows part of the map at one of a fixed set of zoom levels,
+    each halving the tile size of the one before. `origin` is the map pixel,
+    measured from the top left of the whole map at the current zoom, that is
+    drawn at the top left of the viewport.
+    """
+
+    def __init__(self, map_tiles: DimType, base_tile_pixels: int, viewport: DimType) -> None:
+        self.map_tiles = map_tiles
+        self.viewport = viewport
+
+        self.zoom_levels = [base_tile_pixels]
+        while self.zoom_levels[-1] // 2 >= MIN_TILE_PIXELS:
+            self.zoom_levels.append(self.zoom_levels[-1] // 2)
+
+        # Start at the largest zoom that shows the whole map.
+        self.zoom_index = len(self.zoom_levels) - 1
+        for i, tile_px in enumerate(self.zoom_levels):
+            if tile_px * map_tiles[0] <= viewport[0] and tile_px * map_tiles[1] <= viewport[1]:
+                self.zoom_index = i
+                break
+        self.origin = (0, 0)
+        self._clamp()
+
+    @property
+    def tile_px(self) -> int:
+        return self.zoom_levels[self.zoom_index]
+
+    @property
+    def map_pixels(self) -> DimType:
+        return self.map_tiles[0] * self.tile_px, self.map_tiles[1] * self.tile_px
+
+    def _clamp(self):
+        # Center the map on any axis where it fits entirely in the viewport.
+        origin = []
+        for axis in (0, 1):
+            extra = self.map_pixels[axis] - self.viewport[axis]
+            if extra <= 0:
+                origin.append(extra // 2)
+            else:
+                origin.append(min(max(0, self.origin[axis]), extra))
+        self.origin = (origin[0], origin[1])
+
+    def world_to_screen(self, x: float, y: float) -> tuple[int, int]:
+        """Virtual game coordinates to viewport pixels."""
+        px = x * self.tile_px - self.origin[0]
+        py = (self.map_tiles[1] - y) * self.tile_px - self.origin[1]
+        return int(px), int(py)
+
+    def screen_to_tile(self, pos: tuple[int, int]) -> DimType:
+        """Viewport pixels to the tile under them."""
+        x = (pos[0] + self.origin[0]) // self.tile_px
+        y = self.map_tiles[1] - 1 - (pos[1] + self.origin[1]) // self.tile_px
+        return int(x), int(y)
+
+    def pan(self, dx: int, dy: int):
+        self.origin = (self.origin[0] - dx, self.origin[1] - dy)
+        self._clamp()
+
+    def zoom(self, steps: int, anchor: tuple[int, int]):
+        """Zoom in for positive steps, keeping the point under `anchor` fixed."""
+        new_index = min(max(0, self.zoom_index - steps), len(self.zoom_levels) - 1)
+        if new_index == self.zoom_index:
+            return
+        world_x = (anchor[0] + self.origin[0]) / self.tile_px
+        world_y = (anchor[1] + self.origin[1]) / self.tile_px
+        self.zoom_index = new_index
+        self.origin = (
+            int(world_x * self.tile_px - anchor[0]),
+            int(world_y * self.tile_px - anchor[1]),
+        )
+        self._clamp()
+
+    def follow(self, x: float, y: float, margin_tiles: float = 1.0):
+        """Recenter on (x, y) if it gets within `margin_tiles` of the viewport edge."""
+        px, py = self.world_to_screen(x, y)
+        margin = margin_tiles * self.tile_px
+        if margin <= px <= self.viewport[0] - margin and margin <= py <= self.viewport[1] - margin:
+            return
+        self.origin = (
+            self.origin[0] + px - self.viewport[0] // 2,
+            self.origin[1] + py - self.viewport[1] // 2,
+        )
+        self._clamp()
+
+    def visible_tiles(self) -> tuple[DimType, DimType]:
+        """Inclusive-exclusive tile ranges ((x0, x1), (y0, y1)) touching the viewport."""
+        tile_px = self.tile_px
+        x0 = max(0, self.origin[0] // tile_px)
+        x1 = min(self.map_tiles[0], -(-(self.origin[0] + self.viewport[0]) // tile_px))
+        # Pixel rows count down from the top of the map.
+        row0 = max(0, self.origin[1] // tile_px)
+        row1 = min(self.map_tiles[1], -(-(self.origin[1] + self.viewport[1]) // tile_px))
+        return (x0, x1), (self.map_tiles[1] - row1, self.map_tiles[1] - row0)
+
+    def view_state(self) -> tuple:
+        return (self.zoom_index, self.origin)
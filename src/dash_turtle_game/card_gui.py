@@ -1,13 +1,17 @@
 import pygame
 from enum import Enum, auto
 
+from .asset_cache import ASSET_CACHE
 from .constants import ASSET_DIR, CmdEvent
+from .render_cache import RENDER_CACHE
 
 # --- Example card type enum (customize as needed) ---
 class CardType(Enum):
     LEFT = auto()
     UP = auto()
     RIGHT = auto()
+    # Runs the card before it once more.
+    REPEAT = auto()
 
 
 def event_to_card(cmd_event: CmdEvent) -> CardType:
@@ -15,6 +19,7 @@ def event_to_card(cmd_event: CmdEvent) -> CardType:
         CmdEvent.LEFT: CardType.LEFT,
         CmdEvent.UP: CardType.UP,
         CmdEvent.RIGHT: CardType.RIGHT,
+        CmdEvent.REPEAT: CardType.REPEAT,
     }.get(cmd_event, CardType.LEFT)
 
 
@@ -47,6 +52,11 @@ def _recolor_surface(surface: pygame.Surface, color: pygame.Color) -> pygame.Sur
 # --- Card images registry: map CardType -> pygame.Surface ---
 # Populate this with your actual images. Example uses colored placeholders.
 def load_card_images(card_w, card_h):
+    images = ASSET_CACHE.load('cards', (ARROW_IMAGE,), (card_w, card_h), lambda: _draw_card_images(card_w, card_h))
+    return {CardType[name]: image for name, image in images.items()}
+
+
+def _draw_card_images(card_w, card_h) -> dict[str, pygame.Surface]:
     images = {}
 
     arrow_base = pygame.image.load(ARROW_IMAGE).convert_alpha()
@@ -64,7 +74,19 @@ def load_card_images(card_w, card_h):
     for card_type, arrow in arrows.items():
         surf = pygame.Surface((card_w - 16, card_h - 16), pygame.SRCALPHA)
         surf.blit(arrow, arrow.get_rect(center=surf.get_rect().center))
-        images[card_type] = surf
+        images[card_type.name] = surf
+
+    # REPEAT is a circular arrow.
+    surf = pygame.Surface((card_w - 16, card_h - 16), pygame.SRCALPHA)
+    center = surf.get_rect().center
+    radius = h // 2 + 4
+    color = pygame.Color("orange")
+    pygame.draw.arc(surf, color, (center[0] - radius, center[1] - radius, radius * 2, radius * 2),
+                    0.5, 5.5, max(2, radius // 4))
+    tip_x, tip_y = center[0] + radius * 0.88, center[1] - radius * 0.48
+    pygame.draw.polygon(surf, color, [(tip_x - radius // 2, tip_y), (tip_x + radius // 2, tip_y),
+                                      (tip_x, tip_y + radius // 2)])
+    images[CardType.REPEAT.name] = surf
     return images
 
 
@@ -200,29 +222,40 @@ class CardQueueWidget:
             cx = self.rect.x + 6 + i * (self.card_w + self.card_gap)
             cy = self.rect.y + 6
 
-            card_rect = pygame.Rect(cx, cy, self.card_w, self.card_h)
+            is_active = (card_idx == self.active_index)
+            surface.blit(self._get_card_surface(card_type, is_active), (cx, cy))
+
+        # Scroll indicators
+        self._draw_scroll_arrows(surface)
+
+        surface.set_clip(old_clip)
+
+        # Outer widget border
+        pygame.draw.rect(surface, (80, 80, 100), self.rect, 2, border_radius=self.corner_radius)
+
+    def _get_card_surface(self, card_type: CardType, is_active: bool) -> pygame.Surface:
+        """Fully composed card, cached in the shared render cache."""
+        color = self.active_color if is_active else self.border_color
+
+        def render():
+            card = pygame.Surface((self.card_w, self.card_h), pygame.SRCALPHA)
+            card_rect = card.get_rect()
 
             # Card background
-            pygame.draw.rect(surface, (50, 50, 65), card_rect, border_radius=4)
+            pygame.draw.rect(card, (50, 50, 65), card_rect, border_radius=4)
 
             # Card image
             img = self._images.get(card_type)
             if img:
                 img_rect = img.get_rect(center=card_rect.center)
-                surface.blit(img, img_rect)
+                card.blit(img, img_rect)
 
             # Card border (red if active)
-            is_active = (card_idx == self.active_index)
-            color = self.active_color if is_active else self.border_color
-            pygame.draw.rect(surface, color, card_rect, self.border_width, border_radius=4)
+            pygame.draw.rect(card, color, card_rect, self.border_width, border_radius=4)
+            return card
 
-        # Scroll indicators
-        self._draw_scroll_arrows(surface)
-
-        surface.set_clip(old_clip)
-
-        # Outer widget border
-        pygame.draw.rect(surface, (80, 80, 100), self.rect, 2, border_radius=self.corner_radius)
+        key = ('card', id(self._images), card_type, tuple(color), self.card_w, self.card_h, self.border_width)
+        return RENDER_CACHE.get(key, render, pin=self._images)
 
     def _draw_scroll_arrows(self, surface):
         arrow_color = pygame.Color("orange")
@@ -244,6 +277,10 @@ class CardQueueWidget:
     # Helpers
     # ------------------------------------------------------------------
 
+    def view_state(self) -> tuple:
+        """Hashable summary of everything `draw` depends on."""
+        return (tuple(self.cards), self.scroll_offset, self.active_index)
+
     def _visible_count(self) -> int:
         """How many full cards fit in the widget width."""
         usable = self.rect.width - 12
@@ -0,0 +1,194 @@
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum, auto
+from queue import Empty
+from typing import Generic, Iterable, Iterator, TypeVar
+import threading
+import time
+
+T = TypeVar('T')
+
+
+@dataclass
+class ChannelMetrics:
+    depth: int
+    oldest_age_sec: float
+    dropped: int
+
+
+class OverflowPolicy(Enum):
+    # Discard the oldest queued item to make room for the new one.
+    DROP_OLDEST = auto()
+    # Discard the new item.
+    DROP_NEWEST = auto()
+
+
+class _Channel(ABC, Generic[T]):
+    """
+    Base for the inter-thread channels.
+
+    The methods mirror the parts of `queue.Queue` the game uses, including
+    raising `queue.Empty`, so a channel can replace a queue directly.
+
+    Items are stamped with `time.perf_counter` when put, or with the time
+    passed by the producer. The `_stamped` variants return the stamps.
+    """
+
+    def __init__(self) -> None:
+        self._items: deque[tuple[float, T]] = deque()
+        self._cond = threading.Condition()
+        self._waiting_readers = 0
+        self._selectors: list["ChannelSelector"] = []
+        self.dropped = 0
+
+    @abstractmethod
+    def _push(self, stamp: float, item: T):
+        """Queue `item`, applying the channel's overflow rule. Called with the lock held."""
+
+    def put_nowait(self, item: T, stamp: float | None = None):
+        if stamp is None:
+            stamp = time.perf_counter()
+        with self._cond:
+            self._push(stamp, item)
+            self._cond.notify_all()
+            selectors = tuple(self._selectors)
+        # Outside the channel lock, selectors take it while they wait.
+        for selector in selectors:
+            selector._wake()
+
+    def put(self, item: T, stamp: float | None = None):
+        self.put_nowait(item, stamp)
+
+    def get(self, block: bool = True, timeout: float | None = None) -> T:
+        return self.get_stamped(block, timeout)[1]
+
+    def get_stamped(self, block: bool = True, timeout: float | None = None) -> tuple[float, T]:
+        with self._cond:
+            if block and len(self._items) == 0:
+                self._waiting_readers += 1
+                self._cond.notify_all()
+                try:
+                    if not self._cond.wait_for(lambda: len(self._items) > 0, timeout):
+                        raise Empty()
+                finally:
+                    self._waiting_readers -= 1
+            if len(self._items) == 0:
+                raise Empty()
+            return self._items.popleft()
+
+    def get_nowait(self) -> T:
+        return self.get(block=False)
+
+    def _add_selector(self, selector: "ChannelSelector"):
+        with self._cond:
+            self._selectors.append(selector)
+
+    def _remove_selector(self, selector: "ChannelSelector"):
+        with self._cond:
+            self._selectors.remove(selector)
+
+    def _add_waiting_reader(self, count: int):
+        with self._cond:
+            self._waiting_readers += count
+            self._cond.notify_all()
+
+    def wait_for_reader(self, timeout: float | None = None) -> bool:
+        """
+        Block until everything put has been read and a reader is waiting for
+        more. Lets a producer run in lockstep with its consumer.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: len(self._items) == 0 and self._waiting_readers > 0, timeout)
+
+    def drain(self) -> Iterator[T]:
+        """Yield everything queued at the time of the call."""
+        for _, item in self.drain_stamped():
+            yield item
+
+    def drain_stamped(self) -> list[tuple[float, T]]:
+        with self._cond:
+            items = list(self._items)
+            self._items.clear()
+        return items
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+    def empty(self) -> bool:
+        return len(self._items) == 0
+
+    def metrics(self) -> ChannelMetrics:
+        with self._cond:
+            oldest_age = time.perf_counter() - self._items[0][0] if self._items else 0.0
+            return ChannelMetrics(len(self._items), oldest_age, self.dropped)
+
+
+class LatestValueChannel(_Channel[T]):
+    """
+    Holds at most one item. A new item replaces an unread one.
+
+    Used for sensor data, where only the freshest packet is worth acting on.
+    """
+
+    def _push(self, stamp: float, item: T):
+        if self._items:
+            self._items.clear()
+            self.dropped += 1
+        self._items.append((stamp, item))
+
+
+class BoundedChannel(_Channel[T]):
+    """FIFO holding at most `maxsize` items, applying `policy` when full."""
+
+    def __init__(self, maxsize: int, policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST) -> None:
+        super().__init__()
+        self.maxsize = maxsize
+        self.policy = policy
+
+    def _push(self, stamp: float, item: T):
+        if len(self._items) >= self.maxsize:
+            self.dropped += 1
+            if self.policy == OverflowPolicy.DROP_NEWEST:
+                return
+            self._items.popleft()
+        self._items.append((stamp, item))
+
+
+class ChannelSelector:
+    """
+    Wait for any of several channels to have items, like `select` over sockets.
+
+    Each channel wakes the selector as soon as something is put, so a thread
+    serving several sources reacts to whichever comes first instead of
+    polling them in turn. While waiting, the selector counts as a reader of
+    every channel for `wait_for_reader`.
+    """
+
+    def __init__(self, channels: Iterable[_Channel | None]) -> None:
+        self._channels = [channel for channel in channels if channel is not None]
+        self._cond = threading.Condition()
+        for channel in self._channels:
+            channel._add_selector(self)
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _any_ready(self) -> bool:
+        return any(not channel.empty() for channel in self._channels)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until a channel has items. Returns False on timeout."""
+        for channel in self._channels:
+            channel._add_waiting_reader(1)
+        try:
+            with self._cond:
+                return self._cond.wait_for(self._any_ready, timeout)
+        finally:
+            for channel in self._channels:
+                channel._add_waiting_reader(-1)
+
+    def close(self):
+        for channel in self._channels:
+            channel._remove_selector(self)
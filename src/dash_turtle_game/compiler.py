@@ -0,0 +1,153 @@
+"""
+Compile the card queue into the moves the bot makes, and check them against
+the map before connecting.
+
+Compiling expands REPEAT cards, which run the card before them once more, and
+folds each run of turns into its net turn: LEFT RIGHT cancels out, and three
+LEFTs become one RIGHT. Each move keeps the index of the card it came from, so
+the queue can highlight it while it runs.
+
+`validate` drives the moves over the known tiles, so a program that would
+leave the map or enter a tile known to be blocked is rejected before the bot
+moves at all.
+
+Run with:
+    python -m dash_turtle_game.compiler
+"""
+from dataclasses import dataclass
+from typing import Sequence
+
+import numpy as np
+
+from .card_gui import CardType
+from .constants import TileType, TurtlePose
+from .tile_grid import TileGrid
+
+# Quarter turns counter-clockwise for each card, and tile steps per heading.
+TURNS = {CardType.LEFT: 1, CardType.RIGHT: -1}
+HEADING_STEPS = np.array([(1, 0), (0, 1), (-1, 0), (0, -1)])
+
+
+class ProgramError(Exception):
+    """A program that can't run, with the index of the card at fault."""
+
+    def __init__(self, card: int, message: str) -> None:
+        super().__init__(f"Card {card + 1}: {message}")
+        self.card = card
+
+
+@dataclass(frozen=True)
+class Program:
+    # `CardType` value of each move, and the index of the card it came from.
+    ops: np.ndarray
+    sources: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.ops)
+
+    def op(self, index: int) -> CardType:
+        return CardType(int(self.ops[index]))
+
+    def source(self, index: int) -> int:
+        return int(self.sources[index])
+
+    def splice(self, index: int, cards: Sequence[CardType]) -> "Program":
+        """Replace the moves from `index` on with `cards`, which replace the cards from the one of move `index` on."""
+        first_card = self.source(index)
+        tail = compile_cards(cards)
+        return Program(
+            np.concatenate([self.ops[:index], tail.ops]),
+            np.concatenate([self.sources[:index], tail.sources + first_card]),
+        )
+
+
+def _flush_turns(net: int, first: CardType, source: int, ops: list[int], sources: list[int]):
+    net %= 4
+    if net == 0:
+        return
+    if net == 2:
+        ops += [first.value] * 2
+        sources += [source] * 2
+        return
+    ops.append((CardType.LEFT if net == 1 else CardType.RIGHT).value)
+    sources.append(source)
+
+
+def compile_cards(cards: Sequence[CardType]) -> Program:
+    """Moves for `cards`. Raises `ProgramError` for a REPEAT with nothing before it."""
+    ops: list[int] = []
+    sources: list[int] = []
+    net = 0
+    turn_start = 0
+    first_turn = CardType.LEFT
+    previous: CardType | None = None
+    for index, card in enumerate(cards):
+        if card == CardType.REPEAT:
+            if previous is None:
+                raise ProgramError(index, "REPEAT needs a card before it")
+            card = previous
+        previous = card
+
+        turn = TURNS.get(card)
+        if turn is not None:
+            if net == 0:
+                turn_start = index
+                first_turn = card
+            net += turn
+            continue
+        _flush_turns(net, first_turn, turn_start, ops, sources)
+        net = 0
+        ops.append(card.value)
+        sources.append(index)
+    _flush_turns(net, first_turn, turn_start, ops, sources)
+    return Program(np.array(ops, dtype=np.uint8), np.array(sources, dtype=np.int32))
+
+
+def validate(program: Program, grid: TileGrid, pose: TurtlePose):
+    """Raise `ProgramError` for the first move that leaves the map or enters a blocked tile."""
+    if len(program) == 0:
+        return
+    ops = program.ops
+    turns = np.where(ops == CardType.LEFT.value, 1, np.where(ops == CardType.RIGHT.value, -1, 0))
+    headings = (round(pose.theta / 90) + np.cumsum(turns)) % 4
+    steps = HEADING_STEPS[headings] * (ops == CardType.UP.value)[:, None]
+    tiles = np.array([int(pose.x), int(pose.y)]) + np.cumsum(steps, axis=0)
+
+    size_x, size_y = grid.size
+    off_map = (tiles[:, 0] < 0) | (tiles[:, 0] >= size_x) | (tiles[:, 1] < 0) | (tiles[:, 1] >= size_y)
+    if off_map.any():
+        first = int(np.argmax(off_map))
+        raise ProgramError(program.source(first), "drives off the map")
+    blocked = grid.types[tiles[:, 0], tiles[:, 1]] == TileType.BLOCKED.value
+    if blocked.any():
+        first = int(np.argmax(blocked))
+        x, y = tiles[first]
+        raise ProgramError(program.source(first), f"drives into the blocked tile {grid.text_at(x, y)}")
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    cards = [CardType.LEFT, CardType.RIGHT, CardType.UP, CardType.REPEAT, CardType.LEFT, CardType.REPEAT,
+             CardType.REPEAT, CardType.UP]
+    program = compile_cards(cards)
+    print([card.name for card in cards], '->', [program.op(i).name for i in range(len(program))])
+
+    from dataclasses import replace
+
+    from .main import SETTINGS
+    from .map_state import MapStateStore
+
+    # Random walks on a map large enough for them to stay on it.
+    conf = replace(SETTINGS, MAP_SIZE_TILES=(256, 256), START_TILE=(128, 128), GOAL_TILE=(0, 0))
+    store = MapStateStore(conf)
+    pose = store.snapshot.turtle_pose
+    rng = random.Random(0)
+    for num_cards in (10, 100, 1000):
+        cards = [CardType.UP] + [rng.choice(list(CardType)) for _ in range(num_cards - 1)]
+        start = time.perf_counter()
+        for _ in range(100):
+            program = compile_cards(cards)
+            validate(program, store.snapshot.grid, pose)
+        print(f"{num_cards:5} cards: {(time.perf_counter() - start) * 10:.3f}ms to compile and validate")
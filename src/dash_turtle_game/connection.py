@@ -0,0 +1,124 @@
+"""
+The link to the real bot, kept up across dropped connections.
+
+The name of the last bot connected to is saved to `ROBOT_NAME_PATH`, and
+later connections ask WonderPy for that bot by name and take it as soon as
+it's seen, instead of scanning for the best one. If the link drops, or the
+controller stops getting sensor packets, it's connected again until
+`RECONNECT_TIMEOUT_SEC` passes. The session goes on over the new link, so
+the bot keeps the start pose it was calibrated with.
+
+Run `python -m dash_turtle_game.fake_robot --reconnect` to time reconnecting
+over a fake link.
+"""
+from argparse import Namespace
+import threading
+import time
+from typing import Any
+
+from .constants import Settings, cache_path
+
+# Wait before connecting again after an attempt that didn't get the bot.
+RETRY_DELAY_SEC = 0.5
+
+
+class ConnectionManager:
+    """
+    Connects `delegate` to the bot through `transport`, again and again until
+    `stop`. The delegate calls `on_connect` with each robot it gets.
+
+    `transport` is `WonderPy.core.wwMain`, or anything else with its `start`,
+    which blocks calling the delegate's `on_connect` and `on_sensors` until
+    the link ends, and `stop`.
+    """
+
+    def __init__(self, transport: Any, delegate: Any, conf: Settings) -> None:
+        self.transport = transport
+        self.delegate = delegate
+        self.reconnect_timeout_sec = conf.RECONNECT_TIMEOUT_SEC
+        self.name_path = cache_path(conf.ROBOT_NAME_PATH) if conf.ROBOT_NAME_PATH else None
+        self.robot_name = self._load_name()
+        self.connects = 0
+        # Time from losing the link to getting the bot back, for each reconnect.
+        self.reconnect_sec: list[float] = []
+        self._lost_at: float | None = None
+        self._linked = False
+        self._stopped = threading.Event()
+
+    def _load_name(self) -> str | None:
+        if self.name_path is None:
+            return None
+        try:
+            return self.name_path.read_text().strip() or None
+        except OSError:
+            return None
+
+    def _save_name(self, name: str):
+        self.robot_name = name
+        if self.name_path is None:
+            return
+        try:
+            self.name_path.parent.mkdir(parents=True, exist_ok=True)
+            self.name_path.write_text(name)
+        except OSError as err:
+            print(f"Can't save the robot name: {err}")
+
+    def connect_args(self, scan: bool = False) -> Namespace:
+        """WonderPy's command line options, for the remembered bot unless `scan` or there's none."""
+        name = None if scan else self.robot_name
+        return Namespace(
+            connect_name=[name] if name else None,
+            connect_type=None,
+            connect_eager=name is not None,
+            connect_ask=False,
+        )
+
+    def on_connect(self, name: str):
+        self.connects += 1
+        if self._lost_at is not None:
+            self.reconnect_sec.append(time.perf_counter() - self._lost_at)
+            print(f"Reconnected to {name} in {self.reconnect_sec[-1]:.2f}s")
+            self._lost_at = None
+        if name != self.robot_name:
+            self._save_name(name)
+
+    def run(self):
+        """Block until `stop`, or until the bot can't be connected to."""
+        # A remembered bot that isn't around is given up on for a full scan.
+        scan = False
+        while not self._stopped.is_set():
+            connects = self.connects
+            self._linked = True
+            try:
+                self.transport.start(self.delegate, self.connect_args(scan))
+            finally:
+                self._linked = False
+            if self._stopped.is_set():
+                break
+            if self.connects == 0:
+                if scan or self.robot_name is None:
+                    break
+                print(f"{self.robot_name} not found, scanning for any bot")
+                scan = True
+                continue
+            if self._lost_at is None:
+                self._lost_at = time.perf_counter()
+                print(f"Lost {self.robot_name}, reconnecting")
+            elif time.perf_counter() - self._lost_at > self.reconnect_timeout_sec:
+                print(f"Gave up reconnecting to {self.robot_name}")
+                break
+            if self.connects == connects:
+                self._stopped.wait(RETRY_DELAY_SEC)
+
+    def drop(self):
+        """End the current link, to connect again. For a link that stopped sending packets."""
+        if self._lost_at is None:
+            self._lost_at = time.perf_counter()
+            print(f"Lost {self.robot_name}, reconnecting")
+        if self._linked:
+            self.transport.stop()
+
+    def stop(self):
+        self._stopped.set()
+        if self._linked:
+            self.transport.stop()
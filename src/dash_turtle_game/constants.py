@@ -1,5 +1,6 @@
 from enum import Enum, auto
 from dataclasses import dataclass
+import os
 from pathlib import Path
 from typing import Optional
 
@@ -7,6 +8,16 @@ ASSET_DIR = Path(__file__).parents[2].resolve() / 'assets'
 
 DimType = tuple[int, int]
 
+
+def cache_path(path: str) -> Path:
+    """
+    A cache path from the settings. Relative ones are in the user's cache
+    directory, `$XDG_CACHE_HOME` or ~/.cache, looked up when it's used.
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(cache_home) / 'dash_turtle_game' / path
+
+
 class CmdEvent(Enum):
     NONE = auto()
     LEFT = auto()
@@ -18,6 +29,8 @@ class CmdEvent(Enum):
     TOGGLE_QUEUING = auto()
     TOGGLE_CONNECT = auto()
     DELETE_LAST_QUEUED = auto()
+    PLAN_ROUTE = auto()
+    REPEAT = auto()
 
 class TileType(Enum):
     UNKNOWN = auto()
@@ -28,6 +41,15 @@ class TileType(Enum):
 class BotSounds(Enum):
     SIGH = auto()
     NO_WAY = auto()
+    TRUMPET = auto()
+    YIPPEE = auto()
+
+class QueueResult(Enum):
+    """Why running the queued cards stopped."""
+    COMPLETE = auto()
+    OFF_MAP = auto()
+    BLOCKED = auto()
+    CRASHED = auto()
 
 @dataclass
 class TurtlePose:
@@ -42,6 +64,16 @@ class TileState:
     observed: bool = False
     text: str = ''
 
+@dataclass(frozen=True)
+class BotConfig:
+    """One bot of a fleet, see `fleet.FleetControl`."""
+    name: str
+    START_TILE: DimType
+    START_THETA: float
+    # RGB from 0 to 1 for the bot's LEDs and its sprite on the map.
+    LED_COLOR: tuple[float, float, float]
+
+
 @dataclass
 class Settings:
     START_TILE: DimType
@@ -63,9 +95,61 @@ class Settings:
     BOT_CONNECT_TIMEOUT_SEC: float
     USE_SIM_BOT: bool
 
+    # Render to an offscreen surface with the SDL dummy video driver.
+    HEADLESS: bool = False
+    # Run the renderer in its own process, reading the game state from shared memory.
+    RENDER_PROCESS: bool = False
+    # Larger maps are shown through a scrollable, zoomable viewport of this size.
+    VIEWPORT_MAX_PIXELS: DimType = (1024, 768)
+    # Command latency histograms are written here as JSON on exit, if set.
+    LATENCY_TRACE_PATH: str | None = None
+    # Sensor packets, commands and bot commands are logged here, see recorder.py.
+    RECORD_PATH: str | None = None
+    # Bots driven together on the same map. Empty for a single bot.
+    FLEET: tuple[BotConfig, ...] = ()
+    # Show this RGB color on all the bot's LEDs instead of the default ones.
+    LED_COLOR: tuple[float, float, float] | None = None
+    # Queued UP cards in a straight line are driven as one motion. Each tile
+    # after the first takes this fraction of FORWARD_TIME, as the bot doesn't
+    # stop in between.
+    RUN_TILE_TIME_SCALE: float = 0.75
+    # Import the real bot's interface in the background at startup, instead
+    # of when Connect is first pressed.
+    PRELOAD_BOT_INTERFACE: bool = True
+    # Tile, turtle and card images are cached here, ready to draw, see
+    # asset_cache.py. Relative to the user's cache directory, see
+    # `cache_path`. None loads them from the assets every time.
+    ASSET_CACHE_DIR: str | None = 'assets'
+    # The name of the last real bot connected to, to connect to it again
+    # without a scan. Relative to the user's cache directory, see
+    # `cache_path`. None always scans.
+    ROBOT_NAME_PATH: str | None = 'robot_name'
+    # Time to keep trying to get a lost bot back before ending the session.
+    RECONNECT_TIMEOUT_SEC: float = 15.0
+
+    # Simulated bot. Virtual seconds per wall clock second, 0 runs as fast as
+    # the controller can keep up.
+    SIM_TIME_SCALE: float = 1.0
+    SIM_TICK_SEC: float = 0.1
+    # Fraction the true distance and turn angle differ from the commanded ones.
+    SIM_DISTANCE_DRIFT: float = 0.0
+    SIM_TURN_DRIFT: float = 0.0
+    # Standard deviation of the noise added to each reported pose.
+    SIM_POSE_NOISE_TILES: float = 0.0
+    SIM_HEADING_NOISE_DEG: float = 0.0
+    SIM_SEED: int | None = None
+    # Ground truth obstacles the simulated IR sensors see, hidden from the GUI.
+    SIM_OBSTACLE_TILES: tuple[DimType, ...] = ()
+    # Standard deviation of the noise added to each IR reflectance reading.
+    SIM_IR_NOISE: float = 0.0
+
 def normalize_ang360(angle: float) -> float:
     return angle % 360.0
 
+def forward_time(conf: Settings, tiles: int) -> float:
+    """Time for one motion straight across `tiles` tiles."""
+    return conf.FORWARD_TIME * (1 + (tiles - 1) * conf.RUN_TILE_TIME_SCALE)
+
 @dataclass
 class SensorData:
     x: float
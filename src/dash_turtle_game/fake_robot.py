@@ -0,0 +1,269 @@
+"""
+Stand-ins for WonderPy's `WWRobot`, to count the commands sent to the bot,
+and for `wwMain`, to time connecting to it.
+
+Any `stage_*` call on a `FakeWWRobot.commands` component is counted as a BLE
+write, and takes `write_sec`. `FakeTransport` connects to a fake robot with
+made up BLE timings, and sends its sensor packets until the link is stopped,
+or goes quiet with `stall`.
+
+Running this module drives `bot_interface.RobotControl` on a fake robot
+through a minute of play: a move every couple of seconds with the button LED
+going off and on around it, the bot's colors set again after every move, and
+a celebration with a crash flash over it. It's run once staging every command
+right away, and once through `outbound.CommandScheduler` flushed with each
+packet, and prints the writes and the time the controller spent sending
+them. WonderPy still has to be installed for its constants.
+
+With `--reconnect`, it runs the game headless on a fake link instead, and
+times connecting with a scan, connecting to the remembered bot, and
+reconnecting after the link goes quiet in the middle of the game.
+
+Run with:
+    python -m dash_turtle_game.fake_robot [--reconnect]
+"""
+from argparse import Namespace
+from collections import Counter
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable
+
+# Sensor packet period the measurement assumes, and how long a write takes.
+PACKET_SEC = 0.05
+WRITE_SEC = 0.002
+# Made up BLE timings for the fake link: a scan for the best bot, finding a
+# bot by name, and connecting to it.
+SCAN_SEC = 3.0
+FIND_SEC = 0.2
+CONNECT_SEC = 0.5
+
+
+class _FakeComponent:
+    def __init__(self, robot: "FakeWWRobot", name: str) -> None:
+        self._robot = robot
+        self._name = name
+
+    def __getattr__(self, attr: str) -> Callable[..., None]:
+        if not attr.startswith('stage_'):
+            raise AttributeError(attr)
+
+        def stage(*args, **kwargs):
+            self._robot.writes[f"{self._name}.{attr}"] += 1
+            if attr == 'stage_pose' and len(args) == 4:
+                # A global pose, the bot is there at once.
+                self._robot.move_to(*args[:3])
+            if self._robot.write_sec > 0:
+                time.sleep(self._robot.write_sec)
+        return stage
+
+
+class _FakeCommands:
+    def __init__(self, robot: "FakeWWRobot") -> None:
+        self.body = _FakeComponent(robot, 'body')
+        self.RGB = _FakeComponent(robot, 'RGB')
+        self.media = _FakeComponent(robot, 'media')
+        self.monoLED = _FakeComponent(robot, 'monoLED')
+
+
+class FakeWWRobot:
+    def __init__(self, write_sec: float = 0.0, name: str = 'Fake Dash',
+                 pose: tuple[float, float, float] = (0.0, 0.0, 0.0)) -> None:
+        self.write_sec = write_sec
+        self.name = name
+        self.writes: Counter[str] = Counter()
+        self.commands = _FakeCommands(self)
+        # Always idle, and nothing in front.
+        self.sensors = SimpleNamespace(
+            pose=SimpleNamespace(x=0.0, y=0.0, degrees=0.0, watermark_inferred=255),
+            distance_front_left_facing=SimpleNamespace(reflectance=0.0),
+            distance_front_right_facing=SimpleNamespace(reflectance=0.0),
+        )
+        self.move_to(*pose)
+
+    def move_to(self, x: float, y: float, degrees: float):
+        self.sensors.pose.x = x
+        self.sensors.pose.y = y
+        self.sensors.pose.degrees = degrees
+
+
+class FakeTransport:
+    """
+    Stand-in for `WonderPy.core.wwMain`, with one fake bot in range.
+
+    A connection waits out a whole `scan_sec` scan for the best bot, unless
+    it asks for the bot by name with `connect_eager`, which takes `find_sec`.
+    Each connection gets a new `FakeWWRobot`, at the pose the last one was
+    left at, like the real bot's odometry.
+    """
+
+    def __init__(self, name: str = 'Fake Dash', pose: tuple[float, float, float] = (0.0, 0.0, 0.0),
+                 scan_sec: float = SCAN_SEC, find_sec: float = FIND_SEC, connect_sec: float = CONNECT_SEC) -> None:
+        self.name = name
+        self.pose = pose
+        self.scan_sec = scan_sec
+        self.find_sec = find_sec
+        self.connect_sec = connect_sec
+        self.scans = 0
+        self.robot: FakeWWRobot | None = None
+        self._stop = threading.Event()
+        self._quiet = threading.Event()
+
+    def start(self, delegate_instance: Any, arguments: Namespace | None = None):
+        self._stop.clear()
+        self._quiet.clear()
+        named = (
+            arguments is not None
+            and arguments.connect_eager
+            and self.name in (arguments.connect_name or ())
+        )
+        if not named:
+            self.scans += 1
+        if self._stop.wait(self.find_sec if named else self.scan_sec) or self._stop.wait(self.connect_sec):
+            return
+        if self.robot is not None:
+            self.pose = (self.robot.sensors.pose.x, self.robot.sensors.pose.y, self.robot.sensors.pose.degrees)
+        self.robot = FakeWWRobot(name=self.name, pose=self.pose)
+        delegate_instance.on_connect(self.robot)
+        while not self._stop.wait(PACKET_SEC):
+            if not self._quiet.is_set():
+                delegate_instance.on_sensors(self.robot)
+
+    def stall(self):
+        """Stop sending packets without ending the link, like a bot out of range."""
+        self._quiet.set()
+
+    def stop(self):
+        self._stop.set()
+
+
+class _Unscheduled:
+    """Sends each command as it's submitted, like before the scheduler."""
+
+    def submit(self, actuator: Any, value: Any, send: Callable[[], None]):
+        send()
+
+    def flush(self):
+        pass
+
+
+if __name__ == "__main__":
+    import argparse
+    from dataclasses import replace
+    import random
+    import tempfile
+
+    from .bot_interface import RobotControl, RobotInterface
+    from .constants import BotSounds, CmdEvent, SensorData
+    from .main import SENSOR_TIMEOUT_SEC, SETTINGS, SystemControl, robot_ctrl
+    from .map_state import ConnectionState
+    from .outbound import CommandScheduler
+    from .timeline import Timeline, celebration, crash_flash
+
+    def play(scheduler) -> tuple[FakeWWRobot, float]:
+        robot = FakeWWRobot(WRITE_SEC)
+        sensors = SensorData(0.0, 0.0, 0.0, True, 0.0, 0.0)
+        ctrl = RobotControl(robot, sensors, SETTINGS, scheduler)  # type: ignore[arg-type]
+        effects = Timeline(ctrl.apply_effect)
+        control_sec = 0.0
+        for packet in range(int(60 / PACKET_SEC)):
+            now = packet * PACKET_SEC
+            scheduler.flush()
+            start = time.perf_counter()
+            ctrl.update_sensors(sensors)
+            effects.tick(now)
+            if packet == 0:
+                ctrl.set_bot_rgb()
+            elif packet % 40 == 0:
+                ctrl.set_main_button_led(False)
+                if packet % 120 == 0:
+                    ctrl.forward()
+                else:
+                    ctrl.turn(packet % 80 == 0)
+            elif packet % 40 == 30:
+                ctrl.set_main_button_led(True)
+                ctrl.set_bot_rgb()
+            if packet == 600:
+                ctrl.do_celebrate()
+                effects.play(celebration(random.Random(0)), now)
+            elif packet == 650:
+                ctrl.stop()
+                ctrl.forward(reverse=True)
+                ctrl.play_sound(BotSounds.NO_WAY)
+                effects.cancel()
+                effects.play(crash_flash(), now)
+            control_sec += time.perf_counter() - start
+        scheduler.flush()
+        return robot, control_sec
+
+    def measure_writes():
+        direct, direct_sec = play(_Unscheduled())
+        scheduler = CommandScheduler()
+        batched, batched_sec = play(scheduler)
+        print(f"Staged right away: {sum(direct.writes.values())} writes, {direct_sec * 1e3:.1f}ms blocking the controller")
+        print(f"Scheduled:         {sum(batched.writes.values())} writes, {batched_sec * 1e3:.1f}ms blocking the controller")
+        for name in sorted(direct.writes):
+            print(f"  {name:24} {direct.writes[name]:4} -> {batched.writes[name]:4}")
+        print(scheduler.metrics())
+
+    def wait_for(condition: Callable[[], bool], timeout: float = 30.0):
+        deadline = time.perf_counter() + timeout
+        while not condition():
+            if time.perf_counter() > deadline:
+                raise TimeoutError()
+            time.sleep(0.005)
+
+    def play_connected(name_dir: str, drop: bool) -> list[str]:
+        """Connect, drive a tile, and if `drop`, go quiet and wait for the reconnect."""
+        conf = replace(SETTINGS, MQTT_BROKER_ADDR=None, HEADLESS=True, START_THETA=270,
+                       PRELOAD_BOT_INTERFACE=False, ASSET_CACHE_DIR=None, ROBOT_NAME_PATH=f"{name_dir}/robot_name")
+        sys_ctrl = SystemControl(conf)
+        game_gui = sys_ctrl.game_gui
+        transport = FakeTransport(pose=(40.0, -25.0, 17.0))
+        bot_intr = RobotInterface(game_gui.get_updated_settings(), transport)
+        sys_ctrl.bot_intr = bot_intr
+        state = lambda: game_gui.get_snapshot().connected_state
+        report = []
+        ctrl_thread = threading.Thread(target=robot_ctrl, args=(sys_ctrl,))
+        link_thread = threading.Thread(target=bot_intr.run)
+        try:
+            start = time.perf_counter()
+            ctrl_thread.start()
+            link_thread.start()
+            wait_for(lambda: state() == ConnectionState.CONNECTED)
+            how = "scanning" if transport.scans else "to the remembered bot"
+            report.append(f"Connect {how:22}: {time.perf_counter() - start:.2f}s")
+            if drop:
+                game_gui.window_channel.put_nowait(CmdEvent.UP)
+                wait_for(lambda: int(game_gui.get_snapshot().turtle_pose.y) == conf.START_TILE[1] - 1)
+                before = game_gui.get_snapshot().turtle_pose
+                start = time.perf_counter()
+                transport.stall()
+                wait_for(lambda: state() == ConnectionState.CONNECTING)
+                wait_for(lambda: state() == ConnectionState.CONNECTED)
+                report.append(f"Reconnect after going quiet   : {time.perf_counter() - start:.2f}s, "
+                              f"{SENSOR_TIMEOUT_SEC:.1f}s of it noticing, "
+                              f"{bot_intr.connection.reconnect_sec[-1]:.2f}s relinking, {transport.scans} scans")
+                time.sleep(0.2)
+                after = game_gui.get_snapshot().turtle_pose
+                report.append(f"Turtle before the drop {before}")
+                report.append(f"Turtle after reconnect {after}")
+        finally:
+            game_gui.window_channel.put_nowait(CmdEvent.TOGGLE_CONNECT)
+            ctrl_thread.join()
+            link_thread.join()
+            sys_ctrl.bot_intr = None
+            sys_ctrl.stop()
+        return report
+
+    def measure_reconnect():
+        with tempfile.TemporaryDirectory() as name_dir:
+            report = play_connected(name_dir, drop=False) + play_connected(name_dir, drop=True)
+        print("\n".join(report))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--reconnect', action='store_true', help='time connecting over a fake link')
+    if parser.parse_args().reconnect:
+        measure_reconnect()
+    else:
+        measure_writes()
@@ -0,0 +1,141 @@
+"""
+Drive several bots on the same map from one process.
+
+Each bot in `Settings.FLEET` gets its own `RobotInterface` and `robot_ctrl`
+worker, and takes commands from its own MQTT topics, prefixed with the bot's
+name. The first bot also takes commands from the window and runs the card
+queue. All of them are drawn on the shared map in their LED color, and they
+reserve tiles before moving into them so they never drive into each other.
+
+Run with:
+    python -m dash_turtle_game.fleet
+"""
+from dataclasses import replace
+from threading import Thread
+from typing import TYPE_CHECKING
+
+from .constants import BotConfig, DimType, Settings
+from .main import SETTINGS, SystemControl, get_robot_interface, robot_ctrl
+from .map_state import ConnectionState
+from .mqtt_client import MQTTCommandClient
+
+if TYPE_CHECKING:
+    from .planner import CardPlanner
+
+FLEET_COLORS = (
+    (0.0, 0.6, 1.0),
+    (1.0, 0.3, 0.3),
+    (0.3, 1.0, 0.3),
+    (1.0, 0.8, 0.0),
+    (0.8, 0.3, 1.0),
+    (0.0, 1.0, 0.9),
+    (1.0, 0.5, 0.0),
+    (1.0, 0.4, 0.8),
+)
+
+
+def make_fleet(starts: list[tuple[DimType, float]]) -> tuple[BotConfig, ...]:
+    """Bots named dash1, dash2, ... at the given start tiles and headings."""
+    return tuple(
+        BotConfig(f"dash{i + 1}", tile, theta, FLEET_COLORS[i % len(FLEET_COLORS)])
+        for i, (tile, theta) in enumerate(starts)
+    )
+
+
+class FleetBot:
+    """The parts of `SystemControl` that `robot_ctrl` uses, for one bot of a fleet."""
+
+    def __init__(self, fleet: "FleetControl", index: int, mqtt_client: MQTTCommandClient | None) -> None:
+        self.fleet = fleet
+        self.index = index
+        self.conf = fleet.conf
+        self.game_gui = fleet.game_gui
+        self.mqtt_client = mqtt_client
+        self.bot_intr = None
+        self.queue_result = None
+
+    @property
+    def planner(self) -> "CardPlanner | None":
+        # Planned routes fill the card queue, which belongs to the first bot.
+        return self.fleet.planner if self.index == 0 else None
+
+    def stop(self):
+        self.fleet.stop()
+
+
+class FleetControl(SystemControl):
+    """
+    `SystemControl` for a fleet. Connecting connects every bot, and the fleet
+    disconnects when the first bot does.
+    """
+
+    def __init__(self, conf: Settings) -> None:
+        if not conf.FLEET:
+            raise ValueError("A fleet needs at least one bot in Settings.FLEET")
+        if not conf.USE_SIM_BOT:
+            # WonderPy runs a single connection loop per process.
+            raise ValueError("Fleets are only supported with the simulated bot")
+        super().__init__(conf)
+        # The first bot shares the client connecting the fleet.
+        self.bots: list[FleetBot] = [FleetBot(self, 0, self.mqtt_client)]
+        for index, bot_conf in enumerate(conf.FLEET[1:], start=1):
+            mqtt_client = None
+            if conf.MQTT_BROKER_ADDR:
+                mqtt_client = MQTTCommandClient(conf.MQTT_BROKER_ADDR, topic_prefix=f"{bot_conf.name}/")
+                mqtt_client.connect()
+            self.bots.append(FleetBot(self, index, mqtt_client))
+
+    def run_session(self):
+        interface = get_robot_interface(self.conf)
+        threads = []
+        for bot in self.bots:
+            bot.bot_intr = interface(self.game_gui.get_updated_settings(bot.index))
+            threads.append(Thread(target=robot_ctrl, args=(bot, bot.index)))
+        lead = self.bots[0]
+        self.bot_intr = lead.bot_intr
+        for bot in self.bots[1:]:
+            threads.append(Thread(target=bot.bot_intr.run))
+        for thread in threads:
+            thread.start()
+
+        # This blocks until the connection to the first bot is ended.
+        lead.bot_intr.run()
+        for bot in self.bots:
+            bot.bot_intr.stop()
+        for thread in threads:
+            thread.join()
+        self.bot_intr = None
+        self.queue_result = lead.queue_result
+
+        for bot in self.bots:
+            bot.bot_intr = None
+            with self.game_gui.edit_map(bot.index) as map_edit:
+                map_edit.connected_state = ConnectionState.IDLE
+                map_edit.center_turtle()
+
+    def stop(self):
+        # The first bot's interface and MQTT client are stopped as the fleet's.
+        for bot in self.bots[1:]:
+            if bot.bot_intr is not None:
+                bot.bot_intr.stop()
+            if bot.mqtt_client is not None:
+                bot.mqtt_client.disconnect()
+        super().stop()
+
+
+FLEET_SETTINGS = replace(
+    SETTINGS,
+    USE_SIM_BOT=True,
+    MAP_SIZE_TILES=(8, 8),
+    TILE_SIZE_PIXELS=96,
+    GOAL_TILE=(4, 0),
+    FLEET=make_fleet([((x, 7), 270) for x in range(8)]),
+)
+
+
+def main():
+    FleetControl(FLEET_SETTINGS).main()
+
+
+if __name__ == "__main__":
+    main()
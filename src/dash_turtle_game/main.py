@@ -1,10 +1,22 @@
+from .startup import STARTUP
+
+from queue import Empty
+import random
 import time
 from threading import Thread
+from typing import TYPE_CHECKING
 
+from .channels import BoundedChannel, ChannelSelector
 from .map import ConnectionState, GameManager
-from .constants import CmdEvent, TileType, Settings, BotSounds
-from .mqtt_client import MQTTCommandClient
-from .card_gui import event_to_card, card_to_event
+from .constants import CmdEvent, QueueResult, SensorData, TileType, Settings, BotSounds, TurtlePose
+from .compiler import Program, ProgramError, compile_cards, validate
+from .planner import CardPlanner
+from .card_gui import CardType, event_to_card, card_to_event
+from .recorder import RECORDER
+from .timeline import CELEBRATION, Timeline, celebration, crash_flash
+from .tracing import TRACER, CommandTrace
+
+STARTUP.mark("imports", since_start=True)
 
 SETTINGS = Settings(
     START_TILE=(3, 5),
@@ -22,17 +34,38 @@ SETTINGS = Settings(
     BOT_CONNECT_TIMEOUT_SEC=10.0,
     USE_SIM_BOT=False,
 )
+# The bot is reconnected to if no sensor packet arrives for this long.
+SENSOR_TIMEOUT_SEC = 1.0
+# Packets a move waits for when the IR readings of the tile in front disagree.
+MAX_EVIDENCE_PACKETS = 3
 
-if SETTINGS.USE_SIM_BOT:
-    from .sim_bot_interface import RobotInterface
-else:
+if TYPE_CHECKING:
     from .bot_interface import RobotInterface
+    from .fleet import FleetBot
+    from .mqtt_client import MQTTCommandClient
+
+
+def get_robot_interface(conf: Settings) -> type["RobotInterface"]:
+    # Imported on demand so the simulator runs without WonderPy installed.
+    if conf.USE_SIM_BOT:
+        from .sim_bot_interface import RobotInterface
+    else:
+        from .bot_interface import RobotInterface
+    return RobotInterface
+
+
+def preload_robot_interface(conf: Settings):
+    """Import the bot's interface ahead of the first connect. WonderPy and the BLE libraries take a while."""
+    with STARTUP.stage("bot interface import"):
+        try:
+            get_robot_interface(conf)
+        except ImportError as err:
+            print(f"Can't load the bot interface: {err}")
 
 # TODO:
 # Tune obstacle detection
 # Add command queue with GUI HUD
 # Integrate with RFID cards
-# Handle disconnect gracefully
 
 
 # Coordinates notes:
@@ -47,101 +80,260 @@ else:
 #
 
 
+def take_commands(window_channel: BoundedChannel[CmdEvent] | None, mqtt_client: "MQTTCommandClient | None") -> list[CommandTrace]:
+    """Drain the window and MQTT commands, in arrival order per source, with their traces."""
+    traces = []
+    if window_channel is not None:
+        traces += [TRACER.begin(cmd, 'window', stamp) for stamp, cmd in window_channel.drain_stamped()]
+    if mqtt_client is not None:
+        traces += [TRACER.begin(cmd, 'mqtt', stamp) for stamp, cmd in mqtt_client.channel.drain_stamped()]
+    dequeue_stamp = time.perf_counter()
+    for trace in traces:
+        trace.mark('dequeue', dequeue_stamp)
+    return traces
+
+
+def wait_for_packet(sys_ctrl: "SystemControl | FleetBot", bot_inter: "RobotInterface",
+                    window_channel: BoundedChannel[CmdEvent] | None,
+                    timeout_sec: float) -> tuple[float, SensorData | None] | None:
+    """
+    Wait for a sensor packet, while still taking Quit and Disconnect from the
+    window. None if the session ended instead.
+    """
+    start_time = time.time()
+    selector = ChannelSelector([bot_inter.sensor_queue, window_channel])
+    try:
+        while True:
+            selector.wait(timeout=max(0.0, start_time + timeout_sec - time.time()))
+            try:
+                return bot_inter.sensor_queue.get_stamped(block=False)
+            except Empty:
+                if time.time() - start_time > timeout_sec:
+                    print("Timed out waiting for robot")
+                    bot_inter.stop()
+                    return None
+            events = list(window_channel.drain()) if window_channel is not None else []
+            if CmdEvent.QUIT in events:
+                sys_ctrl.stop()
+                return None
+            elif CmdEvent.TOGGLE_CONNECT in events:
+                bot_inter.stop()
+                return None
+    finally:
+        selector.close()
+
+
+def tiles_from(pose: TurtlePose, tile: tuple[int, int]) -> int:
+    return abs(int(pose.x) - tile[0]) + abs(int(pose.y) - tile[1])
+
+
+def straight_run(game_gui: GameManager, program: Program, index: int, x: int, y: int, dx: int, dy: int,
+                 bot: int = 0) -> int:
+    """
+    How many UP moves from `program` position `index` can be driven as one
+    motion from tile (x, y) in direction (dx, dy), reserving the tiles they cross.
+
+    The tile in front must already be checked. A run ends at the goal, so
+    the bot stops there to celebrate.
+    """
+    snapshot = game_gui.get_snapshot()
+    occupancy = game_gui.state.occupancy
+    run = 1
+    while index + run < len(program) and program.op(index + run) == CardType.UP:
+        if (x + dx * run, y + dy * run) == snapshot.goal_tile:
+            break
+        next_x, next_y = x + dx * (run + 1), y + dy * (run + 1)
+        if (
+            not snapshot.grid.is_valid(next_x, next_y)
+            or snapshot.grid.type_at(next_x, next_y) == TileType.BLOCKED
+            or occupancy.leans_blocked(next_x, next_y)
+            or not game_gui.reserve_tile(next_x, next_y, bot)
+        ):
+            break
+        run += 1
+    return run
+
+
 # Can write this as either asyncio, or Thread. With asyncio, I can be sure
 # that the context won't switch while using a piece of data, but I can't
 # call the blocking WWRobot functions. To keep things simple, I'll keep it
 # multithreaded.
-def robot_ctrl(sys_ctrl: "SystemControl"):
+#
+# In a fleet, `bot` is the index of the bot driven. Only the first bot takes
+# commands from the window, the others only from their own MQTT topics.
+def robot_ctrl(sys_ctrl: "SystemControl | FleetBot", bot: int = 0):
     assert sys_ctrl.bot_intr is not None
 
     bot_inter = sys_ctrl.bot_intr
+    conf = sys_ctrl.conf
     game_gui = sys_ctrl.game_gui
     mqtt_client = sys_ctrl.mqtt_client
-
-    start_time = time.time()
-    sensors = None
-
-    while True:
-        try:
-            sensors = bot_inter.sensor_queue.get(timeout=0.1)
-            break
-        except:
-            if time.time() - start_time > SETTINGS.BOT_CONNECT_TIMEOUT_SEC:
-                print("Timed out waiting for robot")
-                bot_inter.stop()
-                return
-        events = list(game_gui.get_window_events())
-        if CmdEvent.QUIT in events:
-            sys_ctrl.stop()
-            return
-        elif CmdEvent.TOGGLE_CONNECT in events:
-            bot_inter.stop()
-            return
-
+    window_channel = game_gui.window_channel if bot == 0 else None
+    # Set when the card queue holds a planned route, which is replanned
+    # around tiles found blocked on the way.
+    planner = sys_ctrl.planner
+    if planner is not None and planner.goal != game_gui.get_snapshot().goal_tile:
+        # The goal was moved since the route was planned.
+        planner = None
+
+    packet = wait_for_packet(sys_ctrl, bot_inter, window_channel, conf.BOT_CONNECT_TIMEOUT_SEC)
+    if packet is None:
+        return
+    packet_stamp, sensors = packet
     if sensors is None or bot_inter.robot_ctrl is None:
         print("Robot interface terminated")
         return
 
-    with game_gui.get_map() as locked_map:
-        locked_map.connected_state = ConnectionState.CONNECTED
+    with game_gui.edit_map(bot) as map_edit:
+        map_edit.connected_state = ConnectionState.CONNECTED
 
     robot_ctrl = bot_inter.robot_ctrl
+    robot_ctrl.bot = bot
+    RECORDER.session(bot_inter.conf, list(game_gui.get_snapshot().cards) if bot == 0 else [], bot)
+    RECORDER.sensors(sensors, packet_stamp, bot)
 
     # robot.commands.body.do_forward(10, 3)
     robot_ctrl.set_bot_rgb()
     last_print = time.time()
+    # LED and sound effects, advanced with every packet.
+    effects = Timeline(robot_ctrl.apply_effect)
+    effects_rng = random.Random(conf.SIM_SEED)
 
     celebrated = False
     last_idle = False
     moving_forward = False
+    # Queue position of the first card of the straight run being driven, and
+    # the tile and direction it started from.
+    run_index = -1
+    run_start: tuple[int, int] = (0, 0)
+    run_step: tuple[int, int] = (0, 0)
 
     running_queued_cmds = False
+    # Moves compiled from the card queue, `queued_index` is the one running.
+    program = compile_cards([])
     queued_index = -1
-    with game_gui.get_map() as locked_map:
-        if len(locked_map.card_widget.cards) > 0:
-            running_queued_cmds = True
-            locked_map.card_widget.set_active(0)
+    sys_ctrl.queue_result = None
+    with game_gui.edit_map(bot) as map_edit:
+        # The card queue belongs to the first bot.
+        if bot == 0 and len(map_edit.cards) > 0:
+            try:
+                program = compile_cards(map_edit.cards)
+                running_queued_cmds = True
+                map_edit.set_active(0)
+            except ProgramError as err:
+                print(err)
+
+    # Wakes on a sensor packet or a command, whichever comes first.
+    selector = ChannelSelector([
+        bot_inter.sensor_queue,
+        window_channel,
+        mqtt_client.channel if mqtt_client is not None else None,
+    ])
+    last_packet_time = time.time()
+    # Set once a command is sent, until a packet shows the bot's response.
+    awaiting_packet = False
+    # A move waiting for more readings of the tile in front, and its trace.
+    retry_move = False
+    retry_trace: CommandTrace | None = None
+    evidence_packets = 0
 
     try:
         while True:
+            # Commands that arrive between packets are handled right away
+            # with the last packet, unless it predates the last command sent.
+            # Then they wait for the next packet.
+            if not awaiting_packet:
+                selector.wait(timeout=SENSOR_TIMEOUT_SEC)
+            packet = None
             try:
-                sensors = bot_inter.sensor_queue.get(timeout=1)
-            except:
-                bot_inter.stop()
-                return
+                packet = bot_inter.sensor_queue.get_stamped(block=awaiting_packet, timeout=SENSOR_TIMEOUT_SEC)
+            except Empty:
+                if awaiting_packet or time.time() - last_packet_time > SENSOR_TIMEOUT_SEC:
+                    # Keep the session, and the bot's start pose, over a new link.
+                    with game_gui.edit_map(bot) as map_edit:
+                        map_edit.connected_state = ConnectionState.CONNECTING
+                    bot_inter.reconnect()
+                    packet = wait_for_packet(sys_ctrl, bot_inter, window_channel, conf.RECONNECT_TIMEOUT_SEC)
+                    if packet is None:
+                        return
+                    if packet[1] is not None:
+                        with game_gui.edit_map(bot) as map_edit:
+                            map_edit.connected_state = ConnectionState.CONNECTED
+                        robot_ctrl.set_bot_rgb()
+            if packet is not None:
+                packet_stamp, sensors = packet
+                last_packet_time = time.time()
+                awaiting_packet = False
+                if sensors is not None:
+                    TRACER.on_sensors(sensors.is_idle, packet_stamp, key=bot)
+                    RECORDER.sensors(sensors, packet_stamp, bot)
 
             if sensors is None:
                 print("Robot interface terminated")
                 return
             robot_ctrl.update_sensors(sensors)
+            effects.tick(robot_ctrl.clock())
 
             if last_idle and not sensors.is_idle:
                 robot_ctrl.set_main_button_led(False)
             elif not last_idle and sensors.is_idle:
                 robot_ctrl.set_main_button_led(True)
                 moving_forward = False
+                run_index = -1
             last_idle = sensors.is_idle
 
             if moving_forward:
                 if (
                     sensors.distance_front_left_facing
-                    > SETTINGS.CRASH_DETECTION_THRESHOLD
+                    > conf.CRASH_DETECTION_THRESHOLD
                     or sensors.distance_front_right_facing
-                    > SETTINGS.CRASH_DETECTION_THRESHOLD
+                    > conf.CRASH_DETECTION_THRESHOLD
                 ):
                     moving_forward = False
                     robot_ctrl.stop()
-                    robot_ctrl.forward(reverse=True)
+                    # Back off to the tile before the one the bot got to.
+                    run_tiles = queued_index - run_index + 1 if run_index >= 0 else 1
+                    crossed = tiles_from(robot_ctrl.get_pose(), run_start)
+                    robot_ctrl.forward(reverse=True, tiles=run_tiles - max(crossed - 1, 0))
+                    run_index = -1
+                    awaiting_packet = True
                     robot_ctrl.play_sound(BotSounds.NO_WAY)
+                    effects.cancel()
+                    effects.play(crash_flash(), robot_ctrl.clock())
+                    if running_queued_cmds:
+                        sys_ctrl.queue_result = QueueResult.CRASHED
                     running_queued_cmds = False
+                elif run_index >= 0:
+                    # Watch the tile ahead of a run. If it turns out blocked,
+                    # end the run at the tile the bot is on, and let the
+                    # queue check the next card from there.
+                    pose = robot_ctrl.get_pose()
+                    crossed = tiles_from(pose, run_start)
+                    run_tiles = queued_index - run_index + 1
+                    if crossed < run_tiles:
+                        with game_gui.edit_map(bot) as map_edit:
+                            ahead = map_edit.observe_ir(
+                                run_start[0] + run_step[0] * (crossed + 1),
+                                run_start[1] + run_step[1] * (crossed + 1),
+                                sensors.distance_front_left_facing,
+                                sensors.distance_front_right_facing,
+                            )
+                        if ahead == TileType.BLOCKED:
+                            print(f"Obstacle ahead, ending run after {crossed} tiles")
+                            # The bot is less than a tile from there.
+                            robot_ctrl.forward(reverse=True, tiles=run_tiles - crossed, move_time=conf.FORWARD_TIME)
+                            awaiting_packet = True
+                            queued_index = run_index + crossed - 1
+                            run_start = (int(pose.x), int(pose.y))
+                            run_index = -1
 
             map_pose = robot_ctrl.get_pose()
             map_x = int(map_pose.x)
             map_y = int(map_pose.y)
 
             if (
-                map_x >= SETTINGS.MAP_SIZE_TILES[0]
-                or map_y >= SETTINGS.MAP_SIZE_TILES[1]
+                map_x >= conf.MAP_SIZE_TILES[0]
+                or map_y >= conf.MAP_SIZE_TILES[1]
                 or map_x < 0
                 or map_y < 0
             ):
@@ -152,14 +344,21 @@ def robot_ctrl(sys_ctrl: "SystemControl"):
                 exit(1)
                 continue
 
-            with game_gui.get_map() as locked_map:
-                locked_map.set_all_tiles_unobserved()
-                locked_map.turtle_pose = map_pose
-                locked_map.set_observed_tile(map_x, map_y, TileType.EMPTY)
-
-            new_cmds = list(game_gui.get_window_events())
-            if mqtt_client is not None:
-                new_cmds += list(mqtt_client.get_messages())
+            with game_gui.edit_map(bot) as map_edit:
+                map_edit.set_all_tiles_unobserved()
+                map_edit.turtle_pose = map_pose
+                map_edit.visit_tile(map_x, map_y)
+                if run_index >= 0:
+                    # Highlight the card of the tile being crossed.
+                    crossed = tiles_from(map_pose, run_start)
+                    map_edit.set_active(program.source(run_index + min(crossed, queued_index - run_index)))
+            if planner is not None:
+                planner.set_tile(map_x, map_y, False)
+
+            traces = take_commands(window_channel, mqtt_client)
+            new_cmds = [trace.cmd for trace in traces]
+            for trace in traces:
+                RECORDER.command(trace.cmd, trace.source, trace.stamps['source'], bot)
 
             if CmdEvent.QUIT in new_cmds:
                 sys_ctrl.stop()
@@ -169,40 +368,69 @@ def robot_ctrl(sys_ctrl: "SystemControl"):
                 return
 
             requested_move = False
+            # Set once the command is handed to the bot.
+            sent = False
             cur_cmd = CmdEvent.NONE
-            if running_queued_cmds:
+            cur_trace: CommandTrace | None = None
+            if retry_move:
+                retry_move = False
+                cur_cmd = CmdEvent.UP
+                cur_trace = retry_trace
+            elif running_queued_cmds:
                 if sensors.is_idle:
-                    with game_gui.get_map() as locked_map:
+                    with game_gui.edit_map(bot) as map_edit:
                         queued_index += 1
-                        if len(locked_map.card_widget.cards) <= queued_index:
+                        if len(program) <= queued_index:
                             print("Queue Complete")
+                            sys_ctrl.queue_result = QueueResult.COMPLETE
                             running_queued_cmds = False
                         else:
-                            locked_map.card_widget.set_active(queued_index)
-                            cur_cmd = card_to_event(locked_map.card_widget.cards[queued_index])
+                            map_edit.set_active(program.source(queued_index))
+                            cur_cmd = card_to_event(program.op(queued_index))
+                            cur_trace = TRACER.begin(cur_cmd, 'card_queue')
                             print(f"{cur_cmd.name} from queue")
             elif len(new_cmds) > 0:
-                if not sensors.is_idle:
+                spinning = effects.is_playing(CELEBRATION) and not sensors.is_idle
+                effects.cancel()
+                if spinning:
+                    # Stop celebrating and turn back, the command can be sent again after.
+                    print("Celebration cancelled")
+                    robot_ctrl.stop()
+                    robot_ctrl.face_heading()
+                    awaiting_packet = True
+                elif not sensors.is_idle:
                     print("Wait for previous command to complete.")
                     robot_ctrl.play_sound(BotSounds.SIGH)
                 else:
                     # Only handle first event if multiple received in same update.
                     cur_cmd = new_cmds[0]
+                    cur_trace = traces[0]
+            for trace in traces:
+                if trace is not cur_trace:
+                    TRACER.finish(trace)
+            if cur_trace is not None:
+                cur_trace.mark('decision')
 
             if cur_cmd in (CmdEvent.LEFT, CmdEvent.RIGHT):
                 turn_clockwise = cur_cmd == CmdEvent.RIGHT
-                robot_ctrl.turn(turn_clockwise)
+                # The trace is stamped when the turn is staged on the bot.
+                robot_ctrl.turn(turn_clockwise, cur_trace)
+                awaiting_packet = True
+                sent = True
             elif cur_cmd == CmdEvent.UP:
                 requested_move = True
 
             if sensors.is_idle:
+                # Let go of the tile the last move started from.
+                game_gui.hold_tile(map_x, map_y, bot)
                 if (
                     not celebrated
                     and game_gui.get_tile(map_x, map_y).type == TileType.GOAL
                 ):
-                    # This blocks the GUI, should probably not, but not a huge issue.
                     robot_ctrl.do_celebrate()
+                    effects.play(celebration(effects_rng), robot_ctrl.clock())
                     celebrated = True
+                    awaiting_packet = True
 
                 if map_pose.theta < 45 or map_pose.theta > (360 - 45):
                     front_x = map_x + 1
@@ -219,41 +447,87 @@ def robot_ctrl(sys_ctrl: "SystemControl"):
 
                 looking_off_map = (
                     front_x < 0
-                    or front_x >= SETTINGS.MAP_SIZE_TILES[0]
+                    or front_x >= conf.MAP_SIZE_TILES[0]
                     or front_y < 0
-                    or front_y >= SETTINGS.MAP_SIZE_TILES[1]
+                    or front_y >= conf.MAP_SIZE_TILES[1]
                 )
 
-                if not looking_off_map:
-                    with game_gui.get_map() as locked_map:
-                        if (
-                            sensors.distance_front_left_facing
-                            > SETTINGS.FRONT_DETECTION_THRESHOLD
-                            and sensors.distance_front_right_facing
-                            > SETTINGS.FRONT_DETECTION_THRESHOLD
-                        ):
-                            locked_map.set_observed_tile(
-                                front_x, front_y, TileType.BLOCKED
-                            )
-                        else:
-                            locked_map.set_observed_tile(
-                                front_x, front_y, TileType.EMPTY
-                            )
+                # Another bot in front would read as an obstacle.
+                if not looking_off_map and not game_gui.is_reserved_by_other(front_x, front_y, bot):
+                    with game_gui.edit_map(bot) as map_edit:
+                        front_type = map_edit.observe_ir(
+                            front_x,
+                            front_y,
+                            sensors.distance_front_left_facing,
+                            sensors.distance_front_right_facing,
+                        )
+                    if planner is not None:
+                        planner.set_tile(front_x, front_y, front_type == TileType.BLOCKED)
 
                 if requested_move:
                     if looking_off_map:
                         print("Move off map")
                         robot_ctrl.play_sound(BotSounds.NO_WAY)
+                        if running_queued_cmds:
+                            sys_ctrl.queue_result = QueueResult.OFF_MAP
                         running_queued_cmds = False
+                    elif (
+                        evidence_packets < MAX_EVIDENCE_PACKETS
+                        and game_gui.state.occupancy.leans_blocked(front_x, front_y)
+                    ):
+                        evidence_packets += 1
+                        retry_move = True
+                        retry_trace = cur_trace
+                        awaiting_packet = True
                     elif game_gui.get_tile(front_x, front_y).type == TileType.BLOCKED:
                         print("Move blocked")
+                        new_cards = None
+                        if running_queued_cmds and planner is not None:
+                            new_cards = planner.plan(map_pose)
+                        if new_cards is not None:
+                            print(f"Replanned {len(new_cards)} cards, {planner.expanded} states expanded")
+                            with game_gui.edit_map(bot) as map_edit:
+                                first_card = program.source(queued_index)
+                                del map_edit.cards[first_card:]
+                                map_edit.cards.extend(new_cards)
+                                map_edit.set_active(first_card)
+                            program = program.splice(queued_index, new_cards)
+                            # The next idle packet runs the first new card.
+                            queued_index -= 1
+                        else:
+                            robot_ctrl.play_sound(BotSounds.NO_WAY)
+                            if running_queued_cmds:
+                                sys_ctrl.queue_result = QueueResult.BLOCKED
+                            running_queued_cmds = False
+                    elif not game_gui.reserve_tile(front_x, front_y, bot):
+                        print("Move reserved by another bot")
                         robot_ctrl.play_sound(BotSounds.NO_WAY)
+                        if running_queued_cmds:
+                            sys_ctrl.queue_result = QueueResult.BLOCKED
                         running_queued_cmds = False
                     else:
-                        robot_ctrl.forward()
+                        run = 1
+                        if running_queued_cmds:
+                            run = straight_run(game_gui, program, queued_index, map_x, map_y,
+                                               front_x - map_x, front_y - map_y, bot)
+                        if run > 1:
+                            print(f"Driving {run} UP cards as one motion")
+                            run_index = queued_index
+                            queued_index += run - 1
+                        run_start = (map_x, map_y)
+                        run_step = (front_x - map_x, front_y - map_y)
+                        robot_ctrl.forward(tiles=run, trace=cur_trace)
                         moving_forward = True
+                        awaiting_packet = True
+                        sent = True
+
+            if not retry_move:
+                evidence_packets = 0
+            if cur_trace is not None and not retry_move and not sent:
+                # The command was refused, nothing was sent to the bot.
+                TRACER.finish(cur_trace)
 
-            if time.time() - last_print > SETTINGS.TIME_BETWEEN_PRINT_SEC:
+            if time.time() - last_print > conf.TIME_BETWEEN_PRINT_SEC:
                 # print(f'{int(robot.sensors.distance_rear):3},{int(robot.sensors.distance_front_right_facing):3},{int(robot.sensors.distance_front_left_facing):3}')
                 # print(f'{robot.sensors.distance_rear}')
                 # if sensors.is_idle:
@@ -262,73 +536,150 @@ def robot_ctrl(sys_ctrl: "SystemControl"):
                 # print(robot.sensors.distance_front_left_facing, robot.sensors.distance_front_right_facing)
                 print(sensors)
                 print(map_pose)
+                print(f"sensor channel: {bot_inter.sensor_queue.metrics()}")
+                if bot_inter.outbound is not None:
+                    print(f"outbound commands: {bot_inter.outbound.metrics()}")
+                if window_channel is not None:
+                    print(f"window channel: {window_channel.metrics()}")
+                if mqtt_client is not None:
+                    print(f"mqtt channel: {mqtt_client.metrics()}")
                 last_print = time.time()
 
     except KeyboardInterrupt:
         pass
+    finally:
+        selector.close()
+        game_gui.release_tiles(bot)
 
 
 class SystemControl:
-    def __init__(self) -> None:
-        self.mqtt_client: MQTTCommandClient | None = None
-        if SETTINGS.MQTT_BROKER_ADDR:
-            self.mqtt_client = MQTTCommandClient(SETTINGS.MQTT_BROKER_ADDR)
-            self.mqtt_client.connect()
-
-        self.game_gui = GameManager(SETTINGS)
+    def __init__(self, conf: Settings = SETTINGS) -> None:
+        self.conf = conf
+        self.mqtt_client: "MQTTCommandClient | None" = None
+        # Connecting to the broker and loading the bot's interface run while
+        # the window starts.
+        mqtt_thread = None
+        if conf.MQTT_BROKER_ADDR:
+            mqtt_thread = Thread(target=self._connect_mqtt, name="mqtt")
+            mqtt_thread.start()
+        if not conf.USE_SIM_BOT and conf.PRELOAD_BOT_INTERFACE:
+            Thread(target=preload_robot_interface, args=(conf,), name="bot interface", daemon=True).start()
+
+        if conf.RECORD_PATH:
+            RECORDER.open(conf.RECORD_PATH, conf.USE_SIM_BOT)
+        with STARTUP.stage("window"):
+            self.game_gui = GameManager(conf)
+        if mqtt_thread is not None:
+            mqtt_thread.join()
         self.running = True
-        self.bot_intr: RobotInterface | None = None
+        self.bot_intr: "RobotInterface | None" = None
+        # How the last run of queued cards ended.
+        self.queue_result: QueueResult | None = None
+        # Set while the card queue holds a planned route.
+        self.planner: CardPlanner | None = None
+
+    def _connect_mqtt(self):
+        assert self.conf.MQTT_BROKER_ADDR
+        with STARTUP.stage("mqtt connect"):
+            from .mqtt_client import MQTTCommandClient
+            # A fleet is connected through its first bot's topics.
+            prefix = f"{self.conf.FLEET[0].name}/" if self.conf.FLEET else ""
+            self.mqtt_client = MQTTCommandClient(self.conf.MQTT_BROKER_ADDR, topic_prefix=prefix)
+            self.mqtt_client.connect()
 
     def main(self):
+        self.game_gui.wait_first_frame()
+        print(STARTUP.report())
         is_connecting = False
+        selector = ChannelSelector([
+            self.game_gui.window_channel,
+            self.mqtt_client.channel if self.mqtt_client is not None else None,
+        ])
         while self.running:
             try:
                 while not is_connecting:
-                    events = list(self.game_gui.get_window_events())
-                    if self.mqtt_client is not None:
-                        events += list(self.mqtt_client.get_messages())
-                    for event in events:
+                    # Timeout only so Ctrl+C gets a chance to interrupt.
+                    selector.wait(timeout=1.0)
+                    traces = take_commands(self.game_gui.window_channel, self.mqtt_client)
+                    for trace in traces:
+                        event = trace.cmd
                         if event == CmdEvent.TOGGLE_CONNECT:
-                            with self.game_gui.get_map() as locked_map:
-                                locked_map.connected_state = ConnectionState.CONNECTING
-                            is_connecting = True
+                            error = self.check_program()
+                            with self.game_gui.edit_map() as map_edit:
+                                if error is not None:
+                                    # Show the card at fault instead of connecting.
+                                    map_edit.set_active(error.card)
+                                else:
+                                    map_edit.connected_state = ConnectionState.CONNECTING
+                            is_connecting = error is None
                         elif event == CmdEvent.QUIT:
                             raise KeyboardInterrupt()
-                        elif event in (CmdEvent.LEFT, CmdEvent.UP, CmdEvent.RIGHT):
-                            with self.game_gui.get_map() as locked_map:
+                        elif event == CmdEvent.PLAN_ROUTE:
+                            self.plan_route()
+                        elif event in (CmdEvent.LEFT, CmdEvent.UP, CmdEvent.RIGHT, CmdEvent.REPEAT):
+                            self.planner = None
+                            with self.game_gui.edit_map() as map_edit:
                                 card_type = event_to_card(event)
-                                locked_map.card_widget.add_card(card_type)
-                                locked_map.card_widget.set_active(
-                                    len(locked_map.card_widget.cards) - 1
-                                )
+                                map_edit.add_card(card_type)
+                                map_edit.set_active(len(map_edit.cards) - 1)
+                            self.check_program()
                         elif event == CmdEvent.DELETE_LAST_QUEUED:
-                            with self.game_gui.get_map() as locked_map:
-                                num_cards = len(locked_map.card_widget.cards)
+                            self.planner = None
+                            with self.game_gui.edit_map() as map_edit:
+                                num_cards = len(map_edit.cards)
                                 if num_cards > 0:
-                                    locked_map.card_widget.remove_card(num_cards - 1)
-                                    locked_map.card_widget.set_active(
-                                        len(locked_map.card_widget.cards) - 1
-                                    )
-                    time.sleep(0.1)
+                                    map_edit.remove_card(num_cards - 1)
+                                    map_edit.set_active(len(map_edit.cards) - 1)
+                            self.check_program()
+                        trace.mark('decision')
+                        TRACER.finish(trace)
             except KeyboardInterrupt:
                 self.stop()
                 return
 
-            # Get start and goal from map.
-            self.bot_intr = RobotInterface(self.game_gui.get_updated_settings())
-            ctrl_thread = Thread(target=robot_ctrl, args=(self,))
-            ctrl_thread.start()
-
-            # This blocks until the connection to the bot is ended.
-            self.bot_intr.run()
-            self.bot_intr = None
-
-            ctrl_thread.join()
-            with self.game_gui.get_map() as locked_map:
-                locked_map.connected_state = ConnectionState.IDLE
-                locked_map.center_turtle()
+            self.run_session()
             is_connecting = False
 
+    def check_program(self) -> ProgramError | None:
+        """Compile the queued cards and drive them over the known map, printing what stops them."""
+        snapshot = self.game_gui.get_snapshot()
+        try:
+            validate(compile_cards(snapshot.cards), snapshot.grid, snapshot.turtle_pose)
+        except ProgramError as err:
+            print(err)
+            return err
+        return None
+
+    def plan_route(self):
+        """Replace the queued cards with the shortest route to the goal."""
+        snapshot = self.game_gui.get_snapshot()
+        planner = CardPlanner.from_grid(self.conf, snapshot.grid, snapshot.goal_tile)
+        cards = planner.plan(snapshot.turtle_pose)
+        if cards is None:
+            print("No route to the goal")
+            return
+        print(f"Planned {len(cards)} cards")
+        self.planner = planner
+        with self.game_gui.edit_map() as map_edit:
+            map_edit.cards[:] = cards
+            map_edit.set_active(len(cards) - 1)
+
+    def run_session(self):
+        """Connect to the bot and control it until the connection ends."""
+        # Get start and goal from map.
+        self.bot_intr = get_robot_interface(self.conf)(self.game_gui.get_updated_settings())
+        ctrl_thread = Thread(target=robot_ctrl, args=(self,))
+        ctrl_thread.start()
+
+        # This blocks until the connection to the bot is ended.
+        self.bot_intr.run()
+        self.bot_intr = None
+
+        ctrl_thread.join()
+        with self.game_gui.edit_map() as map_edit:
+            map_edit.connected_state = ConnectionState.IDLE
+            map_edit.center_turtle()
+
     def stop(self):
         self.running = False
         if self.bot_intr is not None:
@@ -337,6 +688,12 @@ class SystemControl:
         if self.mqtt_client is not None:
             self.mqtt_client.disconnect()
         self.game_gui.stop()
+        print(self.game_gui.state.write_wait.summary("Map edit wait"))
+        for summary in TRACER.summaries():
+            print(f"Command latency {summary}")
+        if self.conf.LATENCY_TRACE_PATH:
+            TRACER.export(self.conf.LATENCY_TRACE_PATH)
+        RECORDER.close()
 
 
 def main():
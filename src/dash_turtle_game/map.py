@@ -1,16 +1,24 @@
-from enum import Enum, auto
-from queue import Queue
-from typing import Iterable
+from collections import OrderedDict
+from typing import Iterable, NamedTuple
 import threading
-from contextlib import contextmanager
 from dataclasses import replace
 import os
+import time
 
+import numpy as np
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
 import pygame
 
-from .constants import ASSET_DIR, CmdEvent, TileState, TileType, TurtlePose, Settings, DimType
+from .asset_cache import ASSET_CACHE
+from .constants import ASSET_DIR, CmdEvent, cache_path, DimType, TileState, TileType, TurtlePose, Settings
+from .camera import Camera
 from .card_gui import CardQueueWidget
+from .channels import BoundedChannel, ChannelMetrics, OverflowPolicy
+from .map_state import ConnectionState, MapSnapshot, MapStateStore
+from .render_cache import RENDER_CACHE
+from .render_process import RenderProcess
+from .startup import STARTUP
+from .stats import LatencyRecorder
 
 BG_COLOR = pygame.Color("white")
 WINDOW_TITLE = "TurtleBot"
@@ -22,7 +30,15 @@ BUTTON_BORDER_COLOR = pygame.Color("white")
 TEXT_COLOR = pygame.Color("white")
 FOG_COLOR = pygame.Color(0, 0, 0, 100)
 BOTTOM_BAR_HEIGHT = 128
-
+# Input events not consumed by the controller are dropped past this depth.
+EVENT_QUEUE_SIZE = 32
+FRAME_RATE = 30
+# Target edge length of a pre-rendered map chunk.
+CHUNK_PIXELS = 512
+MAX_CACHED_CHUNKS = 64
+# Tile letters are not drawn when zoomed out past this tile size.
+MIN_LABEL_TILE_PIXELS = 24
+BASE_FONT_SIZE = 36
 
 
 TILE_SHEET_OFFSETS = {
@@ -32,290 +48,583 @@ TILE_SHEET_OFFSETS = {
     TileType.GOAL: (3, 2),
 }
 
-class ConnectionState(Enum):
-    IDLE = auto()
-    CONNECTING = auto()
-    CONNECTED = auto()
+
+def load_map_images(tile_size: int) -> dict[str, pygame.Surface]:
+    """
+    The turtle and the tile sheet cells by `TileType` name, and the same
+    scaled to `tile_size`, with a "_scaled" suffix.
+    """
+    def build():
+        turtle = pygame.image.load(TURTLE_IMAGE).convert_alpha()
+        images = {'turtle': turtle, 'turtle_scaled': pygame.transform.scale(turtle, (tile_size, tile_size))}
+        sheet = pygame.image.load(TILE_SHEET).convert_alpha()
+        fw = TILE_SHEET_CELL_SIZE
+        fh = TILE_SHEET_CELL_SIZE
+        for t, index in TILE_SHEET_OFFSETS.items():
+            frame_surf = pygame.Surface((fw, fh), pygame.SRCALPHA)
+            frame_surf.blit(sheet, (0, 0), (index[0] * fw, index[1] * fh, fw, fh))
+            images[t.name] = frame_surf
+            images[f"{t.name}_scaled"] = pygame.transform.scale(frame_surf, (tile_size, tile_size))
+        return images
+
+    params = (tile_size, TILE_SHEET_CELL_SIZE, tuple((t.name, index) for t, index in TILE_SHEET_OFFSETS.items()))
+    return ASSET_CACHE.load('map', (TILE_SHEET, TURTLE_IMAGE), params, build)
+
+
+class ZoomAssets(NamedTuple):
+    """Images scaled for one camera zoom level."""
+    tiles: dict[int, pygame.Surface]  # keyed by TileType value
+    fog: pygame.Surface
+    turtle: pygame.Surface
+    font: pygame.font.Font | None
+
+
+class MapChunk(NamedTuple):
+    """
+    Pre-rendered square of tiles. `background` holds the tile images and
+    letters, `composed` is the background with fog applied.
+    """
+    tiles_x: DimType  # inclusive-exclusive tile range
+    tiles_y: DimType
+    background: pygame.Surface
+    composed: pygame.Surface
 
 class GameManager:
+    """
+    Runs the `GameMap` render loop in its own thread.
+
+    The game state lives in `state`. The control thread edits it with
+    `edit_map`, while the render thread draws from the latest published
+    snapshot, so neither blocks on the other.
+
+    With `conf.HEADLESS` set no render thread is started. The map renders
+    offscreen and frames are only drawn when `render_frame` is called.
+
+    With `conf.RENDER_PROCESS` set the map is drawn by a `RenderProcess`
+    instead of a thread.
+    """
     def __init__(self, conf: Settings) -> None:
         self.conf = conf
+        self.state = MapStateStore(conf)
         self._running = True
-        self._map_lock = threading.Lock()
-        self._map_lock.acquire_lock()
+        self._map_thread: threading.Thread | None = None
+        self._render_process: RenderProcess | None = None
+        # Time the renderer spends drawing each frame.
+        self.frame_times = LatencyRecorder()
+        # Set once the window shows its first frame. Frames drawn on demand or
+        # in another process aren't waited for.
+        self._first_frame = threading.Event()
+        if conf.HEADLESS or conf.RENDER_PROCESS:
+            self._first_frame.set()
+        if conf.HEADLESS:
+            self._map = GameMap(self.conf, self.state)
+            self._event_queue = self._map.event_queue
+            return
+        if conf.RENDER_PROCESS:
+            self._event_queue = BoundedChannel(EVENT_QUEUE_SIZE, OverflowPolicy.DROP_OLDEST)
+            self._render_process = RenderProcess(conf, self.state, self._event_queue, self.frame_times)
+            return
+        self._map_ready = threading.Event()
         self._map_thread = threading.Thread(target=self._game_loop, daemon=True)
         self._map_thread.start()
-        self._clock = pygame.time.Clock()
         # Wait for GameMap init to complete
-        with self._map_lock:
-            pass 
+        self._map_ready.wait()
+        self._event_queue = self._map.event_queue
 
     def _game_loop(self):
-        self._map = GameMap(self.conf)
+        self._map = GameMap(self.conf, self.state)
         # Signal init has completed
-        self._map_lock.release_lock()
+        self._map_ready.set()
+        next_frame = time.perf_counter()
         while self._running:
-            self._clock.tick(30)  # Limit to 30fps
-            with self._map_lock:
-                self._map.Draw()
+            start = time.perf_counter()
+            self._map.Draw()
+            self.frame_times.record(time.perf_counter() - start)
+            if not self._first_frame.is_set():
+                STARTUP.mark("first frame")
+                self._first_frame.set()
+            # Limit to FRAME_RATE, without falling further behind if a frame ran long.
+            next_frame = max(next_frame + 1.0 / FRAME_RATE, time.perf_counter())
+            # Input is handled as it arrives between frames.
+            self._map.handle_input_until(next_frame)
+
+    def render_frame(self):
+        """Draw a single frame. Only valid in headless mode."""
+        assert self.conf.HEADLESS
+        self._map.Draw()
+
+    def wait_first_frame(self, timeout: float | None = None) -> bool:
+        return self._first_frame.wait(timeout)
 
     def get_window_events(self) -> Iterable[CmdEvent]:
-        while self._map.event_queue.qsize() > 0:
-            try:
-                yield self._map.event_queue.get_nowait()
-            except:
-                break
-
-    @contextmanager
-    def get_map(self):
-        with self._map_lock:
-            yield self._map
-    
+        yield from self._event_queue.drain()
+
+    @property
+    def window_channel(self) -> BoundedChannel[CmdEvent]:
+        """Channel the window's commands arrive on, for use with a `ChannelSelector`."""
+        return self._event_queue
+
+    def event_metrics(self) -> ChannelMetrics:
+        return self._event_queue.metrics()
+
+    def edit_map(self, bot: int = 0):
+        """Context manager for an atomic update of the game state, as seen by bot number `bot`."""
+        return self.state.edit(bot)
+
+    def get_snapshot(self) -> MapSnapshot:
+        return self.state.snapshot
+
     def get_tile(self, x, y) -> TileState:
-        return self._map.tiles[x][y]
+        return self.state.get_tile(x, y)
+
+    def get_updated_settings(self, bot: int = 0):
+        return self.state.get_updated_settings(bot)
 
-    def get_updated_settings(self):
-        return self._map.get_updated_settings()
+    def reserve_tile(self, x: int, y: int, bot: int = 0) -> bool:
+        """Reserve a tile for bot number `bot` to move into. False if another bot has it."""
+        return self.state.reservations.reserve(bot, (x, y))
+
+    def hold_tile(self, x: int, y: int, bot: int = 0) -> bool:
+        """Release the tiles bot number `bot` reserved, except the one it is on."""
+        return self.state.reservations.hold_only(bot, (x, y))
+
+    def release_tiles(self, bot: int = 0):
+        self.state.reservations.release(bot)
+
+    def is_reserved_by_other(self, x: int, y: int, bot: int = 0) -> bool:
+        return self.state.reservations.owner((x, y)) not in (None, bot)
 
     def stop(self):
-        # DON"T CALL STOP WHILE HOLDING MAP
+        # DON"T CALL STOP WHILE EDITING MAP
         self._running = False
-        self._map_thread.join()
+        if self._render_process is not None:
+            self._render_process.stop()
+            return
+        if self._map_thread is not None:
+            self._map_thread.join()
         self._map.Stop()
 
 
 class GameMap:
-    def __init__(self, conf: Settings) -> None:
-        pygame.init()
+    def __init__(self, conf: Settings, state: MapStateStore) -> None:
+        self.headless = conf.HEADLESS
+        if self.headless:
+            # Must be set before the display is initialized.
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        # Only what the window uses, the mixer can take long to open on some boards.
+        pygame.display.init()
+        pygame.font.init()
         pygame.display.set_caption(WINDOW_TITLE)
 
-        self.event_queue: Queue[CmdEvent] = Queue()
+        self.event_queue: BoundedChannel[CmdEvent] = BoundedChannel(EVENT_QUEUE_SIZE, OverflowPolicy.DROP_OLDEST)
 
         self.conf = conf
+        self.state = state
+        self.snapshot = state.snapshot
         num_map_tiles=conf.MAP_SIZE_TILES
         tile_size_pixels=conf.TILE_SIZE_PIXELS
 
+        # The map is shown through a viewport no larger than VIEWPORT_MAX_PIXELS.
         self.tile_size = tile_size_pixels
-        self.map_width = self.tile_size * num_map_tiles[0]
-        self.map_height = self.tile_size * num_map_tiles[1]
-        self.font = pygame.font.SysFont(None, 36)
-
-        self.tiles: list[list[TileState]] = []
-        for _ in range(num_map_tiles[0]):
-            col = [TileState(TileType.EMPTY) for _ in range(num_map_tiles[1])]
-            self.tiles.append(col)
+        self.map_width = min(self.tile_size * num_map_tiles[0], conf.VIEWPORT_MAX_PIXELS[0])
+        self.map_height = min(self.tile_size * num_map_tiles[1], conf.VIEWPORT_MAX_PIXELS[1])
+        self.camera = Camera(num_map_tiles, self.tile_size, (self.map_width, self.map_height))
+        # The default font, SysFont would scan the system fonts first.
+        self.font = pygame.font.Font(None, BASE_FONT_SIZE)
 
         # Extra height is for buttons
-        self.screen = pygame.display.set_mode((self.map_width, self.map_height + BOTTOM_BAR_HEIGHT))
-
-        self.turtle_pose = TurtlePose(
-            conf.START_TILE[0] + 0.5,
-            conf.START_TILE[1] + 0.5,
-            conf.START_THETA,
-        )
-        self.turtle_frame = pygame.image.load(TURTLE_IMAGE).convert_alpha()
-        self.turtle_frame = pygame.transform.scale(
-            self.turtle_frame, (self.tile_size, self.tile_size)
-        )
+        window_size = (self.map_width, self.map_height + BOTTOM_BAR_HEIGHT)
+        if self.headless:
+            # The dummy driver still needs a display mode before convert() works.
+            pygame.display.set_mode((1, 1))
+            self.screen = pygame.Surface(window_size).convert()
+        else:
+            self.screen = pygame.display.set_mode(window_size)
 
-        # Load and create arrow surfaces
+        ASSET_CACHE.directory = cache_path(conf.ASSET_CACHE_DIR) if conf.ASSET_CACHE_DIR else None
+        self.images = load_map_images(self.tile_size)
+        self.turtle_frame = self.images['turtle']
+        self.tile_map: dict[TileType, pygame.Surface] = {t: self.images[t.name] for t in TILE_SHEET_OFFSETS}
 
-        sheet = pygame.image.load(TILE_SHEET).convert_alpha()
-        self.tile_map: dict[TileType, pygame.Surface] = {}
-
-        fw = TILE_SHEET_CELL_SIZE
-        fh = TILE_SHEET_CELL_SIZE
-        for t, index in TILE_SHEET_OFFSETS.items():
-            frame_surf = pygame.Surface((fw, fh), pygame.SRCALPHA)
-            frame_surf.blit(sheet, (0, 0), (index[0] * fw, index[1] * fh, fw, fh))
-            self.tile_map[t] = pygame.transform.scale(
-                frame_surf, (self.tile_size, self.tile_size)
-            )
-
-        self.fog_surface = pygame.Surface((self.tile_size, self.tile_size), pygame.SRCALPHA)
-        self.fog_surface.fill(FOG_COLOR)
+        self._zoom_assets: dict[int, ZoomAssets] = {}
 
         # Button setup
         self.button_rect = pygame.Rect(10, self.map_height + 10, 120, BOTTOM_BAR_HEIGHT - 20)
-        self.connected_state = ConnectionState.IDLE
         self.frame_count = 0
 
         # Drag and drop state
         self.dragging = None  # None, 'turtle', or 'goal'
+        self.dragged_bot = 0
         self.drag_offset = (0, 0)
-
-        self.tiles[conf.GOAL_TILE[0]][conf.GOAL_TILE[1]] = TileState(TileType.GOAL)
-
-        # Set tiles to match alphabet mat
-        letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
-        for x, col_tiles in enumerate(self.tiles):
-            for y, t in enumerate(col_tiles):
-                i = (
-                    x
-                    + (conf.MAP_SIZE_TILES[1] - y - 1)
-                    * conf.MAP_SIZE_TILES[0]
-                )
-                self.tiles[x][y] = replace(t, text=letters[i])
+        self.panning = False
 
         self.card_widget = CardQueueWidget(170, self.map_height, self.map_width - 170, BOTTOM_BAR_HEIGHT)
 
+        # Layered compositor state. The map is split into chunks, each caching
+        # a background layer with the tile images and letters, and a composed
+        # layer with fog applied. The visible chunks are composed into the
+        # map layer, and the turtle sprite is drawn on the screen on top of the
+        # map layer. Only the rects that changed since the last frame are
+        # pushed to the display.
+        self.map_rect = pygame.Rect(0, 0, self.map_width, self.map_height)
+        self.bar_rect = pygame.Rect(0, self.map_height, self.map_width, BOTTOM_BAR_HEIGHT)
+        self._map_layer = pygame.Surface(self.map_rect.size).convert()
+        self._chunks: OrderedDict[DimType, MapChunk] = OrderedDict()
+        self._chunk_zoom = None
+        self._drawn_view = None
+        # Pose and screen rect of each turtle as last drawn.
+        self._drawn_turtles: list[tuple[TurtlePose, pygame.Rect]] | None = None
+        # Sprite tint per bot, None to draw the plain sprite.
+        self.bot_colors = [
+            pygame.Color(*(round(c * 255) for c in bot.LED_COLOR)) for bot in conf.FLEET
+        ] or [None]
+        self._followed_pose: TurtlePose | None = None
+        self._drawn_bar_state = None
+        self.invalidate()
+
+    def _queue_commands(self, event: pygame.event.Event):
+        # Stamped on arrival for latency tracing.
+        stamp = time.perf_counter()
+        for cmd in self._handle_event(event):
+            self.event_queue.put_nowait(cmd, stamp)
+
+    def handle_input_until(self, deadline: float):
+        """
+        Wait for input until the `time.perf_counter` `deadline`, queueing
+        commands the moment their event arrives instead of at the next frame.
+        """
+        self.snapshot = self.state.snapshot
+        while (remaining := deadline - time.perf_counter()) > 0:
+            event = pygame.event.wait(max(1, int(remaining * 1000)))
+            if event.type == pygame.NOEVENT:
+                continue
+            self._queue_commands(event)
+
+    def _handle_event(self, event: pygame.event.Event) -> Iterable[CmdEvent]:
+        if event.type == pygame.QUIT:  # X button or Alt+F4
+            yield CmdEvent.QUIT
+        elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+            self.invalidate()
+        elif event.type == pygame.MOUSEWHEEL:
+            mouse_pos = pygame.mouse.get_pos()
+            if self.map_rect.collidepoint(mouse_pos):
+                self.camera.zoom(event.y, mouse_pos)
+        elif event.type == pygame.MOUSEBUTTONDOWN:
+            if event.button == pygame.BUTTON_RIGHT:
+                self.panning = True
+            elif event.button != pygame.BUTTON_LEFT:
+                pass
+            elif self.button_rect.collidepoint(event.pos):
+                yield CmdEvent.TOGGLE_CONNECT
+            elif self.snapshot.connected_state == ConnectionState.IDLE:
+                goal_rect = self._get_goal_rect()
+                self.drag_offset = event.pos
+                clicked_bot = self._get_bot_at(event.pos)
+                if clicked_bot is not None:
+                    self.dragging = 'turtle'
+                    self.dragged_bot = clicked_bot
+                elif goal_rect.collidepoint(event.pos):
+                    self.dragging = 'goal'
+        elif event.type == pygame.MOUSEMOTION:
+            if self.panning:
+                self.camera.pan(*event.rel)
+            if self.dragging and self.snapshot.connected_state == ConnectionState.IDLE:
+                tile_x, tile_y = self._get_tile_from_pos(event.pos)
+                if self.dragging == 'turtle':
+                    if self._is_valid_tile(tile_x, tile_y):
+                        with self.state.edit(self.dragged_bot) as edit:
+                            edit.turtle_pose = replace(edit.turtle_pose, x=tile_x + 0.5, y=tile_y + 0.5)
+                elif self.dragging == 'goal':
+                    if self._is_valid_tile(tile_x, tile_y):
+                        self.drag_offset = event.pos
+                        with self.state.edit() as edit:
+                            edit.move_goal(tile_x, tile_y)
+        elif event.type == pygame.MOUSEBUTTONUP:
+            if event.button == pygame.BUTTON_RIGHT:
+                self.panning = False
+                return
+            # Rotate turtle if clicked and not dragged.
+            if self.dragging == 'turtle':
+                if abs(event.pos[0] - self.drag_offset[0] <2) and abs(event.pos[1] - self.drag_offset[1] <2):
+                    with self.state.edit(self.dragged_bot) as edit:
+                        edit.turtle_pose = replace(edit.turtle_pose, theta=(edit.turtle_pose.theta + 90) % 360)
+            self.dragging = None
+        elif event.type == pygame.KEYUP:
+            if event.key == pygame.K_RIGHT:
+                yield CmdEvent.RIGHT
+            elif event.key == pygame.K_LEFT:
+                yield CmdEvent.LEFT
+            elif event.key == pygame.K_UP:
+                yield CmdEvent.UP
+            elif event.key == pygame.K_ESCAPE:
+                yield CmdEvent.QUIT
+            elif event.key == pygame.K_BACKSPACE:
+                yield CmdEvent.DELETE_LAST_QUEUED
+            elif event.key == pygame.K_p:
+                yield CmdEvent.PLAN_ROUTE
+            elif event.key == pygame.K_r:
+                yield CmdEvent.REPEAT
+
+    def _get_assets(self) -> ZoomAssets:
+        """Images scaled for the current zoom, created on first use."""
+        tile_px = self.camera.tile_px
+        assets = self._zoom_assets.get(tile_px)
+        if assets is None:
+            fog = pygame.Surface((tile_px, tile_px), pygame.SRCALPHA)
+            fog.fill(FOG_COLOR)
+            font = None
+            if tile_px >= MIN_LABEL_TILE_PIXELS:
+                font = pygame.font.Font(None, BASE_FONT_SIZE * tile_px // self.tile_size)
+            if tile_px == self.tile_size:
+                # Scaled ahead of time by `load_map_images`.
+                tiles = {t.value: self.images[f"{t.name}_scaled"] for t in self.tile_map}
+                turtle = self.images['turtle_scaled']
+            else:
+                tiles = {
+                    t.value: pygame.transform.scale(surf, (tile_px, tile_px))
+                    for t, surf in self.tile_map.items()
+                }
+                turtle = pygame.transform.scale(self.turtle_frame, (tile_px, tile_px))
+            assets = ZoomAssets(
+                tiles=tiles,
+                fog=fog,
+                turtle=turtle,
+                font=font,
+            )
+            self._zoom_assets[tile_px] = assets
+        return assets
 
-    def set_all_tiles_unobserved(self):
-        for x, col_tiles in enumerate(self.tiles):
-            for y, t in enumerate(col_tiles):
-                self.tiles[x][y] = replace(t, observed=False)
-
-
-    def set_observed_tile(self, x: int, y: int, tile: TileType):
-        if self.tiles[x][y].type != TileType.GOAL:
-            self.tiles[x][y] = replace(self.tiles[x][y], observed=True, type=tile)
-        else:
-            self.tiles[x][y] = replace(self.tiles[x][y], observed=True)
+    def _get_turtle_sprite(self, bot: int, pose: TurtlePose) -> pygame.Surface:
+        sprite = self._get_assets().turtle
+        if self.bot_colors[bot] is not None:
+            sprite = RENDER_CACHE.tinted(sprite, self.bot_colors[bot])
+        return RENDER_CACHE.rotated(sprite, pose.theta)
 
-    def _get_window_events(self) -> Iterable[CmdEvent]:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:  # X button or Alt+F4
-                yield CmdEvent.QUIT
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                if self.button_rect.collidepoint(event.pos):
-                    yield CmdEvent.TOGGLE_CONNECT
-                elif self.connected_state == ConnectionState.IDLE:
-                    turtle_rect = self._get_turtle_rect()
-                    goal_rect = self._get_goal_rect()
-                    self.drag_offset = event.pos
-                    if turtle_rect.collidepoint(event.pos):
-                        self.dragging = 'turtle'
-                    elif goal_rect.collidepoint(event.pos):
-                        self.dragging = 'goal'
-            elif event.type == pygame.MOUSEMOTION:
-                if self.dragging and self.connected_state == ConnectionState.IDLE:
-                    tile_x, tile_y = self._get_tile_from_pos(event.pos)
-                    if self.dragging == 'turtle':
-                        if self._is_valid_tile(tile_x, tile_y):
-                            self.turtle_pose = replace(self.turtle_pose, x=tile_x + 0.5, y=tile_y + 0.5)
-                    elif self.dragging == 'goal':
-                        if self._is_valid_tile(tile_x, tile_y):
-                            old_x, old_y = self._get_tile_from_pos(self.drag_offset)
-                            self.drag_offset = event.pos
-                            self.tiles[old_x][old_y] = replace(self.tiles[old_x][old_y], type=TileType.EMPTY)
-                            self.tiles[tile_x][tile_y] = replace(self.tiles[tile_x][tile_y], type=TileType.GOAL)
-            elif event.type == pygame.MOUSEBUTTONUP:
-                # Rotate turtle if clicked and not dragged.
-                if self.dragging == 'turtle':
-                    if abs(event.pos[0] - self.drag_offset[0] <2) and abs(event.pos[1] - self.drag_offset[1] <2):
-                        self.turtle_pose = replace(self.turtle_pose, theta=(self.turtle_pose.theta + 90) % 360)
-                self.dragging = None
-            elif event.type == pygame.KEYUP:
-                if event.key == pygame.K_RIGHT:
-                    yield CmdEvent.RIGHT
-                elif event.key == pygame.K_LEFT:
-                    yield CmdEvent.LEFT
-                elif event.key == pygame.K_UP:
-                    yield CmdEvent.UP
-                elif event.key == pygame.K_ESCAPE:
-                    yield CmdEvent.QUIT
-                elif event.key == pygame.K_BACKSPACE:
-                    yield CmdEvent.DELETE_LAST_QUEUED
-
-    def _get_turtle_rect(self) -> pygame.Rect:
-        rotated = pygame.transform.rotate(self.turtle_frame, self.turtle_pose.theta)
+    def _get_turtle_rect(self, pose: TurtlePose) -> pygame.Rect:
+        rotated = RENDER_CACHE.rotated(self._get_assets().turtle, pose.theta)
         rotated_rect = rotated.get_rect()
-        y = int(self.map_height - self.turtle_pose.y * self.tile_size)
-        x = int(self.turtle_pose.x * self.tile_size)
-        rotated_rect.center = (x, y)
+        rotated_rect.center = self.camera.world_to_screen(pose.x, pose.y)
         return rotated_rect
 
-    def _get_goal_tile(self) -> DimType:
-        for x, col_tiles in enumerate(self.tiles):
-            for y, t in enumerate(col_tiles):
-                if t.type == TileType.GOAL:
-                    return x, y
-        raise RuntimeError('No Goal Tile Set')
+    def _get_bot_at(self, pos: tuple) -> int | None:
+        """The bot drawn at screen `pos`, topmost first."""
+        for bot in reversed(range(len(self.snapshot.turtle_poses))):
+            if self._get_turtle_rect(self.snapshot.turtle_poses[bot]).collidepoint(pos):
+                return bot
+        return None
 
     def _get_goal_rect(self) -> pygame.Rect:
-        x, y = self._get_goal_tile()
-        goal_x = self.tile_size * x + self.tile_size // 2
-        goal_y = self.map_height - self.tile_size * (y + 1) + self.tile_size // 2
-        return pygame.Rect(goal_x - self.tile_size // 2, goal_y - self.tile_size // 2, self.tile_size, self.tile_size)
+        x, y = self.snapshot.goal_tile
+        return self._tile_rect(x, y)
 
     def _get_tile_from_pos(self, pos: tuple) -> tuple:
-        x = pos[0] // self.tile_size
-        y = (self.map_height - pos[1]) // self.tile_size
-        return (int(x), int(y))
+        return self.camera.screen_to_tile(pos)
 
     def _is_valid_tile(self, x: int, y: int) -> bool:
-        num_x = len(self.tiles)
-        num_y = len(self.tiles[0]) if self.tiles else 0
-        return 0 <= x < num_x and 0 <= y < num_y
-
-    def set_connection_state(self, new_state: ConnectionState):
-        self.connected_state = new_state
-
-    def get_updated_settings(self) -> Settings:
-        return replace(self.conf,
-                       START_TILE=(int(self.turtle_pose.x), int(self.turtle_pose.y)),
-                       START_THETA=self.turtle_pose.theta,
-                       GOAL_TILE=self._get_goal_tile())
-
-    def center_turtle(self):
-        # Snap to nearest tile center
-        x = round(self.turtle_pose.x - 0.5) + 0.5
-        y = round(self.turtle_pose.y - 0.5) + 0.5
-        # Round theta to nearest 90 degrees
-        theta = round(self.turtle_pose.theta / 90) * 90
-        self.turtle_pose = replace(self.turtle_pose, x=x, y=y, theta=theta % 360)
+        return self.snapshot.grid.is_valid(x, y)
+
+    def invalidate(self):
+        """Force the next `Draw` to recompose and present the whole window."""
+        self._chunks.clear()
+        self._drawn_view = None
+        self._drawn_turtles = None
+        self._drawn_bar_state = None
+        self._needs_full_redraw = True
+
+    def _tile_rect(self, x: int, y: int) -> pygame.Rect:
+        """Viewport rect of a tile."""
+        tile_px = self.camera.tile_px
+        left, top = self.camera.world_to_screen(x, y + 1)
+        return pygame.Rect(left, top, tile_px, tile_px)
+
+    def _chunk_tiles(self) -> int:
+        return max(1, CHUNK_PIXELS // self.camera.tile_px)
+
+    def _chunk_rect(self, chunk: MapChunk, x: int, y: int) -> pygame.Rect:
+        """Rect of a tile within its chunk's surfaces."""
+        tile_px = self.camera.tile_px
+        return pygame.Rect(
+            (x - chunk.tiles_x[0]) * tile_px,
+            (chunk.tiles_y[1] - 1 - y) * tile_px,
+            tile_px,
+            tile_px,
+        )
 
-    def Draw(self):
-        for event in self._get_window_events():
-            self.event_queue.put_nowait(event)
-
-        self.screen.fill(BG_COLOR)
-
-        for c, col_tiles in enumerate(self.tiles):
-            for r, t in enumerate(col_tiles):
-                surf = self.tile_map[t.type]
-                x = self.tile_size * c
-                y = self.map_height - self.tile_size * (r + 1)
-                self.screen.blit(surf, (x, y), (0, 0, self.tile_size, self.tile_size))
-                text_surface = self.font.render(t.text, True, TEXT_COLOR)
-                rect = text_surface.get_rect(center=(x + self.tile_size/2.0, y+ self.tile_size/2.0))
-                self.screen.blit(text_surface, rect)
-                if not t.observed:
-                    self.screen.blit(
-                        self.fog_surface, (x, y), (0, 0, self.tile_size, self.tile_size)
-                    )
-
-        turtle_rect = self._get_turtle_rect()
-        rotated = pygame.transform.rotate(self.turtle_frame, self.turtle_pose.theta)
-        self.screen.blit(rotated, turtle_rect)
-
-        # Draw button
+    def _draw_chunk_tile(self, chunk: MapChunk, x: int, y: int):
+        """Render one tile into both layers of its chunk."""
+        assets = self._get_assets()
+        grid = self.snapshot.grid
+        rect = self._chunk_rect(chunk, x, y)
+        chunk.background.blit(assets.tiles[int(grid.types[x, y])], rect)
+        if assets.font is not None:
+            text_surface = RENDER_CACHE.text(assets.font, grid.text_at(x, y), TEXT_COLOR)
+            chunk.background.blit(text_surface, text_surface.get_rect(center=rect.center))
+        chunk.composed.blit(chunk.background, rect, rect)
+        if not grid.observed[x, y]:
+            chunk.composed.blit(assets.fog, rect)
+
+    def _get_chunk(self, key: DimType) -> MapChunk:
+        """Cached chunk, rendered from the current snapshot on a miss."""
+        chunk = self._chunks.get(key)
+        if chunk is not None:
+            self._chunks.move_to_end(key)
+            return chunk
+        size = self._chunk_tiles()
+        num_x, num_y = self.conf.MAP_SIZE_TILES
+        tiles_x = (key[0] * size, min(num_x, (key[0] + 1) * size))
+        tiles_y = (key[1] * size, min(num_y, (key[1] + 1) * size))
+        tile_px = self.camera.tile_px
+        px_size = ((tiles_x[1] - tiles_x[0]) * tile_px, (tiles_y[1] - tiles_y[0]) * tile_px)
+        chunk = MapChunk(
+            tiles_x, tiles_y,
+            pygame.Surface(px_size).convert(),
+            pygame.Surface(px_size).convert(),
+        )
+        for x in range(*tiles_x):
+            for y in range(*tiles_y):
+                self._draw_chunk_tile(chunk, x, y)
+        self._chunks[key] = chunk
+        while len(self._chunks) > MAX_CACHED_CHUNKS:
+            self._chunks.popitem(last=False)
+        return chunk
+
+    def _compose_view(self):
+        """Compose the visible chunks into the map layer."""
+        self._map_layer.fill(BG_COLOR)
+        size = self._chunk_tiles()
+        (x0, x1), (y0, y1) = self.camera.visible_tiles()
+        for cx in range(x0 // size, -(-x1 // size)):
+            for cy in range(y0 // size, -(-y1 // size)):
+                chunk = self._get_chunk((cx, cy))
+                self._map_layer.blit(
+                    chunk.composed,
+                    self.camera.world_to_screen(chunk.tiles_x[0], chunk.tiles_y[1]),
+                )
+
+    def _update_map_layer(self, changed: np.ndarray) -> list[pygame.Rect]:
+        """Redraw changed tiles into the cached chunks and map layer.
+
+        `changed` holds the flat indexes of the tiles changed since the last
+        frame. Returns the viewport rects that need to be presented.
+        """
+        if self._chunk_zoom != self.camera.tile_px:
+            self._chunks.clear()
+            self._chunk_zoom = self.camera.tile_px
+
+        # Keep every cached chunk current, visible or not.
+        size = self._chunk_tiles()
+        grid = self.snapshot.grid
+        changed_rects = []
+        xs, ys = grid.unravel(changed)
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            chunk = self._chunks.get((x // size, y // size))
+            if chunk is None:
+                continue
+            self._draw_chunk_tile(chunk, x, y)
+            rect = self._tile_rect(x, y)
+            if rect.colliderect(self.map_rect):
+                self._map_layer.blit(chunk.composed, rect, self._chunk_rect(chunk, x, y))
+                changed_rects.append(rect.clip(self.map_rect))
+
+        view = self.camera.view_state()
+        if view != self._drawn_view:
+            self._drawn_view = view
+            self._compose_view()
+            return [self.map_rect.copy()]
+        return changed_rects
+
+    def _update_sprites(self, dirty: list[pygame.Rect]) -> list[pygame.Rect]:
+        """Restore the map layer under the turtles and redraw them if needed.
+
+        Returns the screen rects touched.
+        """
+        for rect in dirty:
+            self.screen.blit(self._map_layer, rect, rect)
+
+        turtles = [(pose, self._get_turtle_rect(pose)) for pose in self.snapshot.turtle_poses]
+        if self._drawn_turtles is not None:
+            if self._drawn_turtles == turtles and all(rect.collidelist(dirty) == -1 for _, rect in turtles):
+                return dirty
+            # Turtles can overlap, so all of them are redrawn when any one moves.
+            old_rects = [rect.clip(self.map_rect) for _, rect in self._drawn_turtles]
+            for rect in old_rects:
+                self.screen.blit(self._map_layer, rect, rect)
+            dirty = dirty + old_rects
+
+        self.screen.set_clip(self.map_rect)
+        for bot, (pose, rect) in enumerate(turtles):
+            self.screen.blit(self._get_turtle_sprite(bot, pose), rect)
+        self.screen.set_clip(None)
+        self._drawn_turtles = turtles
+        return dirty + [rect.clip(self.map_rect) for _, rect in turtles]
+
+    def _update_bottom_bar(self) -> list[pygame.Rect]:
+        """Redraw the connect button and card queue if their state changed."""
         self.frame_count += 1
         dot_animation = (self.frame_count // 15) % 4  # Cycle through 0-3 every 15 frames
-        
+
         button_str = {
             ConnectionState.IDLE: ('Connect', TEXT_COLOR),
             ConnectionState.CONNECTING: (f'Connecting{"." * dot_animation}', FOG_COLOR),
             ConnectionState.CONNECTED: ('Disconnect', TEXT_COLOR),
-        }[self.connected_state]
-        
-        button_text = self.font.render(button_str[0], True, button_str[1])
+        }[self.snapshot.connected_state]
+
+        bar_state = (button_str, self.card_widget.view_state())
+        if bar_state == self._drawn_bar_state:
+            return []
+        self._drawn_bar_state = bar_state
+
+        self.screen.fill(BG_COLOR, self.bar_rect)
+
+        button_text = RENDER_CACHE.text(self.font, *button_str)
         text_rect = button_text.get_rect()
-        
+
         # Resize button rect based on text size with padding
         padding = 10
         self.button_rect.width = text_rect.width + padding * 2
         self.button_rect.height = text_rect.height + padding * 2
-        
+
         pygame.draw.rect(self.screen, BUTTON_COLOR, self.button_rect)
         pygame.draw.rect(self.screen, BUTTON_BORDER_COLOR, self.button_rect, 2)
-        
+
         text_rect.center = self.button_rect.center
         self.screen.blit(button_text, text_rect)
 
         self.card_widget.draw(self.screen)
+        return [self.bar_rect]
+
+    def _sync_card_widget(self):
+        """Apply the card queue from the snapshot to the widget's view state."""
+        if tuple(self.card_widget.cards) != self.snapshot.cards:
+            self.card_widget.set_cards(self.snapshot.cards)
+        if self.card_widget.active_index != self.snapshot.active_card:
+            self.card_widget.set_active(self.snapshot.active_card)
 
-        pygame.display.flip()
+    def Draw(self):
+        self.snapshot = self.state.snapshot
+        for event in pygame.event.get():
+            self._queue_commands(event)
+        # Event handling may have edited the state.
+        self.snapshot, changed = self.state.take_changes()
+        self._sync_card_widget()
+
+        # Keep the turtle in view when it moves.
+        if self.snapshot.turtle_pose != self._followed_pose:
+            self._followed_pose = self.snapshot.turtle_pose
+            self.camera.follow(self._followed_pose.x, self._followed_pose.y)
+
+        dirty = self._update_map_layer(changed)
+        dirty = self._update_sprites(dirty)
+        dirty += self._update_bottom_bar()
+
+        full_redraw = self._needs_full_redraw
+        self._needs_full_redraw = False
+        if self.headless:
+            return
+        if full_redraw:
+            pygame.display.flip()
+        elif dirty:
+            pygame.display.update(dirty)
 
     def Stop(self):
         pygame.quit()
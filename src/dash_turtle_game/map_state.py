@@ -0,0 +1,366 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from enum import Enum, auto
+import threading
+import time
+from typing import Callable, Sequence
+
+import numpy as np
+
+from .constants import DimType, Settings, TileState, TileType, TurtlePose
+from .card_gui import CardType
+from .occupancy import OccupancyGrid
+from .stats import LatencyRecorder
+from .tile_grid import TileGrid
+
+TILE_LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+
+
+def start_poses(conf: Settings) -> tuple[TurtlePose, ...]:
+    """Starting pose of each bot, from the fleet if there is one."""
+    starts = [(bot.START_TILE, bot.START_THETA) for bot in conf.FLEET] or [(conf.START_TILE, conf.START_THETA)]
+    return tuple(TurtlePose(tile[0] + 0.5, tile[1] + 0.5, theta) for tile, theta in starts)
+
+
+class TileReservations:
+    """
+    Tiles each bot is on or moving into, so bots never plan into each other.
+
+    A bot holds the tile it is on while idle, and reserves the tile in front
+    of it before moving. A tile is only ever held by one bot.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._owners: dict[DimType, int] = {}
+        self._held: dict[int, set[DimType]] = {}
+
+    def reserve(self, bot: int, tile: DimType) -> bool:
+        """Add `tile` to the tiles `bot` holds. False if another bot holds it."""
+        with self._lock:
+            owner = self._owners.setdefault(tile, bot)
+            if owner != bot:
+                return False
+            self._held.setdefault(bot, set()).add(tile)
+            return True
+
+    def hold_only(self, bot: int, tile: DimType) -> bool:
+        """Release everything `bot` holds except `tile`, then reserve `tile`."""
+        with self._lock:
+            for held in self._held.pop(bot, ()):
+                if held != tile:
+                    del self._owners[held]
+                else:
+                    self._held[bot] = {tile}
+        return self.reserve(bot, tile)
+
+    def release(self, bot: int):
+        with self._lock:
+            for held in self._held.pop(bot, ()):
+                del self._owners[held]
+
+    def owner(self, tile: DimType) -> int | None:
+        return self._owners.get(tile)
+
+
+class ConnectionState(Enum):
+    IDLE = auto()
+    CONNECTING = auto()
+    CONNECTED = auto()
+
+
+@dataclass(frozen=True)
+class MapSnapshot:
+    """
+    Immutable view of the game state.
+
+    Published snapshots are never modified. Grid arrays that did not change
+    between two snapshots are shared.
+    """
+    version: int
+    # One pose per bot, the first is the bot driven by the window.
+    turtle_poses: tuple[TurtlePose, ...]
+    goal_tile: DimType
+    grid: TileGrid
+    cards: tuple[CardType, ...]
+    active_card: int
+    connected_state: ConnectionState
+
+    @property
+    def turtle_pose(self) -> TurtlePose:
+        return self.turtle_poses[0]
+
+
+class MapEditor:
+    """
+    Mutable working copy of a snapshot, only valid inside `MapStateStore.edit`.
+
+    `turtle_pose` and the observed tiles are those of bot number `bot`.
+    """
+
+    def __init__(self, store: "MapStateStore", snapshot: MapSnapshot, bot: int = 0) -> None:
+        self._store = store
+        self._snapshot = snapshot
+        self.bot = bot
+        # Copy of the tile types, only made once a type actually changes.
+        self._types: np.ndarray | None = None
+        # Tiles this bot observes once the edit is published, None if unchanged.
+        self._observe: set[DimType] | None = None
+        self.turtle_poses = list(snapshot.turtle_poses)
+        self.goal_tile = snapshot.goal_tile
+        self.cards = list(snapshot.cards)
+        self.active_card = snapshot.active_card
+        self.connected_state = snapshot.connected_state
+
+    def get_tile(self, x: int, y: int) -> TileState:
+        tile = self._snapshot.grid.tile(x, y)
+        if self._types is not None:
+            tile.type = TileType(int(self._types[x, y]))
+        if self._observe is not None:
+            tile.observed = (x, y) in self._observe or (x, y) in self._store._observed_by_others(self.bot)
+        return tile
+
+    @property
+    def turtle_pose(self) -> TurtlePose:
+        return self.turtle_poses[self.bot]
+
+    @turtle_pose.setter
+    def turtle_pose(self, pose: TurtlePose):
+        self.turtle_poses[self.bot] = pose
+
+    def _set_type(self, x: int, y: int, tile: TileType):
+        if self._types is None:
+            if self._snapshot.grid.types[x, y] == tile.value:
+                return
+            self._types = self._snapshot.grid.types.copy()
+        self._types[x, y] = tile.value
+        self._store._mark_changed([x], [y])
+
+    def set_all_tiles_unobserved(self):
+        self._observe = set()
+
+    def set_observed_tile(self, x: int, y: int, tile: TileType):
+        if self.get_tile(x, y).type != TileType.GOAL:
+            self._set_type(x, y, tile)
+        if self._observe is None:
+            self._observe = set(self._store._observed_by_bot[self.bot])
+        self._observe.add((x, y))
+
+    def visit_tile(self, x: int, y: int):
+        """Observe the tile the bot is on, which must be free."""
+        self._store.occupancy.set_free(x, y)
+        self.set_observed_tile(x, y, TileType.EMPTY)
+
+    def observe_ir(self, x: int, y: int, left: float, right: float) -> TileType:
+        """
+        Fuse a packet's IR readings into the tile in front of the bot, and
+        observe it as the type its odds now point to.
+        """
+        occupancy = self._store.occupancy
+        occupancy.update([x], [y], [(left, right)])
+        tile = occupancy.tile_type(x, y, self.get_tile(x, y).type)
+        self.set_observed_tile(x, y, tile)
+        return tile
+
+    def move_goal(self, x: int, y: int):
+        old_x, old_y = self.goal_tile
+        self._set_type(old_x, old_y, TileType.EMPTY)
+        self._set_type(x, y, TileType.GOAL)
+        self.goal_tile = (x, y)
+
+    def center_turtle(self):
+        # Snap to nearest tile center
+        x = round(self.turtle_pose.x - 0.5) + 0.5
+        y = round(self.turtle_pose.y - 0.5) + 0.5
+        # Round theta to nearest 90 degrees
+        theta = round(self.turtle_pose.theta / 90) * 90
+        self.turtle_pose = replace(self.turtle_pose, x=x, y=y, theta=theta % 360)
+
+    def add_card(self, card_type: CardType):
+        self.cards.append(card_type)
+
+    def remove_card(self, index: int):
+        if 0 <= index < len(self.cards):
+            self.cards.pop(index)
+            if self.active_card >= len(self.cards):
+                self.active_card = len(self.cards) - 1
+
+    def set_active(self, index: int):
+        self.active_card = index
+
+    def _build_observed(self) -> np.ndarray | None:
+        """Apply the observation changes, touching only tiles that changed."""
+        if self._observe is None:
+            return None
+        old = self._store._observed_tiles
+        self._store._observed_by_bot[self.bot] = self._observe
+        # A tile stays observed while any bot observes it.
+        new = self._observe | self._store._observed_by_others(self.bot)
+        cleared = old - new
+        added = new - old
+        self._store._observed_tiles = new
+        if not cleared and not added:
+            return None
+        observed = self._snapshot.grid.observed.copy()
+        for tiles, value in ((cleared, False), (added, True)):
+            if tiles:
+                xs, ys = zip(*tiles)
+                observed[xs, ys] = value
+                self._store._mark_changed(xs, ys)
+        return observed
+
+    def _build_snapshot(self) -> MapSnapshot:
+        grid = self._snapshot.grid
+        observed = self._build_observed()
+        if self._types is not None or observed is not None:
+            grid = grid.with_arrays(types=self._types, observed=observed)
+        return MapSnapshot(
+            version=self._snapshot.version + 1,
+            turtle_poses=tuple(self.turtle_poses),
+            goal_tile=self.goal_tile,
+            grid=grid,
+            cards=tuple(self.cards),
+            active_card=self.active_card,
+            connected_state=self.connected_state,
+        )
+
+
+def _column_name(x: int) -> str:
+    """Spreadsheet style column name: A..Z, AA, AB, ..."""
+    name = ''
+    x += 1
+    while x > 0:
+        x, rem = divmod(x - 1, 26)
+        name = chr(ord('A') + rem) + name
+    return name
+
+
+class CoordinateLabels(Sequence[str]):
+    """
+    Labels for maps larger than the alphabet mat, made from the column name
+    and the row number counted from the top. Indexed by the flat tile index
+    and computed on access, so large maps don't keep a string per tile.
+    """
+
+    def __init__(self, size: DimType) -> None:
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size[0] * self.size[1]
+
+    def __getitem__(self, index):
+        x, y = divmod(int(index), self.size[1])
+        return f"{_column_name(x)}{self.size[1] - y}"
+
+
+def _tile_labels(size: DimType) -> tuple[Sequence[str], np.ndarray]:
+    """
+    Labels matching the alphabet mat, read row by row from the top left, or
+    coordinates if the map has more tiles than the mat.
+    """
+    num_x, num_y = size
+    if num_x * num_y > len(TILE_LETTERS):
+        return CoordinateLabels(size), np.arange(num_x * num_y).reshape(size)
+    xs, ys = np.meshgrid(np.arange(num_x), np.arange(num_y), indexing='ij')
+    return list(TILE_LETTERS), xs + (num_y - ys - 1) * num_x
+
+
+class MapStateStore:
+    """
+    Copy-on-write holder for the game state shared by the control and render threads.
+
+    Writers make small atomic updates with `edit`, which serializes writers and
+    publishes a new snapshot when the block exits. Readers take `snapshot`
+    without any locking, so rendering a frame never blocks a writer.
+
+    Tiles changed by edits are accumulated in a bitmap that the renderer
+    collects with `take_changes`.
+    """
+
+    def __init__(self, conf: Settings) -> None:
+        self.conf = conf
+
+        labels, label_index = _tile_labels(conf.MAP_SIZE_TILES)
+        grid = TileGrid.create(conf.MAP_SIZE_TILES, labels, label_index)
+        types = grid.types.copy()
+        types[conf.GOAL_TILE] = TileType.GOAL.value
+        grid = grid.with_arrays(types=types)
+
+        self._snapshot = MapSnapshot(
+            version=0,
+            turtle_poses=start_poses(conf),
+            goal_tile=conf.GOAL_TILE,
+            grid=grid,
+            cards=(),
+            active_card=-1,
+            connected_state=ConnectionState.IDLE,
+        )
+        # Tiles observed by each bot, and by any bot.
+        self._observed_by_bot: list[set[DimType]] = [set() for _ in self._snapshot.turtle_poses]
+        self._observed_tiles: set[DimType] = set()
+        self.reservations = TileReservations()
+        # Fused from every bot's IR readings, only changed inside `edit`.
+        self.occupancy = OccupancyGrid(conf.MAP_SIZE_TILES, conf.FRONT_DETECTION_THRESHOLD)
+        self._changed = np.zeros(conf.MAP_SIZE_TILES, dtype=bool)
+        self._has_changes = False
+        self._write_lock = threading.Lock()
+        # Time writers spent waiting to start an edit.
+        self.write_wait = LatencyRecorder()
+        # Called with each new snapshot as it is published, under the write lock.
+        self.on_publish: Callable[[MapSnapshot], None] | None = None
+
+    @property
+    def snapshot(self) -> MapSnapshot:
+        return self._snapshot
+
+    @property
+    def num_bots(self) -> int:
+        return len(self._snapshot.turtle_poses)
+
+    @contextmanager
+    def edit(self, bot: int = 0):
+        start = time.perf_counter()
+        with self._write_lock:
+            self.write_wait.record(time.perf_counter() - start)
+            editor = MapEditor(self, self._snapshot, bot)
+            yield editor
+            self._snapshot = editor._build_snapshot()
+            if self.on_publish is not None:
+                self.on_publish(self._snapshot)
+
+    def _observed_by_others(self, bot: int) -> set[DimType]:
+        if len(self._observed_by_bot) == 1:
+            return set()
+        return set().union(*(tiles for i, tiles in enumerate(self._observed_by_bot) if i != bot))
+
+    def _mark_changed(self, xs, ys):
+        self._changed[xs, ys] = True
+        self._has_changes = True
+
+    def take_changes(self) -> tuple[MapSnapshot, np.ndarray]:
+        """
+        Return the latest snapshot and the flat indexes of the tiles changed
+        since the previous call, clearing the change bitmap.
+        """
+        with self._write_lock:
+            if not self._has_changes:
+                return self._snapshot, np.empty(0, dtype=np.intp)
+            changed = np.flatnonzero(self._changed)
+            self._changed.flat[changed] = False
+            self._has_changes = False
+            return self._snapshot, changed
+
+    def get_tile(self, x: int, y: int) -> TileState:
+        return self._snapshot.grid.tile(x, y)
+
+    def get_updated_settings(self, bot: int = 0) -> Settings:
+        """Settings for bot number `bot`, starting from its pose on the map."""
+        snapshot = self._snapshot
+        pose = snapshot.turtle_poses[bot]
+        conf = replace(self.conf,
+                       START_TILE=(int(pose.x), int(pose.y)),
+                       START_THETA=pose.theta,
+                       GOAL_TILE=snapshot.goal_tile)
+        if self.conf.FLEET:
+            conf = replace(conf, LED_COLOR=self.conf.FLEET[bot].LED_COLOR)
+        return conf
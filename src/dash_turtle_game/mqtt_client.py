@@ -1,32 +1,84 @@
 from collections.abc import Iterator
+from functools import lru_cache
 import json
-from queue import Queue
 import logging
+import time
 
 import paho.mqtt.client as mqtt
 from paho.mqtt.enums import CallbackAPIVersion
 from paho.mqtt.reasoncodes import ReasonCode
 
+from .channels import BoundedChannel, ChannelMetrics, OverflowPolicy
 from .constants import CmdEvent
 
+try:
+    # Optional, parses payloads several times faster.
+    import orjson
+
+    def parse_payload(payload: bytes):
+        return orjson.loads(payload)
+except ImportError:
+    def parse_payload(payload: bytes):
+        # Decoding first is faster than letting json detect the encoding.
+        return json.loads(payload.decode('ascii'))
+
 logger = logging.getLogger(__name__)
 
 
 CONTROLLER_TOPIC = "controller/buttons_pressed"
 CARD_TOPIC = "card_reader/card_text"
+# Commands not consumed by the controller are dropped past this depth.
+MESSAGE_QUEUE_SIZE = 32
+
+CONTROLLER_BUTTONS = {
+    'A': CmdEvent.LEFT,
+    'B': CmdEvent.UP,
+    'C': CmdEvent.RIGHT,
+}
+CARD_TEXT = {
+    'UP' : CmdEvent.UP,
+    'LEFT' : CmdEvent.LEFT,
+    'RIGHT' : CmdEvent.RIGHT,
+    'CONNECT' : CmdEvent.TOGGLE_CONNECT,
+    'PLAN' : CmdEvent.PLAN_ROUTE,
+    'REPEAT' : CmdEvent.REPEAT,
+}
+
+
+# Controllers and readers send the same few payloads over and over, so the
+# decoded form of each distinct payload is cached and JSON is rarely parsed.
+@lru_cache(maxsize=1024)
+def decode_buttons(payload: bytes) -> tuple[str, ...]:
+    return tuple(parse_payload(payload))
+
+
+@lru_cache(maxsize=1024)
+def decode_card(payload: bytes) -> CmdEvent | None:
+    return CARD_TEXT.get(parse_payload(payload)['txt'])
 
 class MQTTCommandClient:
-    def __init__(self, host: str, port: int = 1883) -> None:
+    """
+    Commands from the controller and card reader topics.
+
+    A fleet gives each bot its own `topic_prefix`, e.g. "dash2/" listens on
+    "dash2/controller/buttons_pressed" and "dash2/card_reader/card_text".
+    """
+
+    def __init__(self, host: str, port: int = 1883, topic_prefix: str = "") -> None:
         self._host = host
         self._port = port
 
-        self._messages: Queue[CmdEvent] = Queue()
+        self._messages: BoundedChannel[CmdEvent] = BoundedChannel(MESSAGE_QUEUE_SIZE, OverflowPolicy.DROP_OLDEST)
 
         self._client = mqtt.Client(CallbackAPIVersion.VERSION2)
         self._client.on_connect = self._on_connect
         self._client.on_disconnect = self._on_disconnect
         self._client.on_message = self._on_message
-        self.pressed_buttons: list[str] = []
+        self.pressed_buttons: set[str] = set()
+        self._topic_handlers = {
+            topic_prefix + CONTROLLER_TOPIC: self._on_buttons,
+            topic_prefix + CARD_TOPIC: self._on_card,
+        }
 
     # ------------------------------------------------------------------
     # Callbacks
@@ -42,8 +94,8 @@ class MQTTCommandClient:
     ) -> None:
         if reason_code == mqtt.MQTT_ERR_SUCCESS:
             logger.info(f"Connected to broker at {self._host}:{self._port}")
-            client.subscribe(CONTROLLER_TOPIC)
-            client.subscribe(CARD_TOPIC)
+            for topic in self._topic_handlers:
+                client.subscribe(topic)
         else:
             logger.warning(
                 f"Connection failed (rc={reason_code}), will attempt reconnect"
@@ -68,30 +120,33 @@ class MQTTCommandClient:
     def _on_message(
         self, client: mqtt.Client, userdata, message: mqtt.MQTTMessage
     ) -> None:
-        logger.debug(f"Message received on {message.topic}: {message.payload}")
-        json_str = message.payload.decode("ascii")
-        if message.topic == CONTROLLER_TOPIC:
-            new_buttons = json.loads(json_str)
-            for val in new_buttons:
-                if val not in self.pressed_buttons:
-                    if val == "A":
-                        self._messages.put_nowait(CmdEvent.LEFT)
-                    elif val == "B":
-                        self._messages.put_nowait(CmdEvent.UP)
-                    elif val == "C":
-                        self._messages.put_nowait(CmdEvent.RIGHT)
-            self.pressed_buttons = new_buttons
-        else:
-            new_card = json.loads(json_str)
-            CARD_TEXT = {
-                'UP' : CmdEvent.UP,
-                'LEFT' : CmdEvent.LEFT,
-                'RIGHT' : CmdEvent.RIGHT,
-                'CONNECT' : CmdEvent.TOGGLE_CONNECT,
-            }
-            cmd = CARD_TEXT.get(new_card['txt'], None)
-            if cmd is not None:
-                self._messages.put_nowait(cmd)
+        # Stamped on arrival for latency tracing.
+        stamp = time.perf_counter()
+        topic = message.topic
+        payload = message.payload
+        logger.debug("Message received on %s: %s", topic, payload)
+        handler = self._topic_handlers.get(topic)
+        if handler is None:
+            return
+        try:
+            handler(payload, stamp)
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring malformed payload on %s: %r", topic, payload)
+
+    def _on_buttons(self, payload: bytes, stamp: float):
+        new_buttons = decode_buttons(payload)
+        # Only buttons that were not already held generate a command.
+        for val in new_buttons:
+            if val not in self.pressed_buttons:
+                cmd = CONTROLLER_BUTTONS.get(val)
+                if cmd is not None:
+                    self._messages.put_nowait(cmd, stamp)
+        self.pressed_buttons = set(new_buttons)
+
+    def _on_card(self, payload: bytes, stamp: float):
+        cmd = decode_card(payload)
+        if cmd is not None:
+            self._messages.put_nowait(cmd, stamp)
 
     # ------------------------------------------------------------------
     # Public API
@@ -108,8 +163,16 @@ class MQTTCommandClient:
 
     def get_messages(self) -> Iterator[CmdEvent]:
         """Return a snapshot of all messages received so far and clear the buffer."""
-        while not self._messages.empty():
-            yield self._messages.get_nowait()
+        yield from self._messages.drain()
+
+    def metrics(self) -> ChannelMetrics:
+        """Depth, age, and drop count of the pending message buffer."""
+        return self._messages.metrics()
+
+    @property
+    def channel(self) -> BoundedChannel[CmdEvent]:
+        """Channel the commands arrive on, for use with a `ChannelSelector`."""
+        return self._messages
 
     # ------------------------------------------------------------------
     # Context-manager support
@@ -126,8 +189,6 @@ class MQTTCommandClient:
 # --- Example Usage ---
 
 if __name__ == "__main__":
-    import time
-
     logging.basicConfig(level=logging.DEBUG)
 
     with MQTTCommandClient(
@@ -0,0 +1,91 @@
+"""
+Commands on their way to the bot, sent in one batch per sensor packet.
+
+The controller `submit`s commands without waiting on the BLE link, and the
+WonderPy thread `flush`es them when the next packet arrives. Only the newest
+command for each `Actuator` is kept, and LED writes of the color already
+showing are dropped. A stop goes out before anything else in its batch, and
+replaces a pose staged before it.
+
+Run `python -m dash_turtle_game.fake_robot` to measure the writes saved.
+"""
+from dataclasses import dataclass
+from enum import IntEnum, auto
+from threading import Lock
+from typing import Any, Callable
+
+
+class Actuator(IntEnum):
+    """What a command drives, flushed in this order."""
+    STOP = auto()
+    BODY = auto()
+    EAR_LEFT = auto()
+    FRONT = auto()
+    EAR_RIGHT = auto()
+    BUTTON_LED = auto()
+    AUDIO = auto()
+
+
+# Writing these again with the value they already show does nothing.
+STATEFUL_ACTUATORS = (Actuator.EAR_LEFT, Actuator.FRONT, Actuator.EAR_RIGHT, Actuator.BUTTON_LED)
+
+
+@dataclass
+class SchedulerMetrics:
+    # Commands waiting for the next flush, and the most there have been.
+    depth: int
+    max_depth: int
+    submitted: int
+    sent: int
+    # Submitted commands that were never sent, as a newer one replaced them.
+    coalesced: int
+
+
+class CommandScheduler:
+    """Thread safe. `submit` is called by the controller, `flush` by the thread talking to the bot."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._pending: dict[Actuator, tuple[Any, Callable[[], None]]] = {}
+        self._showing: dict[Actuator, Any] = {}
+        self.max_depth = 0
+        self.submitted = 0
+        self.sent = 0
+        self.coalesced = 0
+
+    def submit(self, actuator: Actuator, value: Any, send: Callable[[], None]):
+        """Queue `send`, which sets `actuator` to `value`, in place of any command waiting for it."""
+        with self._lock:
+            self.submitted += 1
+            if actuator == Actuator.STOP and Actuator.BODY in self._pending:
+                del self._pending[Actuator.BODY]
+                self.coalesced += 1
+            if actuator in self._pending:
+                del self._pending[actuator]
+                self.coalesced += 1
+            if actuator in STATEFUL_ACTUATORS and self._showing.get(actuator) == value:
+                self.coalesced += 1
+                return
+            self._pending[actuator] = (value, send)
+            self.max_depth = max(self.max_depth, len(self._pending))
+
+    def flush(self):
+        """Send the waiting commands, stops first."""
+        with self._lock:
+            batch = sorted(self._pending.items())
+            self._pending = {}
+            for actuator, (value, _) in batch:
+                if actuator in STATEFUL_ACTUATORS:
+                    self._showing[actuator] = value
+            self.sent += len(batch)
+        for _, (_, send) in batch:
+            send()
+
+    def forget_shown(self):
+        """Send the next LED writes even if they repeat, for a bot that may not show them any more."""
+        with self._lock:
+            self._showing = {}
+
+    def metrics(self) -> SchedulerMetrics:
+        with self._lock:
+            return SchedulerMetrics(len(self._pending), self.max_depth, self.submitted, self.sent, self.coalesced)
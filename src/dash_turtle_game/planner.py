@@ -0,0 +1,192 @@
+"""
+Shortest card route from the turtle to the goal.
+
+States are a tile and one of the four headings. LEFT and RIGHT turn in place
+and cost `TURN_TIME`, UP moves to the tile in front and costs `FORWARD_TIME`.
+Tiles marked BLOCKED can't be entered, unknown ones are assumed free.
+
+The search is D* Lite: it runs backwards from the goal, so when a tile turns
+out to be blocked only the states whose cost to the goal went through it are
+repaired, and the bot can keep replanning from wherever it is.
+
+Run with:
+    python -m dash_turtle_game.planner
+"""
+import heapq
+import math
+from typing import Iterable
+
+from .card_gui import CardType
+from .constants import DimType, Settings, TileType, TurtlePose
+
+INF = math.inf
+# Tile step for each heading index, matching theta 0, 90, 180 and 270.
+HEADING_STEPS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+
+
+def heading_index(theta: float) -> int:
+    return round(theta / 90) % 4
+
+
+class CardPlanner:
+    def __init__(self, size: DimType, goal: DimType, turn_cost: float, move_cost: float,
+                 blocked: Iterable[DimType] = ()) -> None:
+        self.size = size
+        self.goal = goal
+        self.turn_cost = turn_cost
+        self.move_cost = move_cost
+        num_states = size[0] * size[1] * 4
+        self._blocked = [False] * (size[0] * size[1])
+        for x, y in blocked:
+            self._blocked[x * size[1] + y] = True
+        self._g = [INF] * num_states
+        self._rhs = [INF] * num_states
+        # Key each state is queued with, None if it isn't queued.
+        self._queued: list[tuple[float, float] | None] = [None] * num_states
+        self._open: list[tuple[float, float, int]] = []
+        self._km = 0.0
+        self._start: int | None = None
+        # States expanded by the last plan, to measure the replanning cost.
+        self.expanded = 0
+
+        for heading in range(4):
+            state = self._state(goal[0], goal[1], heading)
+            self._rhs[state] = 0.0
+            self._push(state, (self._h_goal(state), 0.0))
+
+    @classmethod
+    def from_grid(cls, conf: Settings, grid, goal: DimType) -> "CardPlanner":
+        """Planner for the tiles marked BLOCKED on `grid`."""
+        xs, ys = (grid.types == TileType.BLOCKED.value).nonzero()
+        return cls(grid.size, goal, conf.TURN_TIME, conf.FORWARD_TIME, zip(xs.tolist(), ys.tolist()))
+
+    def _state(self, x: int, y: int, heading: int) -> int:
+        return (x * self.size[1] + y) * 4 + heading
+
+    def _h_goal(self, state: int) -> float:
+        # Before there is a start, keys only order by cost.
+        if self._start is None:
+            return 0.0
+        return self._h(self._start, state)
+
+    def _h(self, a: int, b: int) -> float:
+        # Moves to cover the distance plus turns to change heading. Each card
+        # lowers only one of the two by one, so this never overestimates.
+        ax, ay = divmod(a >> 2, self.size[1])
+        bx, by = divmod(b >> 2, self.size[1])
+        turns = (a - b) & 3
+        return (abs(ax - bx) + abs(ay - by)) * self.move_cost + min(turns, 4 - turns) * self.turn_cost
+
+    def _key(self, state: int) -> tuple[float, float]:
+        best = min(self._g[state], self._rhs[state])
+        return (best + self._h_goal(state) + self._km, best)
+
+    def _push(self, state: int, key: tuple[float, float]):
+        self._queued[state] = key
+        heapq.heappush(self._open, (key[0], key[1], state))
+
+    def _successors(self, state: int) -> Iterable[tuple[int, float, CardType]]:
+        heading = state & 3
+        base = state - heading
+        yield base + (heading + 1) % 4, self.turn_cost, CardType.LEFT
+        yield base + (heading - 1) % 4, self.turn_cost, CardType.RIGHT
+        x, y = divmod(state >> 2, self.size[1])
+        dx, dy = HEADING_STEPS[heading]
+        nx, ny = x + dx, y + dy
+        if 0 <= nx < self.size[0] and 0 <= ny < self.size[1] and not self._blocked[nx * self.size[1] + ny]:
+            yield self._state(nx, ny, heading), self.move_cost, CardType.UP
+
+    def _predecessors(self, state: int) -> Iterable[int]:
+        heading = state & 3
+        base = state - heading
+        yield base + (heading - 1) % 4
+        yield base + (heading + 1) % 4
+        tile = state >> 2
+        if self._blocked[tile]:
+            return
+        x, y = divmod(tile, self.size[1])
+        dx, dy = HEADING_STEPS[heading]
+        px, py = x - dx, y - dy
+        if 0 <= px < self.size[0] and 0 <= py < self.size[1]:
+            yield self._state(px, py, heading)
+
+    def _is_goal(self, state: int) -> bool:
+        return divmod(state >> 2, self.size[1]) == self.goal
+
+    def _update(self, state: int):
+        if not self._is_goal(state):
+            self._rhs[state] = min(
+                (cost + self._g[succ] for succ, cost, _ in self._successors(state)), default=INF
+            )
+        # Queued entries are dropped lazily when popped.
+        self._queued[state] = None
+        if self._g[state] != self._rhs[state]:
+            self._push(state, self._key(state))
+
+    def _compute(self):
+        start = self._start
+        expanded = 0
+        while self._open:
+            k1, k2, state = self._open[0]
+            if self._queued[state] != (k1, k2):
+                heapq.heappop(self._open)
+                continue
+            if (k1, k2) >= self._key(start) and self._rhs[start] == self._g[start]:
+                break
+            heapq.heappop(self._open)
+            self._queued[state] = None
+            expanded += 1
+            new_key = self._key(state)
+            if (k1, k2) < new_key:
+                self._push(state, new_key)
+            elif self._g[state] > self._rhs[state]:
+                self._g[state] = self._rhs[state]
+                for pred in self._predecessors(state):
+                    self._update(pred)
+            else:
+                self._g[state] = INF
+                self._update(state)
+                for pred in self._predecessors(state):
+                    self._update(pred)
+        self.expanded = expanded
+
+    def set_tile(self, x: int, y: int, blocked: bool):
+        """Note a tile found blocked or free. Costs nothing if it is unchanged."""
+        tile = x * self.size[1] + y
+        if self._blocked[tile] == blocked:
+            return
+        self._blocked[tile] = blocked
+        # Only the moves into the tile change cost.
+        for heading, (dx, dy) in enumerate(HEADING_STEPS):
+            px, py = x - dx, y - dy
+            if 0 <= px < self.size[0] and 0 <= py < self.size[1]:
+                self._update(self._state(px, py, heading))
+
+    def plan(self, pose: TurtlePose) -> list[CardType] | None:
+        """Cards from `pose` to the goal, None if it can't be reached."""
+        start = self._state(int(pose.x), int(pose.y), heading_index(pose.theta))
+        if self._start is not None:
+            self._km += self._h(self._start, start)
+        self._start = start
+        self._compute()
+        if self._g[start] == INF:
+            return None
+
+        cards = []
+        state = start
+        while not self._is_goal(state):
+            state, _, card = min(
+                self._successors(state), key=lambda succ: succ[1] + self._g[succ[0]]
+            )
+            cards.append(card)
+        return cards
+
+
+if __name__ == "__main__":
+    from .main import SETTINGS
+
+    planner = CardPlanner(SETTINGS.MAP_SIZE_TILES, SETTINGS.GOAL_TILE, SETTINGS.TURN_TIME, SETTINGS.FORWARD_TIME)
+    start = TurtlePose(SETTINGS.START_TILE[0] + 0.5, SETTINGS.START_TILE[1] + 0.5, SETTINGS.START_THETA)
+    print([card.name for card in planner.plan(start)])
+    planner.set_tile(5, 3, True)
+    print([card.name for card in planner.plan(start)], f"{planner.expanded} states expanded")
@@ -0,0 +1,163 @@
+"""
+Compact binary session log.
+
+The log is a short header followed by fixed size records, appended as they
+happen and flushed right away, so a crash loses nothing:
+
+    header  8s magic, u8 flags, 3x pad, f64 wall clock start
+    record  u8 kind, u8 code, u16 bot, f64 stamp, f32[5] values
+
+`stamp` is `time.perf_counter` seconds since the log was opened, and `code`
+and `values` depend on the kind:
+
+    SESSION   start tile x, y, start theta, goal x, y         when a bot connects
+    MAP       map tiles x, y, tile size cm                    when a bot connects
+    CARD      code is the `CardType` value                    queued cards, at connect
+    SENSORS   code is is_idle, x, y, degrees, left, right IR  each packet handled
+    COMMAND   code is the `CmdEvent` value, values[0] the source index in `SOURCES`
+    STAGE     code is the `StageKind`, values its arguments   each command sent to the bot
+
+At 10 sensor packets a second an hour long session is about 1MB. Logs are
+read back with `read_log`, which maps the file into a numpy record array.
+"""
+from dataclasses import dataclass
+from enum import IntEnum
+import mmap
+from pathlib import Path
+import struct
+import threading
+import time
+
+import numpy as np
+
+from .card_gui import CardType
+from .constants import CmdEvent, SensorData, Settings
+
+MAGIC = b'DASHLOG1'
+HEADER = struct.Struct('<8sB3xd')
+RECORD = struct.Struct('<BBHd5f')
+RECORD_DTYPE = np.dtype([
+    ('kind', '<u1'), ('code', '<u1'), ('bot', '<u2'), ('stamp', '<f8'), ('values', '<f4', (5,)),
+])
+# Header flags.
+FLAG_SIM_BOT = 1
+SOURCES = ('window', 'mqtt', 'card_queue')
+
+
+class RecordKind(IntEnum):
+    SESSION = 1
+    MAP = 2
+    CARD = 3
+    SENSORS = 4
+    COMMAND = 5
+    STAGE = 6
+
+
+class StageKind(IntEnum):
+    POSE = 1       # x, y, degrees, time
+    STOP = 2
+    AUDIO = 3      # sound index
+    RGB = 4        # r, g, b
+    BUTTON_LED = 5  # on
+    CELEBRATE = 6
+
+
+class SessionRecorder:
+    """Appends records to the session log. Does nothing until `open` is called."""
+
+    def __init__(self) -> None:
+        self._file = None
+        self._lock = threading.Lock()
+        self._start = 0.0
+
+    @property
+    def active(self) -> bool:
+        return self._file is not None
+
+    def open(self, path: str | Path, sim_bot: bool):
+        self._start = time.perf_counter()
+        self._file = open(path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, FLAG_SIM_BOT if sim_bot else 0, time.time()))
+        self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def record(self, kind: RecordKind, code: int = 0, values=(), bot: int = 0, stamp: float | None = None):
+        if self._file is None:
+            return
+        stamp = time.perf_counter() if stamp is None else stamp
+        values = tuple(values) + (0.0,) * (5 - len(values))
+        data = RECORD.pack(kind, code, bot, stamp - self._start, *values)
+        with self._lock:
+            if self._file is not None:
+                self._file.write(data)
+                self._file.flush()
+
+    def session(self, conf: Settings, cards: list[CardType], bot: int = 0):
+        """Record what a bot starts from when it connects."""
+        if self._file is None:
+            return
+        self.record(RecordKind.SESSION, 0, (*conf.START_TILE, conf.START_THETA, *conf.GOAL_TILE), bot)
+        self.record(RecordKind.MAP, 0, (*conf.MAP_SIZE_TILES, conf.TILE_SIZE_CM), bot)
+        for card in cards:
+            self.record(RecordKind.CARD, card.value, (), bot)
+
+    def sensors(self, sensors: SensorData, stamp: float, bot: int = 0):
+        self.record(RecordKind.SENSORS, int(sensors.is_idle), (
+            sensors.x, sensors.y, sensors.degrees,
+            sensors.distance_front_left_facing, sensors.distance_front_right_facing,
+        ), bot, stamp)
+
+    def command(self, cmd: CmdEvent, source: str, stamp: float, bot: int = 0):
+        self.record(RecordKind.COMMAND, cmd.value, (SOURCES.index(source),), bot, stamp)
+
+    def stage(self, kind: StageKind, *values: float, bot: int = 0):
+        self.record(RecordKind.STAGE, kind, values, bot)
+
+
+RECORDER = SessionRecorder()
+
+
+@dataclass
+class SessionLog:
+    sim_bot: bool
+    wall_start: float
+    records: np.ndarray  # of RECORD_DTYPE
+
+
+def read_log(path: str | Path) -> SessionLog:
+    """Map a log file into memory. A record cut short by a crash is ignored."""
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, flags, wall_start = HEADER.unpack_from(buf)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a session log")
+    count = (len(buf) - HEADER.size) // RECORD.size
+    records = np.frombuffer(buf, RECORD_DTYPE, count, HEADER.size)
+    return SessionLog(bool(flags & FLAG_SIM_BOT), wall_start, records)
+
+
+def to_sensors(record) -> SensorData:
+    x, y, degrees, left, right = record['values'].tolist()
+    return SensorData(x, y, degrees, bool(record['code']), left, right)
+
+
+if __name__ == "__main__":
+    import sys
+
+    log = read_log(sys.argv[1])
+    print(f"{'sim' if log.sim_bot else 'real'} bot, started {time.ctime(log.wall_start)}")
+    for record in log.records:
+        kind = RecordKind(record['kind'])
+        code = int(record['code'])
+        name = {
+            RecordKind.CARD: lambda: CardType(code).name,
+            RecordKind.COMMAND: lambda: CmdEvent(code).name,
+            RecordKind.STAGE: lambda: StageKind(code).name,
+        }.get(kind, lambda: str(code))()
+        values = ' '.join(f"{v:.3f}" for v in record['values'].tolist())
+        print(f"{record['stamp']:10.3f} bot{record['bot']} {kind.name:8} {name:12} {values}")
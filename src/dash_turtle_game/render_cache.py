@@ -0,0 +1,87 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+import threading
+
+import pygame
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_ANGLE_STEP = 1.0
+
+
+class RenderCache:
+    """
+    Bounded LRU cache for surfaces that are expensive to regenerate every frame.
+
+    Entries are keyed on the `id` of the source objects, so a reference to those
+    objects is kept alongside the cached surface. This keeps the ids from being
+    reused while the entry is alive.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, pygame.Surface]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, factory: Callable[[], pygame.Surface], pin: Any = None) -> pygame.Surface:
+        """Return the cached surface for key, creating it with factory on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        surface = factory()
+
+        with self._lock:
+            self._entries[key] = (pin, surface)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return surface
+
+    def rotated(self, surface: pygame.Surface, angle: float, step: float = DEFAULT_ANGLE_STEP) -> pygame.Surface:
+        """`pygame.transform.rotate` with the angle quantized to `step` degrees."""
+        quantized = round(angle / step) * step % 360.0
+        return self.get(
+            ('rotate', id(surface), quantized),
+            lambda: pygame.transform.rotate(surface, quantized),
+            pin=surface,
+        )
+
+    def tinted(self, surface: pygame.Surface, color) -> pygame.Surface:
+        """Grayscale copy of `surface` multiplied by `color`, keeping the alpha."""
+        color = pygame.Color(color)
+        def tint():
+            result = pygame.transform.grayscale(surface)
+            # Brighten before coloring, so dark colors still show.
+            result.fill((80, 80, 80), special_flags=pygame.BLEND_RGB_ADD)
+            result.fill(color, special_flags=pygame.BLEND_RGB_MULT)
+            return result
+        return self.get(('tint', id(surface), tuple(color)), tint, pin=surface)
+
+    def text(self, font: pygame.font.Font, text: str, color) -> pygame.Surface:
+        """Antialiased `font.render` output."""
+        color = pygame.Color(color)
+        return self.get(
+            ('text', id(font), text, tuple(color)),
+            lambda: font.render(text, True, color),
+            pin=font,
+        )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# Shared by the map and card widget.
+RENDER_CACHE = RenderCache()
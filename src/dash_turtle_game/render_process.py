@@ -0,0 +1,305 @@
+"""
+Run the `GameMap` renderer in its own process.
+
+The control process publishes every snapshot of the game state into a
+`multiprocessing.shared_memory` block guarded by a sequence lock. The render
+process reads the latest snapshot from it each frame, and sends the window's
+commands and map edits (dragging the turtle or goal) back over a pipe. Drawing
+then never holds the control process's GIL.
+
+The shared block is laid out as:
+    header   int64[8]   seq, version, bots, active card, connection state, goal x, goal y, cards
+    poses    float64    [bots, 3] x, y, theta
+    cards    uint8      [MAX_SHARED_CARDS] `CardType` values
+    types    uint8      [map x, map y] `TileType` values
+    observed bool       [map x, map y]
+
+The writer makes `seq` odd while it writes and even once done. A reader
+copies the block and retries if `seq` was odd or changed in the meantime.
+"""
+from contextlib import contextmanager
+import multiprocessing as mp
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+import threading
+import time
+
+import numpy as np
+
+from .card_gui import CardType
+from .channels import BoundedChannel
+from .constants import CmdEvent, DimType, Settings, TurtlePose
+from .map_state import ConnectionState, MapSnapshot, MapStateStore, _tile_labels
+from .stats import LatencyRecorder
+from .tile_grid import TileGrid
+
+# Cards past this many are not shown by the render process.
+MAX_SHARED_CARDS = 256
+HEADER_FIELDS = 8
+# Frame times are sent back in batches of this many.
+FRAME_TIME_BATCH = 30
+CONNECTION_STATES = list(ConnectionState)
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) // 8 * 8
+
+
+class SharedMapLayout:
+    """Offsets of the arrays in the shared block, for a map size and number of bots."""
+
+    def __init__(self, map_size: DimType, num_bots: int) -> None:
+        self.map_size = map_size
+        self.num_bots = num_bots
+        num_tiles = map_size[0] * map_size[1]
+        self.poses_offset = HEADER_FIELDS * 8
+        self.cards_offset = self.poses_offset + num_bots * 3 * 8
+        self.types_offset = _align(self.cards_offset + MAX_SHARED_CARDS)
+        self.observed_offset = _align(self.types_offset + num_tiles)
+        self.size = self.observed_offset + num_tiles
+
+    def views(self, buf) -> tuple[np.ndarray, ...]:
+        """(header, poses, cards, types, observed) arrays over `buf`."""
+        return (
+            np.ndarray(HEADER_FIELDS, np.int64, buf, 0),
+            np.ndarray((self.num_bots, 3), np.float64, buf, self.poses_offset),
+            np.ndarray(MAX_SHARED_CARDS, np.uint8, buf, self.cards_offset),
+            np.ndarray(self.map_size, np.uint8, buf, self.types_offset),
+            np.ndarray(self.map_size, np.bool_, buf, self.observed_offset),
+        )
+
+
+class SharedMapWriter:
+    """Publishes snapshots into a new shared block. There must only be one writer."""
+
+    def __init__(self, layout: SharedMapLayout) -> None:
+        self.layout = layout
+        self.shm = SharedMemory(create=True, size=layout.size)
+        self._header, self._poses, self._cards, self._types, self._observed = layout.views(self.shm.buf)
+        self._header[:] = 0
+        self._written_grid: tuple[np.ndarray, np.ndarray] | None = None
+
+    def write(self, snapshot: MapSnapshot):
+        header = self._header
+        header[0] += 1
+        header[1] = snapshot.version
+        header[2] = len(snapshot.turtle_poses)
+        header[3] = snapshot.active_card
+        header[4] = CONNECTION_STATES.index(snapshot.connected_state)
+        header[5], header[6] = snapshot.goal_tile
+        cards = snapshot.cards[:MAX_SHARED_CARDS]
+        header[7] = len(cards)
+        for bot, pose in enumerate(snapshot.turtle_poses):
+            self._poses[bot] = (pose.x, pose.y, pose.theta)
+        self._cards[:len(cards)] = [card.value for card in cards]
+        # Grid arrays are shared between snapshots until they change.
+        grid = snapshot.grid
+        if self._written_grid is None or self._written_grid[0] is not grid.types:
+            self._types[:] = grid.types
+        if self._written_grid is None or self._written_grid[1] is not grid.observed:
+            self._observed[:] = grid.observed
+        self._written_grid = (grid.types, grid.observed)
+        header[0] += 1
+
+    def close(self):
+        del self._header, self._poses, self._cards, self._types, self._observed
+        self.shm.close()
+        self.shm.unlink()
+
+
+class _RemoteEdit:
+    """The parts of `MapEditor` the renderer uses, sent back to the control process."""
+
+    def __init__(self, snapshot: MapSnapshot, bot: int) -> None:
+        self.bot = bot
+        self.turtle_pose = snapshot.turtle_poses[bot]
+        self.goal_tile = snapshot.goal_tile
+
+    def move_goal(self, x: int, y: int):
+        self.goal_tile = (x, y)
+
+
+class SharedMapReader:
+    """
+    Stands in for `MapStateStore` in the render process, reading snapshots
+    from the shared block and sending edits back over `conn`.
+    """
+
+    def __init__(self, conf: Settings, layout: SharedMapLayout, shm_name: str, conn: Connection) -> None:
+        self.conf = conf
+        self.shm = SharedMemory(name=shm_name)
+        self._views = layout.views(self.shm.buf)
+        self._conn = conn
+        self._labels, self._label_index = _tile_labels(conf.MAP_SIZE_TILES)
+        self._label_index = self._label_index.astype(np.int32)
+        self._snapshot: MapSnapshot | None = None
+        self._seq = -1
+        # Grid as of the last `take_changes`.
+        self._taken: TileGrid | None = None
+
+    @property
+    def snapshot(self) -> MapSnapshot:
+        header = self._views[0]
+        if int(header[0]) != self._seq:
+            self._read()
+        return self._snapshot
+
+    def _read(self):
+        header, poses, cards, types, observed = self._views
+        while True:
+            seq = int(header[0])
+            if seq & 1:
+                time.sleep(0)
+                continue
+            values = header.tolist()
+            num_bots = values[2]
+            pose_values = poses[:num_bots].tolist()
+            card_values = cards[:values[7]].tolist()
+            types_copy = types.copy()
+            observed_copy = observed.copy()
+            if int(header[0]) == seq:
+                break
+        self._seq = seq
+        self._snapshot = MapSnapshot(
+            version=values[1],
+            turtle_poses=tuple(TurtlePose(*pose) for pose in pose_values),
+            goal_tile=(values[5], values[6]),
+            grid=TileGrid(types_copy, observed_copy, self._label_index, self._labels),
+            cards=tuple(CardType(value) for value in card_values),
+            active_card=values[3],
+            connected_state=CONNECTION_STATES[values[4]],
+        )
+
+    def take_changes(self) -> tuple[MapSnapshot, np.ndarray]:
+        snapshot = self.snapshot
+        grid = snapshot.grid
+        # The renderer draws chunks from the snapshot as it first needs them.
+        if self._taken is None or self._taken is grid:
+            changed = np.empty(0, dtype=np.intp)
+        else:
+            changed = np.flatnonzero((grid.types != self._taken.types) | (grid.observed != self._taken.observed))
+        self._taken = grid
+        return snapshot, changed
+
+    @contextmanager
+    def edit(self, bot: int = 0):
+        editor = _RemoteEdit(self.snapshot, bot)
+        yield editor
+        self._conn.send(('edit', bot, editor.turtle_pose, editor.goal_tile))
+
+    def close(self):
+        del self._views
+        self.shm.close()
+
+
+class _PipeEvents:
+    """Sends the window's commands to the control process in place of `GameMap.event_queue`."""
+
+    def __init__(self, conn: Connection) -> None:
+        self._conn = conn
+
+    def put_nowait(self, cmd: CmdEvent, stamp: float | None = None):
+        self._conn.send(('cmd', time.perf_counter() if stamp is None else stamp, cmd))
+
+
+def _render_main(conf: Settings, layout: SharedMapLayout, shm_name: str, conn: Connection, ready, stop):
+    # Imported here so pygame is only loaded in the render process.
+    from .map import FRAME_RATE, GameMap
+
+    state = SharedMapReader(conf, layout, shm_name, conn)
+    game_map = GameMap(conf, state)
+    game_map.event_queue = _PipeEvents(conn)
+    ready.set()
+    frame_times = []
+    next_frame = time.perf_counter()
+    try:
+        while not stop.is_set():
+            start = time.perf_counter()
+            game_map.Draw()
+            frame_times.append(time.perf_counter() - start)
+            if len(frame_times) >= FRAME_TIME_BATCH:
+                conn.send(('frames', frame_times))
+                frame_times = []
+            next_frame = max(next_frame + 1.0 / FRAME_RATE, time.perf_counter())
+            game_map.handle_input_until(next_frame)
+    finally:
+        game_map.Stop()
+        state.close()
+        conn.close()
+
+
+class RenderProcess:
+    """
+    Runs the renderer for `state` in a child process.
+
+    Commands from the window are put on `events` with their original stamp,
+    and map edits are applied to `state`, by a thread that only wakes when the
+    render process sends something.
+    """
+
+    def __init__(self, conf: Settings, state: MapStateStore, events: BoundedChannel[CmdEvent],
+                 frame_times: LatencyRecorder) -> None:
+        self._state = state
+        self._events = events
+        self._frame_times = frame_times
+        layout = SharedMapLayout(conf.MAP_SIZE_TILES, state.num_bots)
+        self._writer = SharedMapWriter(layout)
+        # Publish the current snapshot and every one after it.
+        with state.edit():
+            state.on_publish = self._writer.write
+
+        # Spawned, so the child doesn't inherit the control process's threads.
+        context = mp.get_context('spawn')
+        recv_conn, send_conn = context.Pipe(duplex=False)
+        self._conn = recv_conn
+        self._stop = context.Event()
+        ready = context.Event()
+        self._process = context.Process(
+            target=_render_main,
+            args=(conf, layout, self._writer.shm.name, send_conn, ready, self._stop),
+            daemon=True,
+        )
+        self._process.start()
+        send_conn.close()
+        while not ready.wait(0.1):
+            if not self._process.is_alive():
+                self._conn.close()
+                with state.edit():
+                    state.on_publish = None
+                self._writer.close()
+                raise RuntimeError(f"The render process exited with code {self._process.exitcode} while starting")
+        self._stopping = False
+        self._receiver = threading.Thread(target=self._receive, daemon=True)
+        self._receiver.start()
+
+    def _receive(self):
+        while True:
+            try:
+                message = self._conn.recv()
+            except (EOFError, OSError):
+                if not self._stopping:
+                    # The render process died, shut down as if its window was closed.
+                    self._events.put_nowait(CmdEvent.QUIT)
+                return
+            kind = message[0]
+            if kind == 'cmd':
+                _, stamp, cmd = message
+                self._events.put_nowait(cmd, stamp)
+            elif kind == 'edit':
+                _, bot, pose, goal = message
+                with self._state.edit(bot) as map_edit:
+                    map_edit.turtle_pose = pose
+                    if goal != map_edit.goal_tile:
+                        map_edit.move_goal(*goal)
+            elif kind == 'frames':
+                for duration in message[1]:
+                    self._frame_times.record(duration)
+
+    def stop(self):
+        self._stopping = True
+        self._stop.set()
+        self._process.join()
+        self._receiver.join()
+        with self._state.edit():
+            self._state.on_publish = None
+        self._writer.close()
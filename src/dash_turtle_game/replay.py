@@ -0,0 +1,260 @@
+"""
+Replay a session log through `main.robot_ctrl`.
+
+The logged sensor packets are fed back in place of the bot, and the logged
+commands are put on the window channel, at 1x or any speed up. The bot
+commands the controller sends are compared with the logged ones.
+
+Run with:
+    python -m dash_turtle_game.replay session.bin --speed 10
+"""
+import argparse
+from dataclasses import dataclass, replace
+from threading import Thread
+import time
+
+import numpy as np
+
+from .card_gui import CardType
+from .channels import BoundedChannel, LatestValueChannel
+from .constants import BotSounds, CmdEvent, QueueResult, SensorData, Settings, TurtlePose
+from .main import SystemControl, robot_ctrl
+from .outbound import CommandScheduler
+from .recorder import RecordKind, SessionLog, StageKind, read_log, to_sensors
+from .robot_frame import RobotFrame
+from .sim_game import SIM_SETTINGS
+from .timeline import EffectTrack
+from .tracing import TRACER, CommandTrace
+
+# Stop if the controller hasn't asked for a packet in this many seconds.
+CONTROLLER_TIMEOUT_SEC = 1.0
+# Logged commands wait this long for the controller to pick them up.
+COMMAND_WAIT_SEC = 0.05
+# Bot commands compared between the log and the replay.
+COMPARED_STAGES = (StageKind.POSE, StageKind.STOP, StageKind.AUDIO, StageKind.CELEBRATE)
+
+
+class ReplayRobotControl:
+    """
+    Stands in for `RobotControl`. Poses are computed like the bot the log came
+    from, and the bot commands are only noted.
+    """
+
+    def __init__(self, conf: Settings, sensors: SensorData, sim_bot: bool) -> None:
+        self.conf = conf
+        self.sensors = sensors
+        # Logs of the simulated bot hold poses in virtual coordinates already.
+        self.frame = None if sim_bot else RobotFrame(sensors, conf)
+        self.sim_bot = sim_bot
+        self.bot = 0
+        self.staged: list[StageKind] = []
+        # When the packet being replayed was logged, so effects keep the
+        # session's timing at any replay speed.
+        self.now = 0.0
+
+    def update_sensors(self, sensors: SensorData):
+        self.sensors = sensors
+
+    def turn(self, turn_clockwise: bool, trace: CommandTrace | None = None):
+        self.face_heading(trace)
+
+    def face_heading(self, trace: CommandTrace | None = None):
+        self.staged.append(StageKind.POSE)
+        if trace is not None:
+            TRACER.staged(trace, key=self.bot)
+
+    def forward(self, reverse=False, tiles=1, move_time: float | None = None, trace: CommandTrace | None = None):
+        self.face_heading(trace)
+
+    def get_pose(self) -> TurtlePose:
+        if self.frame is None:
+            return TurtlePose(self.sensors.x, self.sensors.y, self.sensors.degrees)
+        return self.frame.to_virtual(self.sensors)
+
+    def set_bot_rgb(self):
+        self.staged.append(StageKind.RGB)
+
+    def do_celebrate(self):
+        self.staged.append(StageKind.CELEBRATE)
+        if self.sim_bot:
+            # The simulated bot logs its spin as a pose.
+            self.staged.append(StageKind.POSE)
+
+    def clock(self) -> float:
+        return self.now
+
+    def apply_effect(self, track: EffectTrack, value):
+        if track == EffectTrack.LEDS and value is None:
+            self.set_bot_rgb()
+
+    def set_main_button_led(self, is_on: bool):
+        self.staged.append(StageKind.BUTTON_LED)
+
+    def stop(self):
+        self.staged.append(StageKind.STOP)
+
+    def play_sound(self, sound: BotSounds):
+        self.staged.append(StageKind.AUDIO)
+
+
+def session_records(log: SessionLog, session: int = 0, bot: int = 0) -> np.ndarray:
+    """Records of one bot from its `session`th connection up to the next one."""
+    records = log.records[log.records['bot'] == bot]
+    starts = np.flatnonzero(records['kind'] == RecordKind.SESSION)
+    if session >= len(starts):
+        raise ValueError(f"The log has {len(starts)} sessions for bot {bot}")
+    end = starts[session + 1] if session + 1 < len(starts) else len(records)
+    return records[starts[session]:end]
+
+
+def session_settings(records: np.ndarray, sim_bot: bool, base: Settings = SIM_SETTINGS) -> tuple[Settings, list[CardType]]:
+    """The settings and queued cards a session started with."""
+    start_x, start_y, start_theta, goal_x, goal_y = records[records['kind'] == RecordKind.SESSION][0]['values'].tolist()
+    size_x, size_y, tile_cm = records[records['kind'] == RecordKind.MAP][0]['values'].tolist()[:3]
+    conf = replace(
+        base,
+        START_TILE=(int(start_x), int(start_y)),
+        START_THETA=start_theta,
+        GOAL_TILE=(int(goal_x), int(goal_y)),
+        MAP_SIZE_TILES=(int(size_x), int(size_y)),
+        TILE_SIZE_CM=tile_cm,
+        USE_SIM_BOT=sim_bot,
+    )
+    cards = [CardType(int(code)) for code in records[records['kind'] == RecordKind.CARD]['code']]
+    return conf, cards
+
+
+class RobotInterface:
+    """
+    Feeds a session's sensor packets to the controller, `speed` times faster
+    than they were logged, or as fast as the controller keeps up with 0.
+
+    Packets are sent in lockstep with the controller, so none are dropped
+    however fast the replay runs.
+    """
+
+    def __init__(self, conf: Settings, records: np.ndarray, sim_bot: bool, speed: float = 1.0,
+                 commands: BoundedChannel[CmdEvent] | None = None) -> None:
+        self.conf = conf
+        self.sensor_queue: LatestValueChannel[SensorData | None] = LatestValueChannel()
+        # Commands take effect right away, nothing is queued.
+        self.outbound: CommandScheduler | None = None
+        self.records = records
+        self.speed = speed
+        self.commands = commands
+        packets = records[records['kind'] == RecordKind.SENSORS]
+        self.robot_ctrl = ReplayRobotControl(conf, to_sensors(packets[0]), sim_bot)
+        self.expected: list[StageKind] = []
+        self.packets_sent = 0
+        self.running = False
+
+    def run(self):
+        self.running = True
+        start_stamp = float(self.records[0]['stamp'])
+        wall_start = time.perf_counter()
+        try:
+            for record in self.records:
+                if not self.running:
+                    break
+                if self.speed > 0:
+                    delay = wall_start + (record['stamp'] - start_stamp) / self.speed - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                kind = record['kind']
+                if kind == RecordKind.SENSORS:
+                    # The simulated bot's effects ran on its virtual clock, a tick per packet.
+                    self.robot_ctrl.now = (
+                        (self.packets_sent + 1) * self.conf.SIM_TICK_SEC if self.robot_ctrl.sim_bot
+                        else float(record['stamp'])
+                    )
+                    self.sensor_queue.put_nowait(to_sensors(record))
+                    self.packets_sent += 1
+                    if not self.sensor_queue.wait_for_reader(timeout=CONTROLLER_TIMEOUT_SEC):
+                        print("Controller stopped reading sensors")
+                        break
+                elif kind == RecordKind.COMMAND and self.commands is not None:
+                    self.commands.put_nowait(CmdEvent(int(record['code'])))
+                    self.commands.wait_for_reader(timeout=COMMAND_WAIT_SEC)
+                elif kind == RecordKind.STAGE:
+                    self.expected.append(StageKind(int(record['code'])))
+        except KeyboardInterrupt:
+            pass
+        self.running = False
+        self.sensor_queue.put_nowait(None)
+
+    def reconnect(self):
+        """The logged packets go on as they were, reconnecting included."""
+
+    def stop(self):
+        self.running = False
+
+
+@dataclass
+class ReplayResult:
+    packets: int
+    final_pose: TurtlePose
+    queue_result: QueueResult | None
+    # Bot commands in the log and sent by the replayed controller.
+    expected: list[StageKind]
+    replayed: list[StageKind]
+    # Index of the first bot command that differs, None if they all match.
+    diverged_at: int | None
+    wall_time_sec: float
+
+
+def replay_session(path: str, session: int = 0, speed: float = 0.0, bot: int = 0) -> ReplayResult:
+    start = time.perf_counter()
+    log = read_log(path)
+    records = session_records(log, session, bot)
+    conf, cards = session_settings(records, log.sim_bot)
+    sys_ctrl = SystemControl(replace(conf, RECORD_PATH=None))
+    try:
+        with sys_ctrl.game_gui.edit_map() as map_edit:
+            for card in cards:
+                map_edit.add_card(card)
+        bot_intr = RobotInterface(conf, records, log.sim_bot, speed, sys_ctrl.game_gui.window_channel)
+        sys_ctrl.bot_intr = bot_intr
+        ctrl_thread = Thread(target=robot_ctrl, args=(sys_ctrl,))
+        ctrl_thread.start()
+        bot_intr.run()
+        ctrl_thread.join()
+        sys_ctrl.bot_intr = None
+
+        expected = [kind for kind in bot_intr.expected if kind in COMPARED_STAGES]
+        replayed = [kind for kind in bot_intr.robot_ctrl.staged if kind in COMPARED_STAGES]
+        diverged_at = next((i for i, (a, b) in enumerate(zip(expected, replayed)) if a != b), None)
+        if diverged_at is None and len(expected) != len(replayed):
+            diverged_at = min(len(expected), len(replayed))
+        return ReplayResult(
+            packets=bot_intr.packets_sent,
+            final_pose=sys_ctrl.game_gui.get_snapshot().turtle_pose,
+            queue_result=sys_ctrl.queue_result,
+            expected=expected,
+            replayed=replayed,
+            diverged_at=diverged_at,
+            wall_time_sec=time.perf_counter() - start,
+        )
+    finally:
+        sys_ctrl.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a session log through the controller")
+    parser.add_argument('log', help='session log written with RECORD_PATH')
+    parser.add_argument('--session', type=int, default=0, help='which connection in the log to replay')
+    parser.add_argument('--bot', type=int, default=0, help='which bot of a fleet to replay')
+    parser.add_argument('--speed', type=float, default=1.0, help='speed up, 0 for as fast as possible')
+    args = parser.parse_args()
+
+    result = replay_session(args.log, args.session, args.speed, args.bot)
+    print(f"{result.packets} packets in {result.wall_time_sec:.2f}s, ended at {result.final_pose}, "
+          f"queue {result.queue_result}")
+    if result.diverged_at is None:
+        print(f"All {len(result.expected)} bot commands match the log")
+    else:
+        print(f"Bot commands diverge from the log at {result.diverged_at}: "
+              f"logged {result.expected[result.diverged_at:][:5]}, replayed {result.replayed[result.diverged_at:][:5]}")
+
+
+if __name__ == "__main__":
+    main()
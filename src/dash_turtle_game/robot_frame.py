@@ -0,0 +1,72 @@
+import math
+
+from .constants import SensorData, Settings, TurtlePose, normalize_ang360
+
+# Coordinates notes:
+# The robot reports things in cm with theta rotated -90 and a random offset in x,y,theta for the robot's start state
+#
+# The control uses unitless distance where each tile is 1x1
+#
+# Kept apart from `bot_interface` so logs of real bots can be replayed
+# without WonderPy installed.
+
+
+def rotate_point(x, y, sigma_degrees):
+    """
+    Rotate a point (x, y) around the origin by sigma degrees counterclockwise.
+
+    Args:
+        x: x-coordinate of the point
+        y: y-coordinate of the point
+        sigma_degrees: rotation angle in degrees (positive = counterclockwise)
+
+    Returns:
+        tuple: (x', y') - the rotated point coordinates
+    """
+    # Convert degrees to radians
+    sigma_radians = math.radians(sigma_degrees)
+
+    # Apply rotation formulas
+    x_prime = x * math.cos(sigma_radians) - y * math.sin(sigma_radians)
+    y_prime = x * math.sin(sigma_radians) + y * math.cos(sigma_radians)
+
+    return x_prime, y_prime
+
+
+class RobotFrame:
+    """Transform between the robot's coordinates and the virtual ones, anchored at the first sensor packet."""
+
+    def __init__(self, sensors: SensorData, conf: Settings) -> None:
+        self.start_pose_robot = TurtlePose(sensors.x, sensors.y, sensors.degrees)
+        self.start_pose_virtual = TurtlePose(
+            conf.START_TILE[0] + 0.5,
+            conf.START_TILE[1] + 0.5,
+            conf.START_THETA,
+        )
+        self.theta_offset = self.start_pose_virtual.theta - self.start_pose_robot.theta
+        self.pos_scale = 1.0 / conf.TILE_SIZE_CM
+
+    def to_robot(self, x: float, y: float) -> tuple[float, float]:
+        # Transform from virtual coordinates to robot coordinates
+        # 1. Remove virtual start offset and convert to cm
+        # 2. Rotate to the robots sensor orientation
+        # 3. Add back the robots start position offset
+        desired_x = (x - self.start_pose_virtual.x) / self.pos_scale
+        desired_y = (y - self.start_pose_virtual.y) / self.pos_scale
+        desired_x, desired_y = rotate_point(
+            desired_x, desired_y, 90 - self.theta_offset
+        )
+        return desired_x + self.start_pose_robot.x, desired_y + self.start_pose_robot.y
+
+    def to_virtual(self, sensors: SensorData) -> TurtlePose:
+        # Remove start offset so robot starts at 0,0
+        bot_x = sensors.x - self.start_pose_robot.x
+        bot_y = sensors.y - self.start_pose_robot.y
+        # Apply rotation so robot starts at correct angle
+        # -90 to handle turtle bot coordinates face in +y direction
+        bot_x, bot_y = rotate_point(bot_x, bot_y, self.theta_offset - 90)
+        return TurtlePose(
+            bot_x * self.pos_scale + self.start_pose_virtual.x,
+            bot_y * self.pos_scale + self.start_pose_virtual.y,
+            normalize_ang360(sensors.degrees + self.theta_offset),
+        )
@@ -1,81 +1,281 @@
-from enum import StrEnum, auto
-import time
+from dataclasses import dataclass, replace
 import math
-from queue import Queue
-from dataclasses import replace
-import threading
+import random
+import time
+
+from .channels import LatestValueChannel
+from .constants import TurtlePose, Settings, SensorData, normalize_ang360, BotSounds, forward_time
+from .outbound import CommandScheduler
+from .recorder import RECORDER, StageKind
+from .sim_sensors import IRSensorModel
+from .timeline import EffectTrack
+from .tracing import TRACER, CommandTrace
+
+# Coordinates notes:
+# The simulated bot reports poses directly in the unitless virtual coordinates
+# the control uses, where each tile is 1x1.
+#
+# Like the real robot, it tracks two poses. The odometry pose is where the bot
+# thinks it is, and it always reaches the commanded pose. The true pose is
+# where it actually is, which drifts away from the odometry pose with every
+# move.
+
+# Time the celebration spin takes.
+CELEBRATE_TIME = 4.0
+# Stop if the controller hasn't asked for a packet in this many wall clock seconds.
+CONTROLLER_TIMEOUT_SEC = 1.0
+
+
+class SimClock:
+    """
+    Virtual time for the simulator.
+
+    Time only moves when `advance` is called. `pace` sleeps until wall time
+    catches up with virtual time divided by `time_scale`, and does nothing when
+    `time_scale` is 0.
+    """
+
+    def __init__(self, time_scale: float) -> None:
+        self.time_scale = time_scale
+        self.now = 0.0
+        self._wall_start = time.perf_counter()
+
+    def advance(self, dt: float):
+        self.now += dt
+
+    def pace(self):
+        if self.time_scale <= 0:
+            return
+        delay = self._wall_start + self.now / self.time_scale - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _smoothstep(u: float) -> float:
+    """Ease in and out, like the bot accelerating and braking."""
+    u = min(max(u, 0.0), 1.0)
+    return u * u * (3.0 - 2.0 * u)
+
+
+@dataclass
+class Motion:
+    """A staged move of (dx, dy, dtheta) from `start` over `duration` virtual seconds."""
+    start: TurtlePose
+    dx: float
+    dy: float
+    dtheta: float
+    start_time: float
+    duration: float
+
+    def progress(self, now: float) -> float:
+        """Fraction of the move completed, from 0 to 1."""
+        if self.duration <= 0:
+            return 1.0
+        return _smoothstep((now - self.start_time) / self.duration)
+
+    def pose_at(self, s: float) -> TurtlePose:
+        return TurtlePose(
+            self.start.x + self.dx * s,
+            self.start.y + self.dy * s,
+            normalize_ang360(self.start.theta + self.dtheta * s),
+        )
 
-from .constants import TurtlePose, Settings, SensorData, normalize_ang360, BotSounds
+    def is_done(self, now: float) -> bool:
+        return now >= self.start_time + self.duration
 
 
 class RobotControl:
+    """
+    Simulated counterpart of `bot_interface.RobotControl`.
+
+    Commands stage a `Motion` that plays out as `step` is called with the
+    virtual time. The bot reports busy until the motion completes.
+    """
+
     def __init__(self, conf: Settings) -> None:
+        self.conf = conf
         self.virtual_pos = TurtlePose(
             conf.START_TILE[0] + 0.5,
             conf.START_TILE[1] + 0.5,
             conf.START_THETA,
         )
+        self.odometry_pose = self.virtual_pos
+        self.true_pose = self.virtual_pos
+        self.motion: Motion | None = None
+        self._progress = 0.0
+        self.sensors: SensorData | None = None
+        self.rng = random.Random(conf.SIM_SEED)
+        self.ir_model = IRSensorModel(conf, conf.SIM_SEED)
+        self.now = 0.0
+        # Virtual time the last motion finished.
+        self.idle_since = 0.0
+        self.sounds: list[BotSounds] = []
+        self.led_color: tuple[float, float, float] | None = None
+        # Index of the bot in a fleet, for the session log.
+        self.bot = 0
+        # Wall clock `time.perf_counter` of the last command, for latency measurements.
+        self.last_command_time: float | None = None
+
+    def _stage(self, dx: float, dy: float, dtheta: float, duration: float):
+        self.motion = Motion(self.odometry_pose, dx, dy, dtheta, self.now, duration)
+        end = self.motion.pose_at(1.0)
+        RECORDER.stage(StageKind.POSE, end.x, end.y, end.theta, duration, bot=self.bot)
+        self._progress = 0.0
+        self.last_command_time = time.perf_counter()
+
+    def step(self, now: float):
+        """Advance the staged motion to virtual time `now`."""
+        self.now = now
+        if self.motion is None:
+            return
+        progress = self.motion.progress(now)
+        step = progress - self._progress
+        self._progress = progress
+        # Apply the odometry change to the true pose, with the drift errors.
+        dx = self.motion.dx * step
+        dy = self.motion.dy * step
+        dtheta = self.motion.dtheta * step
+        heading_error = math.radians(self.true_pose.theta - self.odometry_pose.theta)
+        scale = 1.0 + self.conf.SIM_DISTANCE_DRIFT
+        self.true_pose = TurtlePose(
+            self.true_pose.x + (dx * math.cos(heading_error) - dy * math.sin(heading_error)) * scale,
+            self.true_pose.y + (dx * math.sin(heading_error) + dy * math.cos(heading_error)) * scale,
+            normalize_ang360(self.true_pose.theta + dtheta * (1.0 + self.conf.SIM_TURN_DRIFT)),
+        )
+        self.odometry_pose = self.motion.pose_at(progress)
+        if self.motion.is_done(now):
+            self.motion = None
+            self.idle_since = now
+
+    def is_idle(self) -> bool:
+        return self.motion is None
+
+    def read_sensors(self) -> SensorData:
+        pose = self.odometry_pose
+        pose_noise = self.conf.SIM_POSE_NOISE_TILES
+        heading_noise = self.conf.SIM_HEADING_NOISE_DEG
+        # The IR beams see the world from where the bot really is.
+        left, right = self.ir_model.read([(self.true_pose.x, self.true_pose.y, self.true_pose.theta)])[0]
+        return SensorData(
+            x=pose.x + (self.rng.gauss(0.0, pose_noise) if pose_noise else 0.0),
+            y=pose.y + (self.rng.gauss(0.0, pose_noise) if pose_noise else 0.0),
+            degrees=normalize_ang360(pose.theta + (self.rng.gauss(0.0, heading_noise) if heading_noise else 0.0)),
+            is_idle=self.is_idle(),
+            distance_front_left_facing=float(left),
+            distance_front_right_facing=float(right),
+        )
 
     def update_sensors(self, sensors: SensorData):
-        pass
+        self.sensors = sensors
 
-    def turn(self, turn_clockwise: bool):
+    def turn(self, turn_clockwise: bool, trace: CommandTrace | None = None):
         new_theta = normalize_ang360(self.virtual_pos.theta + (-90.0 if turn_clockwise else 90.0))
         self.virtual_pos = replace(self.virtual_pos, theta = new_theta)
+        self.face_heading(trace)
+
+    def face_heading(self, trace: CommandTrace | None = None):
+        dtheta = (self.virtual_pos.theta - self.odometry_pose.theta + 180.0) % 360.0 - 180.0
+        self._stage(0.0, 0.0, dtheta, self.conf.TURN_TIME)
+        if trace is not None:
+            TRACER.staged(trace, key=self.bot)
 
-    def forward(self, reverse=False):
-        virtual_dist = -1.0 if reverse else 1.0
+    def forward(self, reverse=False, tiles=1, move_time: float | None = None, trace: CommandTrace | None = None):
+        virtual_dist = -tiles if reverse else tiles
         rad = math.radians(self.virtual_pos.theta)
         new_x = self.virtual_pos.x + math.cos(rad) * virtual_dist
         new_y = self.virtual_pos.y + math.sin(rad) * virtual_dist
         self.virtual_pos = replace(self.virtual_pos, x=new_x, y=new_y)
+        self._stage(new_x - self.odometry_pose.x, new_y - self.odometry_pose.y, 0.0, forward_time(self.conf, tiles) if move_time is None else move_time)
+        if trace is not None:
+            TRACER.staged(trace, key=self.bot)
 
     def get_pose(self):
-        return self.virtual_pos
+        assert self.sensors is not None
+        return TurtlePose(self.sensors.x, self.sensors.y, self.sensors.degrees)
 
     def set_bot_rgb(self):
-        pass
+        self.led_color = self.conf.LED_COLOR
+        RECORDER.stage(StageKind.RGB, *(self.led_color or (0, 0, 0)), bot=self.bot)
 
     def do_celebrate(self):
-        pass
+        RECORDER.stage(StageKind.CELEBRATE, bot=self.bot)
+        self._stage(0.0, 0.0, 360.0, CELEBRATE_TIME)
+
+    def clock(self) -> float:
+        return self.now
+
+    def apply_effect(self, track: EffectTrack, value):
+        if track == EffectTrack.SOUND:
+            self.sounds.append(value)
+        elif value is None:
+            self.set_bot_rgb()
+        else:
+            self.led_color = value[1]
 
     def set_main_button_led(self, is_on: bool):
-        pass
+        RECORDER.stage(StageKind.BUTTON_LED, int(is_on), bot=self.bot)
 
     def stop(self):
-        pass
+        self.motion = None
+        self.idle_since = self.now
+        RECORDER.stage(StageKind.STOP, bot=self.bot)
 
     def play_sound(self, sound: BotSounds):
-        pass
+        self.sounds.append(sound)
+        RECORDER.stage(StageKind.AUDIO, sound.value, bot=self.bot)
 
 
 class RobotInterface:
 
     def __init__(self, conf: Settings) -> None:
         self.conf = conf
-        self.sensor_queue: Queue[SensorData | None] = Queue()
+        # Only the newest packet matters, stale ones are dropped.
+        self.sensor_queue: LatestValueChannel[SensorData | None] = LatestValueChannel()
         self.robot_ctrl = RobotControl(conf)
+        # Commands take effect right away, nothing is queued.
+        self.outbound: CommandScheduler | None = None
+        self.clock = SimClock(conf.SIM_TIME_SCALE)
         self.running = False
 
-    def run(self):
+    def run(self, idle_timeout_sec: float | None = None, max_sim_time_sec: float | None = None):
+        """
+        Publish a sensor packet every `SIM_TICK_SEC` of virtual time.
+
+        Each packet waits for the controller to finish with the previous one,
+        so commands always take effect on the next tick no matter how fast the
+        clock runs. Stops when the bot has been idle for `idle_timeout_sec`, or
+        after `max_sim_time_sec`.
+        """
         self.running = True
         try:
             while self.running:
-                self.sensor_queue.put_nowait(
-                    SensorData(
-                        x=self.robot_ctrl.virtual_pos.x,
-                        y=self.robot_ctrl.virtual_pos.y,
-                        degrees=self.robot_ctrl.virtual_pos.theta,
-                        is_idle=True,
-                        distance_front_left_facing=0,
-                        distance_front_right_facing=0,
-                    )
-                )
-                time.sleep(0.1)
+                self.clock.advance(self.conf.SIM_TICK_SEC)
+                self.robot_ctrl.step(self.clock.now)
+                self.sensor_queue.put_nowait(self.robot_ctrl.read_sensors())
+                waited = 0.0
+                while self.running and not self.sensor_queue.wait_for_reader(timeout=0.1):
+                    waited += 0.1
+                    if waited >= CONTROLLER_TIMEOUT_SEC:
+                        print("Controller stopped reading sensors")
+                        self.running = False
+
+                if max_sim_time_sec is not None and self.clock.now >= max_sim_time_sec:
+                    break
+                if (
+                    idle_timeout_sec is not None
+                    and self.robot_ctrl.is_idle()
+                    and self.clock.now - self.robot_ctrl.idle_since >= idle_timeout_sec
+                ):
+                    break
+                self.clock.pace()
         except KeyboardInterrupt:
             pass
 
+        self.running = False
         self.sensor_queue.put_nowait(None)
 
+    def reconnect(self):
+        """The simulated bot is never lost, its packets only wait for the controller."""
+
     def stop(self):
         self.running = False
@@ -0,0 +1,93 @@
+"""
+Run a full game against the simulated bot, as fast as the controller allows.
+
+Run with:
+    python -m dash_turtle_game.sim_game
+"""
+from dataclasses import dataclass, replace
+from threading import Thread
+import time
+
+from .card_gui import CardType
+from .constants import BotSounds, QueueResult, Settings, TurtlePose
+from .main import SETTINGS, SystemControl, robot_ctrl
+from .sim_bot_interface import RobotInterface
+
+SIM_SETTINGS = replace(
+    SETTINGS,
+    MQTT_BROKER_ADDR=None,
+    USE_SIM_BOT=True,
+    HEADLESS=True,
+    SIM_TIME_SCALE=0.0,
+    # Headless runs leave the user's cache alone.
+    ASSET_CACHE_DIR=None,
+    ROBOT_NAME_PATH=None,
+)
+
+# The bot is done once it sits idle this long without a new command.
+IDLE_TIMEOUT_SEC = 1.0
+MAX_SIM_TIME_SEC = 3600.0
+
+
+@dataclass
+class GameResult:
+    reached_goal: bool
+    # None if the queue never finished, e.g. the game ran past MAX_SIM_TIME_SEC.
+    queue_result: QueueResult | None
+    # Cards started, including one that failed.
+    steps: int
+    final_pose: TurtlePose
+    true_pose: TurtlePose
+    sounds: list[BotSounds]
+    sim_time_sec: float
+    wall_time_sec: float
+
+
+def run_game(cards: list[CardType], conf: Settings = SIM_SETTINGS, plan: bool = False) -> GameResult:
+    """
+    Queue `cards` and run them through `main.robot_ctrl` with a simulated bot.
+    With `plan`, the planned route to the goal is queued in their place, and
+    replanned around obstacles found on the way.
+    """
+    start = time.perf_counter()
+    sys_ctrl = SystemControl(conf)
+    try:
+        with sys_ctrl.game_gui.edit_map() as map_edit:
+            for card in cards:
+                map_edit.add_card(card)
+        if plan:
+            sys_ctrl.plan_route()
+
+        bot_intr = RobotInterface(sys_ctrl.game_gui.get_updated_settings())
+        sys_ctrl.bot_intr = bot_intr
+        ctrl_thread = Thread(target=robot_ctrl, args=(sys_ctrl,))
+        ctrl_thread.start()
+        bot_intr.run(idle_timeout_sec=IDLE_TIMEOUT_SEC, max_sim_time_sec=MAX_SIM_TIME_SEC)
+        ctrl_thread.join()
+        sys_ctrl.bot_intr = None
+
+        snapshot = sys_ctrl.game_gui.get_snapshot()
+        pose = snapshot.turtle_pose
+        return GameResult(
+            reached_goal=(int(pose.x), int(pose.y)) == snapshot.goal_tile,
+            queue_result=sys_ctrl.queue_result,
+            steps=snapshot.active_card + 1,
+            final_pose=pose,
+            true_pose=bot_intr.robot_ctrl.true_pose,
+            sounds=bot_intr.robot_ctrl.sounds,
+            sim_time_sec=bot_intr.clock.now,
+            wall_time_sec=time.perf_counter() - start,
+        )
+    finally:
+        sys_ctrl.stop()
+
+
+if __name__ == "__main__":
+    # Drive from the default start to the default goal.
+    cards = [CardType.RIGHT] + [CardType.UP] * 2 + [CardType.RIGHT] + [CardType.UP] * 5
+    print(run_game(cards))
+    # A hidden obstacle in the way is detected and the queue stops.
+    print(run_game(cards, replace(SIM_SETTINGS, SIM_OBSTACLE_TILES=((5, 3),), SIM_IR_NOISE=2.0, SIM_SEED=1)))
+    # A planned route drives around it instead.
+    print(run_game([], replace(SIM_SETTINGS, SIM_OBSTACLE_TILES=((5, 3),), SIM_IR_NOISE=2.0, SIM_SEED=1), plan=True))
+    print(run_game(cards, replace(SIM_SETTINGS, SIM_DISTANCE_DRIFT=0.05, SIM_TURN_DRIFT=0.02, SIM_POSE_NOISE_TILES=0.01, SIM_SEED=1)))
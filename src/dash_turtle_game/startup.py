@@ -0,0 +1,50 @@
+"""
+Timing of the startup stages, from the controller's first import to the
+first frame drawn.
+
+Stages can run on different threads, so the report shows when each one
+started and ended, and which thread ran it.
+"""
+from contextlib import contextmanager
+import threading
+import time
+
+
+class StartupTimer:
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+        # (name, start, end, thread), in seconds from `start`.
+        self.stages: list[tuple[str, float, float, str]] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        begin = time.perf_counter() - self.start
+        try:
+            yield
+        finally:
+            self._add(name, begin)
+
+    def mark(self, name: str, since_start: bool = False):
+        """Note `name` done now, covering the time from startup if `since_start`."""
+        now = time.perf_counter() - self.start
+        self._add(name, 0.0 if since_start else now, now)
+
+    def _add(self, name: str, begin: float, end: float | None = None):
+        if end is None:
+            end = time.perf_counter() - self.start
+        with self._lock:
+            self.stages.append((name, begin, end, threading.current_thread().name))
+
+    def report(self) -> str:
+        with self._lock:
+            stages = sorted(self.stages, key=lambda stage: stage[1])
+        lines = ["Startup timing, ms since the first import:"]
+        for name, begin, end, thread in stages:
+            span = f"{end * 1e3:6.0f}" if begin == end else f"{begin * 1e3:6.0f} - {end * 1e3:6.0f}"
+            lines.append(f"  {name:24} {span:>15}  {thread}")
+        return "\n".join(lines)
+
+
+STARTUP = StartupTimer()
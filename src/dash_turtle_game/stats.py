@@ -0,0 +1,50 @@
+from collections import deque
+import math
+import threading
+from typing import Sequence
+
+
+def percentile(samples: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of `samples`. Returns 0 for an empty sequence."""
+    if len(samples) == 0:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def format_summary(name: str, samples_sec: Sequence[float]) -> str:
+    """One line summary of a set of durations in seconds, printed in ms."""
+    if len(samples_sec) == 0:
+        return f"{name}: no samples"
+    mean = sum(samples_sec) / len(samples_sec)
+    return (
+        f"{name}: n={len(samples_sec)}"
+        f" mean={mean * 1e3:.3f}ms"
+        f" p50={percentile(samples_sec, 50) * 1e3:.3f}ms"
+        f" p95={percentile(samples_sec, 95) * 1e3:.3f}ms"
+        f" p99={percentile(samples_sec, 99) * 1e3:.3f}ms"
+    )
+
+
+class LatencyRecorder:
+    """Thread safe rolling window of duration samples."""
+
+    def __init__(self, max_samples: int = 10000) -> None:
+        self._samples: deque[float] = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, duration_sec: float):
+        with self._lock:
+            self._samples.append(duration_sec)
+
+    def samples(self) -> list[float]:
+        with self._lock:
+            return list(self._samples)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+    def summary(self, name: str) -> str:
+        return format_summary(name, self.samples())
@@ -0,0 +1,63 @@
+from typing import Sequence
+
+import numpy as np
+
+from .constants import DimType, TileState, TileType
+
+
+class TileGrid:
+    """
+    Compact, immutable tile storage indexed as [x, y].
+
+    Tile types are stored as their `TileType.value`, observation as a bool, and
+    the text as an index into the shared `labels` table. The arrays are marked
+    read only, so a grid can be shared between threads. Edits make a new grid,
+    copying only the arrays they change.
+    """
+
+    def __init__(self, types: np.ndarray, observed: np.ndarray, label_index: np.ndarray, labels: Sequence[str]) -> None:
+        for arr in (types, observed, label_index):
+            arr.flags.writeable = False
+        self.types = types
+        self.observed = observed
+        self.label_index = label_index
+        self.labels = labels
+
+    @classmethod
+    def create(cls, size: DimType, labels: Sequence[str], label_index: np.ndarray) -> "TileGrid":
+        """All tiles empty and unobserved."""
+        return cls(
+            np.full(size, TileType.EMPTY.value, dtype=np.uint8),
+            np.zeros(size, dtype=bool),
+            label_index.astype(np.int32),
+            labels,
+        )
+
+    @property
+    def size(self) -> DimType:
+        return self.types.shape
+
+    def is_valid(self, x: int, y: int) -> bool:
+        return 0 <= x < self.types.shape[0] and 0 <= y < self.types.shape[1]
+
+    def type_at(self, x: int, y: int) -> TileType:
+        return TileType(int(self.types[x, y]))
+
+    def text_at(self, x: int, y: int) -> str:
+        return self.labels[self.label_index[x, y]]
+
+    def tile(self, x: int, y: int) -> TileState:
+        """`TileState` view of a single tile."""
+        return TileState(self.type_at(x, y), bool(self.observed[x, y]), self.text_at(x, y))
+
+    def with_arrays(self, types: np.ndarray | None = None, observed: np.ndarray | None = None) -> "TileGrid":
+        return TileGrid(
+            self.types if types is None else types,
+            self.observed if observed is None else observed,
+            self.label_index,
+            self.labels,
+        )
+
+    def unravel(self, flat_index: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Convert flat indexes, like the ones from `np.flatnonzero`, to (x, y) arrays."""
+        return np.unravel_index(flat_index, self.types.shape)
@@ -0,0 +1,179 @@
+"""
+Keyframed LED and sound effects, played without blocking the controller.
+
+An `Animation` holds a track of (seconds, value) keyframes for each
+`EffectTrack` it drives. The controller `play`s animations on a `Timeline`
+and `tick`s it with every sensor packet, which applies the keyframes that
+came due. Animations can overlap: the newest one playing on a track drives
+it, and the older ones pick it back up at their next keyframe once it ends.
+An animation that ends or is cancelled applies its `end` values to the tracks
+nothing else is driving, e.g. to put the bot's own LED colors back.
+
+Run with:
+    python -m dash_turtle_game.timeline
+"""
+from dataclasses import dataclass, field
+from enum import Enum, auto
+import random
+from typing import Any, Callable
+
+from .constants import BotSounds
+
+CELEBRATION = 'celebration'
+CRASH_FLASH = 'crash_flash'
+# How long the celebration's LEDs cycle, and how often they change color.
+CELEBRATE_LED_SEC = 6.0
+CELEBRATE_LED_STEP_SEC = 0.2
+# When the celebration cheers, after the trumpet.
+CELEBRATE_YIPPEE_SEC = 3.0
+CRASH_FLASH_STEP_SEC = 0.15
+
+RGB = tuple[float, float, float]
+
+
+class EffectTrack(Enum):
+    # (left ear, front, right ear) colors, or None for the bot's own colors.
+    LEDS = auto()
+    # A `BotSounds`.
+    SOUND = auto()
+
+
+Keyframe = tuple[float, Any]
+
+
+@dataclass(frozen=True)
+class Animation:
+    name: str
+    duration: float
+    # Keyframes of each track in time order, in seconds from the start.
+    tracks: dict[EffectTrack, tuple[Keyframe, ...]]
+    # Applied to the tracks nothing else drives once it ends.
+    end: dict[EffectTrack, Any] = field(default_factory=dict)
+
+
+@dataclass
+class _Playing:
+    animation: Animation
+    start: float
+    # Index of the next keyframe of each track.
+    next_keyframe: dict[EffectTrack, int]
+
+
+class Timeline:
+    """
+    Plays animations by calling `apply(track, value)` for their keyframes.
+
+    Keyframes that came due between two ticks are skipped, except for the
+    latest of each track.
+    """
+
+    def __init__(self, apply: Callable[[EffectTrack, Any], None]) -> None:
+        self.apply = apply
+        # Oldest first.
+        self._playing: list[_Playing] = []
+
+    def play(self, animation: Animation, now: float):
+        """Start `animation`, restarting it if it's already playing."""
+        self._playing = [playing for playing in self._playing if playing.animation.name != animation.name]
+        self._playing.append(_Playing(animation, now, {track: 0 for track in animation.tracks}))
+        self.tick(now)
+
+    def is_playing(self, name: str | None = None) -> bool:
+        return any(name is None or playing.animation.name == name for playing in self._playing)
+
+    def cancel(self, name: str | None = None):
+        """Stop the animation called `name`, or all of them."""
+        for playing in list(self._playing):
+            if name is None or playing.animation.name == name:
+                self._end(playing)
+
+    def tick(self, now: float):
+        for playing in list(self._playing):
+            elapsed = now - playing.start
+            for track, keyframes in playing.animation.tracks.items():
+                index = playing.next_keyframe[track]
+                due = index
+                while due < len(keyframes) and keyframes[due][0] <= elapsed:
+                    due += 1
+                if due > index and self._driver(track) is playing:
+                    self.apply(track, keyframes[due - 1][1])
+                playing.next_keyframe[track] = due
+            if elapsed >= playing.animation.duration:
+                self._end(playing)
+
+    def _end(self, playing: _Playing):
+        self._playing.remove(playing)
+        for track, value in playing.animation.end.items():
+            if self._driver(track) is None:
+                self.apply(track, value)
+
+    def _driver(self, track: EffectTrack) -> _Playing | None:
+        """The newest animation playing on `track`."""
+        for playing in reversed(self._playing):
+            if track in playing.animation.tracks:
+                return playing
+        return None
+
+
+def celebration(rng: random.Random) -> Animation:
+    """Random LED colors with a trumpet and a cheer, to play while the bot spins."""
+    def random_color() -> RGB:
+        return rng.random(), rng.random(), rng.random()
+
+    steps = round(CELEBRATE_LED_SEC / CELEBRATE_LED_STEP_SEC)
+    colors = tuple((i * CELEBRATE_LED_STEP_SEC, (random_color(), random_color(), random_color()))
+                   for i in range(steps))
+    return Animation(
+        CELEBRATION,
+        CELEBRATE_LED_SEC,
+        {
+            EffectTrack.LEDS: colors,
+            EffectTrack.SOUND: ((0.0, BotSounds.TRUMPET), (CELEBRATE_YIPPEE_SEC, BotSounds.YIPPEE)),
+        },
+        end={EffectTrack.LEDS: None},
+    )
+
+
+def crash_flash() -> Animation:
+    """Flash the LEDs red twice."""
+    red = ((1.0, 0.0, 0.0),) * 3
+    off = ((0.0, 0.0, 0.0),) * 3
+    values = (red, off, red, off)
+    return Animation(
+        CRASH_FLASH,
+        len(values) * CRASH_FLASH_STEP_SEC,
+        {EffectTrack.LEDS: tuple((i * CRASH_FLASH_STEP_SEC, value) for i, value in enumerate(values))},
+        end={EffectTrack.LEDS: None},
+    )
+
+
+if __name__ == "__main__":
+    import time
+
+    def show(track: EffectTrack, value: Any):
+        if track == EffectTrack.SOUND:
+            print(f"  {now:4.1f}s {value.name}")
+        elif value is None or value[0] in ((1.0, 0.0, 0.0), (0.0, 0.0, 0.0)):
+            print(f"  {now:4.1f}s LEDs {value[1] if value else 'own colors'}")
+
+    # Packets every 0.1s. A crash flash plays over the celebration, and a
+    # command cancels what's left of it.
+    timeline = Timeline(show)
+    now = 0.0
+    timeline.play(celebration(random.Random(0)), now)
+    for tick in range(1, 50):
+        now = tick * 0.1
+        if tick == 20:
+            timeline.play(crash_flash(), now)
+        if tick == 40:
+            print(f"  {now:4.1f}s cancel")
+            timeline.cancel()
+        timeline.tick(now)
+
+    timeline = Timeline(lambda track, value: None)
+    timeline.play(celebration(random.Random(0)), 0.0)
+    timeline.play(crash_flash(), 0.0)
+    start = time.perf_counter()
+    for tick in range(10000):
+        timeline.tick(tick * 1e-4)
+    print(f"{(time.perf_counter() - start) * 100:.2f}us per tick with 2 animations playing")
@@ -0,0 +1,134 @@
+"""
+End to end latency tracing for commands.
+
+Each command is stamped with `time.perf_counter` where it enters the game
+(the MQTT client, the game window, or the card queue), then as it moves
+through the controller:
+
+    source      the button press, card tap, or queued card being started
+    dequeue     the controller takes it off its channel
+    decision    the controller decides to act on it
+    stage_pose  the turn or forward command is staged on the bot, when the
+                outbound queue is flushed with the next sensor packet
+    moving      the first sensor packet with the bot no longer idle
+
+The time between consecutive stages is recorded per stage pair, so the
+histograms show where the time goes.
+"""
+from dataclasses import dataclass, field
+import json
+from pathlib import Path
+import threading
+import time
+from typing import Hashable
+
+from .constants import CmdEvent
+from .stats import LatencyRecorder, percentile
+
+STAGES = ('source', 'dequeue', 'decision', 'stage_pose', 'moving')
+# Upper bucket edges for exported histograms, in ms.
+HISTOGRAM_BUCKETS_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+# Give up on seeing a sent command move the bot after this long.
+MOVE_TIMEOUT_SEC = 5.0
+
+
+@dataclass
+class CommandTrace:
+    cmd: CmdEvent
+    source: str
+    stamps: dict[str, float] = field(default_factory=dict)
+
+    def mark(self, stage: str, stamp: float | None = None):
+        self.stamps[stage] = time.perf_counter() if stamp is None else stamp
+
+
+class LatencyTracer:
+    """
+    Collects per stage latency for traced commands.
+
+    Each controller sends at most one motion command at a time, so the trace
+    of the last one sent is held until a sensor packet shows the bot moving.
+    With several bots, each controller passes its own `key`.
+    """
+
+    def __init__(self) -> None:
+        self._recorders: dict[str, LatencyRecorder] = {}
+        self._lock = threading.Lock()
+        # Written by whichever thread stages the command on the bot.
+        self._awaiting_lock = threading.Lock()
+        self._awaiting_move: dict[Hashable, CommandTrace] = {}
+
+    def begin(self, cmd: CmdEvent, source: str, stamp: float | None = None) -> CommandTrace:
+        trace = CommandTrace(cmd, source)
+        trace.mark('source', stamp)
+        return trace
+
+    def _recorder(self, name: str) -> LatencyRecorder:
+        with self._lock:
+            if name not in self._recorders:
+                self._recorders[name] = LatencyRecorder()
+            return self._recorders[name]
+
+    def finish(self, trace: CommandTrace):
+        """Record the time between each pair of consecutive stages reached."""
+        reached = [stage for stage in STAGES if stage in trace.stamps]
+        for start, end in zip(reached, reached[1:]):
+            self._recorder(f"{start}->{end}").record(trace.stamps[end] - trace.stamps[start])
+        if len(reached) > 1:
+            total = trace.stamps[reached[-1]] - trace.stamps[reached[0]]
+            self._recorder(f"{trace.source} {reached[0]}->{reached[-1]}").record(total)
+
+    def staged(self, trace: CommandTrace, key: Hashable = None):
+        """Mark `trace` as staged on the bot, to be finished once it moves."""
+        trace.mark('stage_pose')
+        with self._awaiting_lock:
+            previous = self._awaiting_move.get(key)
+            self._awaiting_move[key] = trace
+        if previous is not None:
+            self.finish(previous)
+
+    def on_sensors(self, is_idle: bool, stamp: float, key: Hashable = None):
+        """Finish the command waiting to move, given a sensor packet received at `stamp`."""
+        with self._awaiting_lock:
+            trace = self._awaiting_move.get(key)
+            # A packet from before the command was staged can't show it.
+            if trace is None or stamp < trace.stamps['stage_pose']:
+                return
+            if not is_idle:
+                trace.mark('moving', stamp)
+            elif stamp - trace.stamps['stage_pose'] < MOVE_TIMEOUT_SEC:
+                return
+            del self._awaiting_move[key]
+        self.finish(trace)
+
+    def summaries(self) -> list[str]:
+        with self._lock:
+            recorders = sorted(self._recorders.items())
+        return [recorder.summary(name) for name, recorder in recorders]
+
+    def export(self, path: str | Path):
+        """Write per stage percentiles and histograms as JSON."""
+        with self._lock:
+            recorders = sorted(self._recorders.items())
+        report = {}
+        for name, recorder in recorders:
+            samples_ms = [sample * 1e3 for sample in recorder.samples()]
+            counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+            for sample in samples_ms:
+                bucket = next((i for i, edge in enumerate(HISTOGRAM_BUCKETS_MS) if sample <= edge), -1)
+                counts[bucket] += 1
+            report[name] = {
+                'count': len(samples_ms),
+                'p50_ms': percentile(samples_ms, 50),
+                'p95_ms': percentile(samples_ms, 95),
+                'p99_ms': percentile(samples_ms, 99),
+                'max_ms': max(samples_ms, default=0.0),
+                'histogram': {
+                    'bucket_le_ms': list(HISTOGRAM_BUCKETS_MS) + ['inf'],
+                    'counts': counts,
+                },
+            }
+        Path(path).write_text(json.dumps(report, indent=2))
+
+
+TRACER = LatencyTracer()
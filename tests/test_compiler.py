@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from dash_turtle_game.card_gui import CardType
+from dash_turtle_game.compiler import ProgramError, compile_cards, validate
+from dash_turtle_game.constants import TileType, TurtlePose
+from dash_turtle_game.tile_grid import TileGrid
+
+L, R, U, REPEAT = CardType.LEFT, CardType.RIGHT, CardType.UP, CardType.REPEAT
+
+
+def moves(cards):
+    program = compile_cards(cards)
+    return [program.op(i) for i in range(len(program))], [program.source(i) for i in range(len(program))]
+
+
+def grid(size, blocked=()):
+    types = np.full(size, TileType.EMPTY.value, dtype=np.uint8)
+    for x, y in blocked:
+        types[x, y] = TileType.BLOCKED.value
+    return TileGrid(types, np.zeros(size, dtype=bool), np.zeros(size, dtype=np.int32), ['A'])
+
+
+@pytest.mark.parametrize('cards, ops', [
+    ([L, L, L], [R]),
+    ([R, R, R], [L]),
+    ([L, R], []),
+    ([L, L, L, L], []),
+    ([R, R], [R, R]),
+    ([L, L], [L, L]),
+    ([U, L, R, U], [U, U]),
+])
+def test_turns_fold(cards, ops):
+    assert moves(cards)[0] == ops
+
+
+def test_folded_turns_point_at_their_first_card():
+    assert moves([U, L, L, L, U]) == ([U, R, U], [0, 1, 4])
+    assert moves([U, R, R]) == ([U, R, R], [0, 1, 1])
+
+
+def test_repeat_runs_the_card_before():
+    assert moves([U, REPEAT, REPEAT]) == ([U, U, U], [0, 1, 2])
+    # Three LEFTs fold into a RIGHT.
+    assert moves([L, REPEAT, REPEAT]) == ([R], [0])
+    assert moves([U, L, REPEAT, U]) == ([U, L, L, U], [0, 1, 1, 3])
+
+
+def test_repeat_needs_a_card_before_it():
+    with pytest.raises(ProgramError) as err:
+        compile_cards([REPEAT, U])
+    assert err.value.card == 0
+
+
+def test_valid_program_passes():
+    validate(compile_cards([U, U, L, U]), grid((4, 4)), TurtlePose(0.5, 0.5, 0))
+
+
+def test_off_map_points_at_the_card():
+    # Facing +x from (0, 0): the fourth UP leaves a 4 wide map.
+    with pytest.raises(ProgramError) as err:
+        validate(compile_cards([U, U, U, U]), grid((4, 4)), TurtlePose(0.5, 0.5, 0))
+    assert err.value.card == 3
+
+
+def test_off_map_after_folding_points_at_the_original_card():
+    cards = [L, R, U, U, REPEAT, REPEAT]
+    with pytest.raises(ProgramError) as err:
+        validate(compile_cards(cards), grid((4, 4)), TurtlePose(0.5, 0.5, 0))
+    assert err.value.card == 5
+
+
+def test_blocked_tile_points_at_the_card():
+    cards = [L, U, R, U, U]
+    # LEFT faces +y, so the bot goes to (0, 1), then (1, 1) and (2, 1).
+    with pytest.raises(ProgramError) as err:
+        validate(compile_cards(cards), grid((4, 4), blocked=[(2, 1)]), TurtlePose(0.5, 0.5, 0))
+    assert err.value.card == 4
+    assert 'blocked' in str(err.value)
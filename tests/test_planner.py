@@ -0,0 +1,113 @@
+import heapq
+import math
+import random
+
+import pytest
+
+from dash_turtle_game.card_gui import CardType
+from dash_turtle_game.constants import TurtlePose
+from dash_turtle_game.planner import HEADING_STEPS, CardPlanner
+
+TURN_COST = 1.0
+MOVE_COST = 2.5
+
+
+def reference_cost(size, blocked, start, goal):
+    """Dijkstra over (x, y, heading) from `start` to the goal tile at any heading."""
+    dist = {start: 0.0}
+    queue = [(0.0, start)]
+    while queue:
+        cost, (x, y, heading) = heapq.heappop(queue)
+        if cost > dist[(x, y, heading)]:
+            continue
+        if (x, y) == goal:
+            return cost
+        dx, dy = HEADING_STEPS[heading]
+        nexts = [((x, y, (heading + 1) % 4), TURN_COST), ((x, y, (heading - 1) % 4), TURN_COST)]
+        if 0 <= x + dx < size[0] and 0 <= y + dy < size[1] and (x + dx, y + dy) not in blocked:
+            nexts.append(((x + dx, y + dy, heading), MOVE_COST))
+        for state, step in nexts:
+            if cost + step < dist.get(state, math.inf):
+                dist[state] = cost + step
+                heapq.heappush(queue, (cost + step, state))
+    return math.inf
+
+
+def drive(cards, size, blocked, start):
+    """Tile the cards end on and what they cost, checking every move is legal."""
+    x, y, heading = start
+    cost = 0.0
+    for card in cards:
+        if card == CardType.UP:
+            dx, dy = HEADING_STEPS[heading]
+            x, y = x + dx, y + dy
+            assert 0 <= x < size[0] and 0 <= y < size[1]
+            assert (x, y) not in blocked
+            cost += MOVE_COST
+        else:
+            heading = (heading + (1 if card == CardType.LEFT else -1)) % 4
+            cost += TURN_COST
+    return (x, y), cost
+
+
+def check_plan(planner, size, blocked, start, goal):
+    cards = planner.plan(TurtlePose(start[0] + 0.5, start[1] + 0.5, start[2] * 90))
+    expected = reference_cost(size, blocked, start, goal)
+    if expected == math.inf:
+        assert cards is None
+        return
+    assert cards is not None
+    end, cost = drive(cards, size, blocked, start)
+    assert end == goal
+    assert cost == pytest.approx(expected)
+
+
+def random_free_state(rng, size, blocked):
+    while True:
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        if (x, y) not in blocked:
+            return x, y, rng.randrange(4)
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_matches_reference(seed):
+    rng = random.Random(seed)
+    size = (rng.randint(3, 9), rng.randint(3, 9))
+    blocked = {(x, y) for x in range(size[0]) for y in range(size[1]) if rng.random() < 0.25}
+    goal = random_free_state(rng, size, blocked)[:2]
+    start = random_free_state(rng, size, blocked)
+    planner = CardPlanner(size, goal, TURN_COST, MOVE_COST, blocked)
+    check_plan(planner, size, blocked, start, goal)
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_replan_after_set_tile_matches_reference(seed):
+    rng = random.Random(seed)
+    size = (rng.randint(4, 9), rng.randint(4, 9))
+    blocked = {(x, y) for x in range(size[0]) for y in range(size[1]) if rng.random() < 0.15}
+    goal = random_free_state(rng, size, blocked)[:2]
+    start = random_free_state(rng, size, blocked)
+    planner = CardPlanner(size, goal, TURN_COST, MOVE_COST, blocked)
+    check_plan(planner, size, blocked, start, goal)
+
+    # Tiles found blocked or free on the way, then a plan from somewhere else.
+    for _ in range(3):
+        for _ in range(rng.randint(1, 4)):
+            tile = (rng.randrange(size[0]), rng.randrange(size[1]))
+            if tile == goal:
+                continue
+            is_blocked = rng.random() < 0.7
+            planner.set_tile(*tile, is_blocked)
+            if is_blocked:
+                blocked.add(tile)
+            else:
+                blocked.discard(tile)
+        start = random_free_state(rng, size, blocked)
+        check_plan(planner, size, blocked, start, goal)
+
+
+def test_unreachable_goal():
+    planner = CardPlanner((3, 3), (2, 2), TURN_COST, MOVE_COST, [(1, 2), (2, 1)])
+    assert planner.plan(TurtlePose(0.5, 0.5, 0)) is None
+    planner.set_tile(2, 1, False)
+    assert planner.plan(TurtlePose(0.5, 0.5, 0)) is not None
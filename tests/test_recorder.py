@@ -0,0 +1,68 @@
+from dataclasses import replace
+
+import pytest
+
+from dash_turtle_game.card_gui import CardType
+from dash_turtle_game.constants import CmdEvent, SensorData
+from dash_turtle_game.recorder import SOURCES, RecordKind, SessionRecorder, StageKind, read_log, to_sensors
+from dash_turtle_game.sim_game import SIM_SETTINGS
+
+
+@pytest.mark.parametrize('sim_bot', [True, False])
+def test_round_trip(tmp_path, sim_bot):
+    path = tmp_path / 'session.bin'
+    conf = replace(SIM_SETTINGS, START_TILE=(1, 2), START_THETA=270, GOAL_TILE=(4, 0), MAP_SIZE_TILES=(6, 5))
+    sensors = SensorData(12.5, -3.25, 87.5, True, 10.0, 70.0)
+
+    recorder = SessionRecorder()
+    recorder.open(path, sim_bot)
+    recorder.session(conf, [CardType.UP, CardType.LEFT], bot=1)
+    recorder.sensors(sensors, recorder._start + 1.5, bot=1)
+    recorder.command(CmdEvent.RIGHT, 'mqtt', recorder._start + 2.0, bot=1)
+    recorder.stage(StageKind.POSE, 1.0, 2.0, 90.0, 4.0, bot=1)
+    recorder.stage(StageKind.STOP)
+    recorder.close()
+
+    log = read_log(path)
+    assert log.sim_bot == sim_bot
+    records = log.records
+    assert [RecordKind(kind) for kind in records['kind']] == [
+        RecordKind.SESSION, RecordKind.MAP, RecordKind.CARD, RecordKind.CARD,
+        RecordKind.SENSORS, RecordKind.COMMAND, RecordKind.STAGE, RecordKind.STAGE,
+    ]
+    assert records['bot'].tolist() == [1] * 7 + [0]
+
+    session, map_record, card_up, card_left, packet, command, pose, stop = records
+    assert session['values'].tolist() == [1, 2, 270, 4, 0]
+    assert map_record['values'].tolist()[:3] == pytest.approx([6, 5, conf.TILE_SIZE_CM])
+    assert [CardType(card['code']) for card in (card_up, card_left)] == [CardType.UP, CardType.LEFT]
+
+    assert to_sensors(packet) == sensors
+    assert packet['stamp'] == pytest.approx(1.5)
+
+    assert CmdEvent(command['code']) == CmdEvent.RIGHT
+    assert SOURCES[int(command['values'][0])] == 'mqtt'
+    assert command['stamp'] == pytest.approx(2.0)
+
+    assert StageKind(pose['code']) == StageKind.POSE
+    assert pose['values'].tolist() == [1.0, 2.0, 90.0, 4.0, 0.0]
+    assert StageKind(stop['code']) == StageKind.STOP
+    assert stop['stamp'] >= pose['stamp'] >= 0
+
+
+def test_record_cut_short_is_ignored(tmp_path):
+    path = tmp_path / 'session.bin'
+    recorder = SessionRecorder()
+    recorder.open(path, True)
+    recorder.stage(StageKind.STOP)
+    recorder.stage(StageKind.STOP)
+    recorder.close()
+    with open(path, 'r+b') as file:
+        file.truncate(path.stat().st_size - 3)
+    assert len(read_log(path).records) == 1
+
+
+def test_closed_recorder_writes_nothing(tmp_path):
+    recorder = SessionRecorder()
+    recorder.stage(StageKind.STOP)
+    assert not recorder.active